@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import openai
+from dotenv import load_dotenv
+
+import conversation
+import request_policy
+
+load_dotenv()
+
+
+# prompts from a JSONL file: one JSON string, or object with "prompt" (and optionally "id"), per line
+def load_prompts(path):
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+# {"id": ..., "prompt": ...} items; plain strings get their position as id
+def normalize(items):
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            yield {"id": str(i), "prompt": item}
+        else:
+            yield {"id": str(item.get("id", i)), "prompt": item["prompt"]}
+
+
+# ids of the prompts answered in a results file, which are skipped when the batch is run again
+def completed_ids(path):
+    if not path or not os.path.exists(path):
+        return set()
+    ids = set()
+    with open(path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # e.g. the last line, cut short by a crash
+                continue
+            if result.get("error") is None:
+                ids.add(result["id"])
+    return ids
+
+
+# the results file, opened for appending after a last line a crash may have cut short
+def open_output(path):
+    out = open(path, "a+")
+    if out.tell() > 0:
+        out.seek(out.tell() - 1)
+        if out.read(1) != "\n":
+            out.write("\n")
+    return out
+
+
+# How many prompts may be in flight: halved when the API answers 429, and raised again by one after as
+# many successes as the current limit, up to max_limit. After a 429, no prompt is admitted until its
+# retry-after has passed. The 429s of the prompts in flight are reported through throttle() as they
+# happen, also those request_policy retries.
+class AdmissionControl():
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self.active = 0
+        self.paused_until = 0
+        self.successes = 0
+        self.throttled = 0
+        self.changed = asyncio.Event()
+
+    async def acquire(self):
+        while True:
+            wait = self.paused_until - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            elif self.active < self.limit:
+                self.active += 1
+                return
+            else:
+                await self.changed.wait()
+
+    def release(self, succeeded=True):
+        self.active -= 1
+        if succeeded:
+            self.successes += 1
+            if self.limit < self.max_limit and self.successes >= self.limit:
+                self.limit += 1
+                self.successes = 0
+        self.notify()
+
+    def throttle(self, wait):
+        now = time.monotonic()
+        self.throttled += 1
+        self.successes = 0
+        # the 429s of one burst count as one
+        if now >= self.paused_until:
+            self.limit = max(self.min_limit, self.limit // 2)
+        self.paused_until = max(self.paused_until, now + wait)
+        self.notify()
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+# Runs many independent prompts through one assistant, each in a conversation of its own, with at most
+# `concurrency` of them in flight (see AdmissionControl). Prompts that hit a rate limit are tried again
+# after the retry-after, up to max_attempts. Results are yielded as they finish, and appended to the
+# `output` JSONL file, from which a batch that was interrupted resumes: prompts answered there are skipped.
+class BatchRunner():
+    def __init__(self, asst_id, concurrency=None, max_attempts=None, output=None):
+        self.asst_id = asst_id
+        self.control = AdmissionControl(concurrency or int(os.environ.get("BATCH_CONCURRENCY", 16)))
+        self.max_attempts = max_attempts or int(os.environ.get("BATCH_MAX_ATTEMPTS", 5))
+        self.output = output
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.retries = 0
+
+    async def run(self, items):
+        done = completed_ids(self.output)
+        results = asyncio.Queue()
+        tasks = set()
+        out = open_output(self.output) if self.output else None
+
+        async def produce():
+            try:
+                for item in normalize(items):
+                    if item["id"] in done:
+                        self.skipped += 1
+                        continue
+                    await self.control.acquire()
+                    task = asyncio.create_task(self.process(item, results, out))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                while tasks:
+                    await asyncio.wait(set(tasks))
+            finally:
+                # e.g. after an invalid prompt, raised below
+                results.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (result := await results.get()) is not None:
+                yield result
+            await producer
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+            if out:
+                out.close()
+
+    # the first attempt is admitted by the caller
+    async def process(self, item, results, out):
+        # the prompt's own task (and the run tasks it starts) report their 429s to the admission control
+        request_policy.throttle_listener.set(self.control.throttle)
+        start = time.monotonic()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                thread_id, reply = await self.turn(item["prompt"])
+            except Exception as e:
+                # its 429s were reported to the admission control as they happened, see throttle
+                self.control.release(succeeded=False)
+                if isinstance(e, openai.RateLimitError) and attempt < self.max_attempts:
+                    self.retries += 1
+                    await self.control.acquire()
+                    continue
+                self.failed += 1
+                result = {"id": item["id"], "thread_id": None, "reply": None, "error": repr(e)}
+            else:
+                self.control.release()
+                self.completed += 1
+                result = {"id": item["id"], "thread_id": thread_id, "reply": reply, "error": None}
+            break
+        result.update(attempts=attempt, latency=round(time.monotonic() - start, 3))
+        if out:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+        results.put_nowait(result)
+
+    async def turn(self, prompt):
+        user_proxy = await conversation.start_conversation(self.asst_id)
+        user_proxy.send_user_message(prompt)
+        reply = await user_proxy.get_assistant_message()
+        return user_proxy.mediator.asst_proxy.thread_id, reply
+
+    def stats(self):
+        return {"completed": self.completed, "failed": self.failed, "skipped": self.skipped, "retries": self.retries,
+                "throttled": self.control.throttled, "concurrency": self.control.limit}
+
+
+async def main(prompts_path, output, asst_id):
+    runner = BatchRunner(asst_id, output=output)
+    async for result in runner.run(load_prompts(prompts_path)):
+        print(f"{result['id']}: {result['error'] or result['reply']}")
+    print(runner.stats())
+
+
+if __name__ == '__main__':
+    #   python batch_runner.py prompts.jsonl results.jsonl [assistant id]
+    asyncio.run(main(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else os.environ["ASSISTANT_ID"]))
@@ -0,0 +1,55 @@
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.fake_assistants import FakeAssistants, start_server
+
+# Runs simulated conversations concurrently against the fake backend, once through the blocking
+# openai_access client and once through the pooled async client, and reports conversations/sec.
+#   python -m benchmarks.access_throughput [conversations] [latency]
+
+conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+backend = FakeAssistants(script=[("queued", 0), ("in_progress", 0.2), ("completed", None)],
+                         latency=float(sys.argv[2]) if len(sys.argv) > 2 else 0.05)
+server, base_url = start_server(backend)
+os.environ["OPENAI_BASE_URL"] = base_url
+os.environ["OPENAI_API_KEY"] = "fake"
+
+import openai_access
+import openai_async_access
+
+
+async def sync_conversation():
+    thread = openai_access.create_thread()
+    openai_access.create_message(thread.id, "user", "hello")
+    run = openai_access.create_run(thread_id=thread.id, assistant_id="asst_fake")
+    while openai_access.get_run(thread_id=thread.id, run_id=run.id).status != "completed":
+        await asyncio.sleep(0.1)
+    return openai_access.get_thread_messages(thread_id=thread.id).data[0]
+
+
+async def async_conversation():
+    thread = await openai_async_access.create_thread()
+    await openai_async_access.create_message(thread.id, "user", "hello")
+    run = await openai_async_access.create_run(thread_id=thread.id, assistant_id="asst_fake")
+    while (await openai_async_access.get_run(thread_id=thread.id, run_id=run.id)).status != "completed":
+        await asyncio.sleep(0.1)
+    return (await openai_async_access.get_thread_messages(thread_id=thread.id)).data[0]
+
+
+async def measure(name, conversation):
+    start = time.perf_counter()
+    await asyncio.gather(*[conversation() for i in range(conversations)])
+    elapsed = time.perf_counter() - start
+    print(f"{name:6} {conversations} conversations in {elapsed:6.2f} s  ({conversations / elapsed:7.1f} conv/s)")
+
+
+async def run():
+    await measure("sync", sync_conversation)
+    await measure("async", async_conversation)
+    await openai_async_access.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
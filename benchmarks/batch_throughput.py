@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import database
+from benchmarks.fake_assistants import fetch_stats, start_server_process
+
+# Completions/minute of batch_runner.BatchRunner against the fake backend throttled to 60 requests/sec
+# (429 with retry-after beyond that): every prompt started at once without retries, against the admission
+# control with retries. Then a batch interrupted halfway is run again from its results file, and only the
+# prompts left are sent.
+#   python -m benchmarks.batch_throughput [prompts]
+
+prompts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+
+async def measure(batch_runner, conversation, **kwargs):
+    conversation.thread_pool = conversation.warm_threads.WarmThreadPool()
+    runner = batch_runner.BatchRunner("asst_fake", **kwargs)
+    start = time.perf_counter()
+    async for result in runner.run(f"prompt {i}" for i in range(prompts)):
+        pass
+    elapsed = time.perf_counter() - start
+    await conversation.thread_pool.close()
+    return runner.stats(), elapsed
+
+
+async def interrupted(batch_runner, conversation, output, stop_after=None):
+    conversation.thread_pool = conversation.warm_threads.WarmThreadPool()
+    runner = batch_runner.BatchRunner("asst_fake", concurrency=16, output=output)
+    async for result in runner.run(f"prompt {i}" for i in range(prompts)):
+        if stop_after and runner.completed >= stop_after:
+            break
+    await conversation.thread_pool.close()
+    return runner.stats()
+
+
+def server(rate_limit=60):
+    process, base_url = start_server_process(rate_limit=rate_limit, burst=20, latency=0.01)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    return process, base_url
+
+
+# not at import time: the backend runs in a spawned process, which imports this module again
+def run():
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ.setdefault("MEDIATOR_TYPE", "basic")
+    import batch_runner
+    import conversation
+    database.create_tables()
+
+    for name, kwargs in [("all at once", {"concurrency": prompts, "max_attempts": 1}),
+                         ("admission control", {"concurrency": 16})]:
+        process, base_url = server()
+        stats, elapsed = asyncio.run(measure(batch_runner, conversation, **kwargs))
+        print(f"{name:18} {stats['completed'] / elapsed * 60:7.0f} completions/min  completed {stats['completed']:4}"
+              f"  failed {stats['failed']:4}  retried {stats['retries']:4}  429s {fetch_stats(base_url)['throttled']:5}")
+        process.terminate()
+
+    process, base_url = server()
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "results.jsonl")
+        first = asyncio.run(interrupted(batch_runner, conversation, output, stop_after=prompts // 2))
+        second = asyncio.run(interrupted(batch_runner, conversation, output))
+        with open(output) as file:
+            answered = {line.split('"id": "')[1].split('"')[0] for line in file if '"error": null' in line}
+    print(f"interrupted after {first['completed']}, resumed: skipped {second['skipped']}, completed "
+          f"{second['completed']}; {len(answered)} of {prompts} prompts answered")
+    process.terminate()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+
+os.environ["DB_WRITE_BEHIND"] = "false"
+# every row is written, see benchmarks.event_compaction for compaction
+os.environ["DB_COMPACT_EVENTS"] = "false"
+
+import database
+import db_access
+import db_writer
+from models import XRunDetail
+
+# Compares rows/sec and the time a turn spends on the caller's thread when each audit row is committed
+# on its own (store without write-behind) and when rows go through the write-behind queue.
+#   python -m benchmarks.db_writes [turns] [rows per turn]
+
+turns = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+rows_per_turn = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+
+def turn(i):
+    start = time.perf_counter()
+    for j in range(rows_per_turn):
+        db_access.store(XRunDetail(run_id=f"run_bench_{i}", type="check_run_status", output="in_progress"))
+    return time.perf_counter() - start
+
+
+def measure(name):
+    start = time.perf_counter()
+    per_turn = sorted(turn(i) for i in range(turns))
+    db_access.flush()
+    elapsed = time.perf_counter() - start
+    print(f"{name:14} {turns * rows_per_turn / elapsed:9.0f} rows/s   per-turn caller time "
+          f"p50 {per_turn[len(per_turn) // 2] * 1000:7.2f} ms  max {per_turn[-1] * 1000:7.2f} ms")
+
+
+if __name__ == '__main__':
+    database.create_tables()
+    measure("row by row")
+    db_access.writer = db_writer.start(db_access.engine)
+    measure("write-behind")
@@ -0,0 +1,91 @@
+import asyncio
+import sys
+import time
+
+import events
+
+# Cost of publishing with the per-conversation event bus:
+# - per event, as the number of subscribed conversations grows (each event only reaches its own
+#   conversation's subscribers), against one process-wide topic whose listeners each filter the events of
+#   their conversation, as with the pypubsub topics before; and when nobody subscribes to the topic;
+# - on the publisher's path with a slow subscriber (5 ms per event), handled inline as before and through
+#   the subscriber's queue, with the events dropped when the queue is full or the publisher held back.
+#   python -m benchmarks.event_bus [events]
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+def publish_cost(buses, topic="executedTool"):
+    async def measure():
+        start = time.perf_counter()
+        for i in range(count):
+            bus = buses[i % len(buses)]
+            if bus.has_subscribers(topic):
+                await bus.publish(events.ExecutedTool("thread", "run", "call", "get_stock_price", {}, 100.0))
+        elapsed = time.perf_counter() - start
+        for bus in buses:
+            await bus.join()
+        return elapsed / count
+    return measure()
+
+
+# every listener sees every event, and keeps its own conversation's
+def global_topic_cost(conversations):
+    received = []
+    listeners = [lambda event, thread_id=f"thread_{i}": event.thread_id == thread_id and received.append(event)
+                 for i in range(conversations)]
+    start = time.perf_counter()
+    for i in range(count // 10):
+        event = events.ExecutedTool(f"thread_{i % conversations}", "run", "call", "get_stock_price", {}, 100.0)
+        for listener in listeners:
+            listener(event)
+    return (time.perf_counter() - start) / (count // 10)
+
+
+async def slow_handler(event):
+    await asyncio.sleep(0.005)
+
+
+async def burst(subscribe, burst_size=200):
+    bus = events.EventBus()
+    subscription = subscribe(bus)
+    start = time.perf_counter()
+    for i in range(burst_size):
+        await bus.publish(events.TextDelta("thread", "run", "x"))
+    publisher = time.perf_counter() - start
+    if subscription:
+        await subscription.join()
+    return publisher, time.perf_counter() - start, subscription.stats() if subscription else None
+
+
+async def inline(burst_size=200):
+    start = time.perf_counter()
+    for i in range(burst_size):
+        await slow_handler(events.TextDelta("thread", "run", "x"))
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, None
+
+
+async def run():
+    for conversations in [1, 100, 10000]:
+        buses = [events.EventBus() for _ in range(conversations)]
+        for bus in buses:
+            bus.subscribe("executedTool", lambda event: None)
+        cost = await publish_cost(buses)
+        print(f"{conversations:6} conversations   {cost * 1e6:8.2f} us/event   "
+              f"one global topic {global_topic_cost(conversations) * 1e6:8.2f} us/event")
+    cost = await publish_cost([events.EventBus()])
+    print(f"{'no subscribers':21}   {cost * 1e6:8.2f} us/event")
+
+    print()
+    for name, measure in [("inline", inline()),
+                          ("queue, drop_oldest", burst(lambda bus: bus.subscribe("textDelta", slow_handler))),
+                          ("queue, wait", burst(lambda bus: bus.subscribe("textDelta", slow_handler, maxsize=50,
+                                                                          overflow="wait")))]:
+        publisher, total, stats = await measure
+        detail = f"delivered {stats['delivered']:3}  dropped {stats['dropped']:3}" if stats else ""
+        print(f"{name:20} publisher {publisher * 1000:7.1f} ms   all delivered {total * 1000:7.1f} ms   {detail}")
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
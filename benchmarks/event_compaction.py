@@ -0,0 +1,63 @@
+import sys
+import time
+import uuid
+
+import database
+import db_access
+import history
+from models import XRunDetail
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+# Stores the audit events of runs that are polled many times (a 'running' heartbeat per poll), with every
+# event written as a row and with repeated events compacted, and compares the rows written, the events
+# stored per second (including the writes) and the time to load the runs' steps for the history page.
+#   python -m benchmarks.event_compaction [runs] [polls per run]
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+polls = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+
+def events(run_id):
+    yield XRunDetail(run_id=run_id, type="submit_user_msg", input="hello")
+    yield XRunDetail(run_id=run_id, type="state_change", output="started")
+    for i in range(polls):
+        yield XRunDetail(run_id=run_id, type="check_run_status", output="queued" if i < 2 else "in_progress")
+        yield XRunDetail(run_id=run_id, type="state_change", output="running")
+    yield XRunDetail(run_id=run_id, type="check_run_status", output="completed")
+    yield XRunDetail(run_id=run_id, type="retrieve_asst_msg", output="reply")
+    yield XRunDetail(run_id=run_id, type="state_change", output="completed")
+
+
+def count_rows():
+    with Session(db_access.engine) as session:
+        return session.scalar(select(func.count(XRunDetail.id)))
+
+
+def measure(name, compact):
+    db_access.compact = compact
+    run_ids = [f"run_bench_{uuid.uuid4().hex[:16]}" for _ in range(runs)]
+    rows = count_rows()
+    stored = 0
+    start = time.perf_counter()
+    for run_id in run_ids:
+        for event in events(run_id):
+            db_access.store(event)
+            stored += 1
+        db_access.release(run_id)
+    db_access.flush()
+    elapsed = time.perf_counter() - start
+    rows = count_rows() - rows
+
+    start = time.perf_counter()
+    steps = db_access.get_steps_as_df(run_ids)
+    loaded = time.perf_counter() - start
+    assert len(history.expand_steps(steps)) == stored
+    print(f"{name:10} {stored:7} events -> {rows:7} rows  {stored / elapsed:8.0f} events/s"
+          f"  steps load {loaded * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    database.migrate()
+    measure("every row", False)
+    measure("compacted", True)
@@ -0,0 +1,370 @@
+import inspect
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from urllib.request import urlopen
+
+# A local stand-in for the part of the Assistants API used by openai_access.
+# Runs follow a status script: a list of (status, value) steps, where value is the time spent in a pending
+# status, or the list of tool calls to request for 'requires_action'.
+# Runs created (or continued) with "stream": true are reported as server-sent events, including the
+# reply's text deltas; other runs advance with time and are polled.
+# Recorded traces (see benchmarks.traces), each a script and its reply, are replayed one per run, in turn.
+# latency is either the seconds added to every API call, or a dict of seconds per endpoint
+# (create_thread, create_message, list_messages, create_run, get_run, submit_tool_outputs, cancel_run).
+
+PLAIN_SCRIPT = [("queued", 0.05), ("in_progress", 0.5), ("completed", None)]
+TOOL_SCRIPT = [("queued", 0.05), ("in_progress", 0.2),
+               ("requires_action", [{"name": "buy_or_sell", "arguments": {"symbol": "MSFT", "price": "1"}}]),
+               ("in_progress", 0.3), ("completed", None)]
+MULTI_TOOL_SCRIPT = [("queued", 0.05), ("in_progress", 0.2),
+                     ("requires_action", [{"name": "get_stock_price", "arguments": {"symbol": "MSFT"}},
+                                          {"name": "get_stock_price", "arguments": {"symbol": "AAPL"}}]),
+                     ("in_progress", 0.2),
+                     ("requires_action", [{"name": "buy_or_sell", "arguments": {"symbol": "MSFT", "price": "1"}},
+                                          {"name": "buy_or_sell", "arguments": {"symbol": "AAPL", "price": "1"}}]),
+                     ("in_progress", 0.3), ("completed", None)]
+
+
+def new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+# stands in for yfinance, see local_functions.set_price_provider
+class FakePriceProvider():
+    def __init__(self, latency=0.05, price=100.0):
+        self.latency = latency
+        self.price = price
+
+    def get_price(self, symbol):
+        time.sleep(self.latency)
+        return self.price
+
+    def get_prices(self, symbols):
+        time.sleep(self.latency)
+        return {symbol: self.price for symbol in symbols}
+
+
+class FakeRun():
+    def __init__(self, thread_id, assistant_id, script, reply):
+        self.id = new_id("run")
+        self.thread_id = thread_id
+        self.assistant_id = assistant_id
+        self.created_at = int(time.time())
+        self.script = list(script)
+        self.step = 0
+        self.step_started = time.monotonic()
+        self.tool_calls = None
+        self.completed_at = None  # monotonic time at which the run reached 'completed'
+        self.message_id = new_id("msg")
+        self.reply = reply
+        self.streamed = False
+
+    @property
+    def status(self):
+        return self.script[self.step][0]
+
+    def advance(self, on_completed):
+        while not self.streamed:
+            status, value = self.script[self.step]
+            if status in ["queued", "in_progress"] and time.monotonic() - self.step_started >= value:
+                self.next_step(on_completed, self.step_started + value)
+            else:
+                return
+
+    def next_step(self, on_completed, at=None):
+        self.step += 1
+        self.step_started = at or time.monotonic()
+        status, value = self.script[self.step]
+        if status == "requires_action":
+            self.tool_calls = [{"id": new_id("call"), "type": "function",
+                                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}}
+                               for call in value]
+        elif status == "completed":
+            self.completed_at = self.step_started
+            on_completed(self)
+
+    def to_dict(self):
+        required_action = None
+        if self.status == "requires_action":
+            required_action = {"type": "submit_tool_outputs", "submit_tool_outputs": {"tool_calls": self.tool_calls}}
+        return {"id": self.id, "object": "thread.run", "created_at": self.created_at, "thread_id": self.thread_id,
+                "assistant_id": self.assistant_id, "status": self.status, "required_action": required_action,
+                "last_error": None, "expires_at": None, "started_at": None, "cancelled_at": None, "failed_at": None,
+                "completed_at": int(time.time()) if self.completed_at else None, "model": "fake",
+                "instructions": "", "tools": [], "file_ids": [], "metadata": {}}
+
+
+class FakeAssistants():
+    # rate_limit: requests/sec (with bursts of up to `burst`) beyond which requests are answered with 429
+    # faults: endpoint (or "*") -> (probability, status) of failing a request before it is processed, with
+    # that status, or with status "reset" by closing the connection without a response
+    def __init__(self, script=None, reply="Hello from the fake assistant", latency=0, traces=None, rate_limit=None,
+                 burst=None, faults=None):
+        self.script = script or PLAIN_SCRIPT
+        self.reply = reply
+        self.latency = latency
+        self.traces = traces or []
+        self.replayed = 0
+        self.threads = {}
+        self.runs = {}
+        self.calls = 0
+        self.calls_by_endpoint = {}
+        self.rate_limit = rate_limit
+        self.burst = burst or rate_limit
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.throttled = 0
+        self.faults = faults or {}
+        self.injected = 0
+        self.lock = threading.Lock()
+
+    def latency_for(self, endpoint):
+        if isinstance(self.latency, dict):
+            return self.latency.get(endpoint, 0)
+        return self.latency
+
+    def new_run(self, thread_id, assistant_id):
+        if not self.traces:
+            return FakeRun(thread_id, assistant_id, self.script, self.reply)
+        trace = self.traces[self.replayed % len(self.traces)]
+        self.replayed += 1
+        return FakeRun(thread_id, assistant_id, trace["script"], trace.get("reply") or self.reply)
+
+    def stats(self):
+        return {"calls": self.calls, "calls_by_endpoint": dict(self.calls_by_endpoint), "throttled": self.throttled,
+                "injected": self.injected}
+
+    # the status of the fault injected into a request to the endpoint, or None
+    def fault(self, endpoint):
+        probability, status = self.faults.get(endpoint) or self.faults.get("*") or (0, None)
+        if random.random() >= probability:
+            return None
+        with self.lock:
+            self.injected += 1
+        return status
+
+    # None when the request is let through, otherwise the seconds until it would be (token bucket)
+    def throttle(self):
+        if not self.rate_limit:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate_limit)
+            self.refilled_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            self.throttled += 1
+            return (1 - self.tokens) / self.rate_limit
+
+    def message(self, thread_id, role, content, run_id=None, id=None):
+        return {"id": id or new_id("msg"), "object": "thread.message", "created_at": int(time.time()),
+                "thread_id": thread_id, "role": role, "run_id": run_id, "assistant_id": None, "file_ids": [],
+                "metadata": {}, "content": [{"type": "text", "text": {"value": content, "annotations": []}}]}
+
+    def on_completed(self, run):
+        self.threads[run.thread_id].append(self.message(run.thread_id, "assistant", run.reply, run.id,
+                                                        run.message_id))
+
+    # events from the run's current step until it pauses for tool outputs or ends
+    def stream_run(self, run):
+        run.streamed = True
+        while True:
+            status, value = run.script[run.step]
+            yield f"thread.run.{status}", run.to_dict()
+            if status not in ["queued", "in_progress"]:
+                return
+            if run.script[run.step + 1][0] == "completed":
+                words = run.reply.split(" ")
+                for i, word in enumerate(words):
+                    time.sleep(value / len(words))
+                    delta = {"index": 0, "type": "text", "text": {"value": word if i == 0 else " " + word}}
+                    yield "thread.message.delta", {"id": run.message_id, "object": "thread.message.delta",
+                                                   "delta": {"content": [delta]}}
+            else:
+                time.sleep(value)
+            with self.lock:
+                run.next_step(self.on_completed)
+
+    @staticmethod
+    def endpoint(method, path):
+        parts = path.strip("/").split("/")[1:]
+        if parts == ["threads"]:
+            return "create_thread"
+        if parts[0] == "assistants":
+            return "get_assistant"
+        if parts[2:] == ["messages"]:
+            return "create_message" if method == "POST" else "list_messages"
+        if parts[2:] == ["runs"]:
+            return "create_run"
+        if parts[4:] == ["submit_tool_outputs"]:
+            return "submit_tool_outputs"
+        if parts[4:] == ["cancel"]:
+            return "cancel_run"
+        return "get_run"
+
+    def handle(self, method, path, query, body):
+        parts = path.strip("/").split("/")[1:]  # drop the version prefix
+        with self.lock:
+            endpoint = self.endpoint(method, path)
+            self.calls += 1
+            self.calls_by_endpoint[endpoint] = self.calls_by_endpoint.get(endpoint, 0) + 1
+            if parts[0] == "assistants":
+                return {"id": parts[1], "object": "assistant", "created_at": int(time.time()), "name": "Fake assistant",
+                        "description": None, "model": "gpt-4-1106-preview", "instructions": None, "tools": [],
+                        "file_ids": [], "metadata": {}}
+            if parts == ["threads"]:
+                thread_id = new_id("thread")
+                self.threads[thread_id] = []
+                return {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}}
+            thread_id = parts[1]
+            if parts[2:] == ["messages"] and method == "POST":
+                msg = self.message(thread_id, body["role"], body["content"])
+                self.threads[thread_id].append(msg)
+                return msg
+            if parts[2:] == ["messages"]:
+                return self.list_messages(thread_id, query)
+            if parts[2:] == ["runs"]:
+                run = self.new_run(thread_id, body["assistant_id"])
+                self.runs[run.id] = run
+                if body.get("stream"):
+                    return self.stream_run(run)
+                return run.to_dict()
+            run = self.runs[parts[3]]
+            if parts[4:] == ["submit_tool_outputs"]:
+                run.next_step(self.on_completed)
+                if body.get("stream"):
+                    return self.stream_run(run)
+            elif parts[4:] == ["cancel"]:
+                run.script[run.step] = ("cancelled", None)
+            run.advance(self.on_completed)
+            return run.to_dict()
+
+    def list_messages(self, thread_id, query):
+        messages = list(self.threads[thread_id])
+        if query.get("order", ["desc"])[0] == "desc":
+            messages.reverse()
+        if "after" in query:
+            ids = [msg["id"] for msg in messages]
+            messages = messages[ids.index(query["after"][0]) + 1:]
+        limit = int(query.get("limit", [20])[0])
+        data = messages[:limit]
+        return {"object": "list", "data": data, "first_id": data[0]["id"] if data else None,
+                "last_id": data[-1]["id"] if data else None, "has_more": len(messages) > limit}
+
+
+def make_handler(backend):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.respond("GET")
+
+        def do_POST(self):
+            self.respond("POST")
+
+        def respond(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if url.path.endswith("/_stats"):
+                result = backend.stats()
+            elif (wait := backend.throttle()) is not None:
+                return self.respond_throttled(wait)
+            elif (status := backend.fault(backend.endpoint(method, url.path))) is not None:
+                return self.respond_fault(status)
+            else:
+                time.sleep(backend.latency_for(backend.endpoint(method, url.path)))
+                result = backend.handle(method, url.path, parse_qs(url.query), body)
+            if inspect.isgenerator(result):
+                return self.respond_with_events(result)
+            payload = json.dumps(result).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def respond_fault(self, status):
+            if status == "reset":
+                self.close_connection = True
+                return
+            if status == 429:
+                return self.respond_throttled(0.05)
+            payload = json.dumps({"error": {"message": "Injected fault", "type": "server_error", "code": None,
+                                            "param": None}}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def respond_throttled(self, wait):
+            payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests",
+                                            "code": "rate_limit_exceeded", "param": None}}).encode()
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("retry-after-ms", str(int(wait * 1000) + 1))
+            self.send_header("retry-after", str(wait))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def respond_with_events(self, events):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for event, data in events:
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class FakeServer(ThreadingHTTPServer):
+    request_queue_size = 1024
+    daemon_threads = True
+
+    # clients going away mid-response (e.g. cancelled turns) are not errors of the backend
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def start_server(backend, port=0):
+    server = FakeServer(("127.0.0.1", port), make_handler(backend))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def serve(connection, kwargs):
+    server, base_url = start_server(FakeAssistants(**kwargs))
+    connection.send(base_url)
+    server.serve_forever()
+
+
+# the fake backend in its own process, so that its CPU time is not counted as the client's;
+# returns the process and the base url, see fetch_stats for its call counts
+def start_server_process(**kwargs):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child, kwargs), daemon=True)
+    process.start()
+    return process, parent.recv()
+
+
+def fetch_stats(base_url):
+    with urlopen(f"{base_url}/_stats") as response:
+        return json.loads(response.read())
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import time
+
+import database
+from benchmarks.fake_assistants import start_server_process
+from run_engine import LatencyStats
+
+# Turns against the fake backend injecting faults (500s and dropped connections on reads, 429s and 503s on
+# writes), without retries and with request_policy's retries; then the request rate under a 600 requests/min
+# limit; and how long turns one after the other take to fail once polling fails for good, retrying every
+# poll, and with the circuit breaker open.
+#   python -m benchmarks.faults [turns]
+
+turns = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+faults = {"get_run": (0.1, 500), "list_messages": (0.05, "reset"), "create_message": (0.1, 429),
+          "create_run": (0.02, 503)}
+
+
+async def turn(conversation):
+    start = time.perf_counter()
+    try:
+        user_proxy = await conversation.start_conversation("asst_fake")
+        user_proxy.send_user_message("hello")
+        await user_proxy.get_assistant_message()
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, type(e).__name__
+
+
+async def measure(conversation, request_policy, policy, count=None, sequential=False):
+    request_policy.policy = policy
+    conversation.thread_pool = conversation.warm_threads.WarmThreadPool(size=0)
+    count = count or turns
+    start = time.perf_counter()
+    if sequential:
+        results = [await turn(conversation) for _ in range(count)]
+    else:
+        results = await asyncio.gather(*[turn(conversation) for _ in range(count)])
+    elapsed = time.perf_counter() - start
+    stats = LatencyStats(count)
+    errors = {}
+    for duration, error in results:
+        stats.record(duration)
+        if error:
+            errors[error] = errors.get(error, 0) + 1
+    return stats.summary(), errors, elapsed, count
+
+
+def report(name, summary, errors, elapsed, count, policy):
+    failed = sum(errors.values())
+    stats = policy.stats()
+    print(f"{name:20} ok {count - failed:4}/{count}  p50 {summary['p50'] * 1000:7.1f} ms  {elapsed:6.2f} s  "
+          f"retried {stats['retried']:4}  failed calls {stats['failed']:3}  circuit opens {stats['circuit_opens']}"
+          f"  rejected {stats['rejected']:4}  {errors}")
+
+
+# not at import time: the backends run in spawned processes, which import this module again
+def run():
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ.setdefault("MEDIATOR_TYPE", "basic")
+    import conversation
+    import request_policy
+    database.create_tables()
+
+    process, base_url = start_server_process(latency=0.01, faults=faults)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    for name, policy in [("no retries", request_policy.RequestPolicy(max_retries=0)),
+                         ("request_policy", request_policy.RequestPolicy(backoff_base=0.05, backoff_max=1))]:
+        report(name, *asyncio.run(measure(conversation, request_policy, policy)), policy)
+    process.terminate()
+
+    process, base_url = start_server_process(latency=0.01)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    policy = request_policy.RequestPolicy(rpm=600)
+    summary, errors, elapsed, count = asyncio.run(measure(conversation, request_policy, policy))
+    # the calls, as the further pages of a message list are fetched within the call
+    print(f"{'600 requests/min':20} {policy.stats()['calls'] / elapsed * 60:7.0f} calls/min, "
+          f"{policy.stats()['limited']} waited for the limit")
+    process.terminate()
+
+    process, base_url = start_server_process(latency=0.01, faults={"get_run": (1, 503)})
+    os.environ["OPENAI_BASE_URL"] = base_url
+    for name, policy in [("polls fail, retried", request_policy.RequestPolicy(backoff_base=0.05, backoff_max=1,
+                                                                             breaker_threshold=10 ** 9)),
+                         ("polls fail, breaker", request_policy.RequestPolicy(backoff_base=0.05, backoff_max=1,
+                                                                             breaker_cooldown=60))]:
+        report(name, *asyncio.run(measure(conversation, request_policy, policy, turns // 5, sequential=True)), policy)
+    process.terminate()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+
+from benchmarks.fake_assistants import FakeAssistants, start_server
+
+# Time-to-first-token with and without streaming, against the fake backend, which streams the reply
+# word by word while the run is in progress.
+#   python -m benchmarks.first_token [turns]
+
+turns = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+backend = FakeAssistants(script=[("queued", 0.05), ("in_progress", 1.0), ("completed", None)],
+                         reply=" ".join(["token"] * 50))
+server, base_url = start_server(backend)
+os.environ["OPENAI_BASE_URL"] = base_url
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ.setdefault("MEDIATOR_TYPE", "basic")
+
+import conversation
+import database
+import run_engine
+
+
+async def measure(name, streaming):
+    conversation.streaming = streaming
+    run_engine.first_token_stats.samples.clear()
+    user_proxy = await conversation.start_conversation("asst_fake")
+    for i in range(turns):
+        user_proxy.send_user_message(f"message {i}")
+        async for delta in user_proxy.stream_assistant_message():
+            pass
+    summary = run_engine.first_token_stats.summary()
+    print(f"{name:10} time to first token p50 {summary['p50'] * 1000:7.1f} ms  p99 {summary['p99'] * 1000:7.1f} ms")
+
+
+async def run():
+    database.create_tables()
+    await measure("polling", False)
+    await measure("streaming", True)
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
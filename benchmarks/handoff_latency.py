@@ -0,0 +1,49 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+import conversation
+from run_engine import LatencyStats
+
+# Microbenchmark of the mediator -> UserProxy hand-off: the time between the reply being set and the
+# caller of get_assistant_message resuming, for the former 1-second polling loop and the reply future.
+#   python -m benchmarks.handoff_latency [samples]
+
+samples = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+
+class ReplyMediator():
+    async def set_user_message(self, msg):
+        await asyncio.sleep(random.uniform(0, 1))
+        self.replied_at = time.perf_counter()
+        self.user_proxy.set_asst_message(f"reply to {msg}")
+
+
+async def polling_wait(user_proxy):
+    while user_proxy.asst_message == None:
+        await asyncio.sleep(1)
+    return user_proxy.asst_message
+
+
+async def measure(name, wait):
+    mediator = ReplyMediator()
+    user_proxy = mediator.user_proxy = conversation.UserProxy(mediator)
+    stats = LatencyStats()
+    for i in range(samples):
+        user_proxy.send_user_message(f"message {i}")
+        await wait(user_proxy)
+        stats.record(time.perf_counter() - mediator.replied_at)
+    print(f"{name:8} hand-off p50 {stats.percentile(50) * 1000:8.3f} ms  p99 {stats.percentile(99) * 1000:8.3f} ms")
+
+
+async def run():
+    await measure("polling", polling_wait)
+    await measure("future", lambda user_proxy: user_proxy.get_assistant_message())
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
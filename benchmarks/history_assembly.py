@@ -0,0 +1,66 @@
+import sys
+import time
+
+import pandas as pd
+
+from history import build_history
+
+# Assembles the history hierarchy from a synthetic run_details table, with the former per-row query
+# loop and with history.build_history. The loop is quadratic, so it only runs on a small sample.
+#   python -m benchmarks.history_assembly [run_details rows] [rows for the loop]
+
+rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+loop_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+
+
+def synthetic(rows):
+    runs, conversations = rows // 100, rows // 1000
+    now = pd.Timestamp.now()
+    conversations_df = pd.DataFrame({"id": range(conversations), "thread_id": [f"thread_{c}" for c in range(conversations)],
+                                     "default_assistant_id": "asst", "created_at": now})
+    runs_df = pd.DataFrame({"id": range(runs), "run_id": [f"run_{r}" for r in range(runs)],
+                            "thread_id": [f"thread_{r % conversations}" for r in range(runs)],
+                            "assistant_id": "asst", "created_at": now})
+    steps_df = pd.DataFrame({"id": range(rows), "run_id": [f"run_{i % runs}" for i in range(rows)],
+                             "type": "check_run_status", "tool": None, "input": None, "output": "in_progress",
+                             "created_at": now, "seen_count": None})
+    return conversations_df, runs_df, steps_df
+
+
+def query_loop(all_conversations, all_runs, all_steps):
+    all_runs = all_runs.copy()
+    all_conversations = all_conversations.copy()
+    df_r_steps, df_r_num_calls = [], []
+    for index, row in all_runs.iterrows():
+        run_steps = all_steps.query(f"run_id == '{row['run_id']}'")
+        df_r_steps.append(run_steps)
+        df_r_num_calls.append(len(run_steps))
+    all_runs["steps"] = df_r_steps
+    all_runs["num_events"] = df_r_num_calls
+
+    df_c_runs, df_c_num_runs, df_c_num_events = [], [], []
+    for index, row in all_conversations.iterrows():
+        c_runs = all_runs.query(f"thread_id == '{row['thread_id']}'")
+        df_c_runs.append(c_runs)
+        df_c_num_runs.append(len(c_runs))
+        df_c_num_events.append(c_runs["num_events"].sum())
+    all_conversations["runs"] = df_c_runs
+    all_conversations["num_runs"] = df_c_num_runs
+    all_conversations["num_events"] = df_c_num_events
+    return all_conversations
+
+
+def timed(name, rows, assemble):
+    data = synthetic(rows)
+    start = time.perf_counter()
+    result = assemble(*data)
+    print(f"{name:14} {rows:>9} run_details rows  {time.perf_counter() - start:8.2f} s")
+    return result
+
+
+if __name__ == '__main__':
+    expected = timed("query loop", loop_rows, query_loop)
+    actual = timed("build_history", loop_rows, build_history)
+    assert list(expected["num_events"]) == list(actual["num_events"])
+    assert list(expected["num_runs"]) == list(actual["num_runs"])
+    timed("build_history", rows, build_history)
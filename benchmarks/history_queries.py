@@ -0,0 +1,73 @@
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import insert, select
+
+import database
+
+# Times the history lookups (by thread_id and run_id) on a synthetic database with 1M run_details rows,
+# on the default engine without secondary indexes and after migrate() on the tuned engine.
+#   python -m benchmarks.history_queries [run_details rows]
+
+rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+conversations = rows // 1000
+runs = rows // 100
+
+
+def populate(engine):
+    now = datetime.datetime.now()
+    database.metadata.create_all(bind=engine, tables=[database.conversations, database.conversation_runs,
+                                                      database.run_details], checkfirst=True)
+    with engine.begin() as conn:
+        for table in [database.conversations, database.conversation_runs, database.run_details]:
+            for index in table.indexes:
+                index.drop(bind=conn, checkfirst=True)
+        conn.execute(insert(database.conversations), [
+            {"thread_id": f"thread_{c}", "default_assistant_id": "asst", "created_at": now}
+            for c in range(conversations)])
+        conn.execute(insert(database.conversation_runs), [
+            {"run_id": f"run_{r}", "thread_id": f"thread_{r % conversations}", "assistant_id": "asst",
+             "created_at": now} for r in range(runs)])
+        for start in range(0, rows, 100_000):
+            conn.execute(insert(database.run_details), [
+                {"run_id": f"run_{i % runs}", "type": "check_run_status", "output": "in_progress",
+                 "created_at": now + datetime.timedelta(seconds=i)} for i in range(start, min(rows, start + 100_000))])
+
+
+def measure(name, engine, lookups=200):
+    run_ids = [f"run_{random.randrange(runs)}" for i in range(lookups)]
+    thread_ids = [f"thread_{random.randrange(conversations)}" for i in range(lookups)]
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for run_id in run_ids:
+            conn.execute(select(database.run_details).where(database.run_details.c.run_id == run_id)
+                         .order_by(database.run_details.c.created_at)).all()
+        by_run = (time.perf_counter() - start) / lookups
+        start = time.perf_counter()
+        for thread_id in thread_ids:
+            conn.execute(select(database.conversation_runs)
+                         .where(database.conversation_runs.c.thread_id == thread_id)).all()
+            conn.execute(select(database.conversations)
+                         .where(database.conversations.c.thread_id == thread_id)).all()
+        by_thread = (time.perf_counter() - start) / lookups
+    print(f"{name:22} steps by run_id {by_run * 1000:8.3f} ms   conversation by thread_id {by_thread * 1000:8.3f} ms")
+
+
+if __name__ == '__main__':
+    path = os.path.join(tempfile.mkdtemp(), "history.db")
+    url = f"sqlite:///{path}"
+    plain = database.create_db_engine(url, tuned=False)
+    populate(plain)
+    print(f"{rows} run_details rows, {runs} runs, {conversations} conversations")
+    measure("no indexes", plain, lookups=20)
+    plain.dispose()
+
+    tuned = database.create_db_engine(url)
+    start = time.perf_counter()
+    database.migrate(tuned)
+    print(f"migrate() on the existing database took {time.perf_counter() - start:.1f} s")
+    measure("indexes + tuned engine", tuned)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fake_assistants import start_server_process
+
+# Load test for ConversationHost: conversations arrive at a steady rate, each sends one message and waits
+# for the reply, against the fake backend (in its own process, so that its CPU time is not the event
+# loop's). Reports conversations/sec and event-loop lag, then, in a second pass under tracemalloc (which
+# slows everything down, so it is not timed), the memory retained per hosted conversation.
+# Passes when the p99 event-loop lag stays under max lag; exits with status 1 otherwise. With arrivals/sec 0,
+# the conversations all start at once, and the lag measures how long the burst keeps the loop busy.
+#   python -m benchmarks.host_load [conversations] [arrivals/sec] [max lag ms]
+
+conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+rate = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+max_lag = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+memory_sample = min(conversations, 100)
+
+process, base_url = start_server_process(script=[("queued", 0.05), ("in_progress", 0.5), ("completed", None)],
+                                         latency=0.01)
+os.environ["OPENAI_BASE_URL"] = base_url
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ.setdefault("MEDIATOR_TYPE", "basic")
+
+import database
+from conversation_host import ConversationHost
+
+
+async def measure_lag(lags, interval=0.05):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def converse(host, events):
+    thread_id = await host.start_conversation("asst_fake")
+    subscription = host.subscribe(thread_id, "retrievedMessage", events.append)
+    reply = await host.send(thread_id, "hello")
+    await subscription.join()
+    return reply
+
+
+# starts `count` conversations, `rate` per second (all at once without a rate), and waits until the host
+# is done with them, i.e. until their runs' rows are written as well
+async def host_conversations(host, events, count, rate=None):
+    start = time.perf_counter()
+    tasks = []
+    for i in range(count):
+        if rate:
+            await asyncio.sleep(max(0, start + i / rate - time.perf_counter()))
+        tasks.append(asyncio.create_task(converse(host, events)))
+    await asyncio.gather(*tasks)
+    while host.stats()["busy"]:
+        await asyncio.sleep(0.01)
+
+
+async def run():
+    database.create_tables()
+    host = ConversationHost()
+    lags, events = [], []
+    lag_task = asyncio.create_task(measure_lag(lags))
+    start = time.perf_counter()
+    await host_conversations(host, events, conversations, rate)
+    elapsed = time.perf_counter() - start
+    lag_task.cancel()
+    arrivals = f"{rate:g} arriving per second" if rate else "all at once"
+    print(f"{conversations} conversations in {elapsed:.2f} s ({conversations / elapsed:.1f} conv/s, {arrivals}), "
+          f"{len(events)} routed events  {host.stats()}")
+    await host.close()
+
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)]
+    passed = p99 <= max_lag
+    print(f"event-loop lag p50 {lags[len(lags) // 2] * 1000:.1f} ms  p99 {p99 * 1000:.1f} ms  "
+          f"max {lags[-1] * 1000:.1f} ms: {'PASS' if passed else 'FAIL'} (p99 under {max_lag * 1000:g} ms)")
+
+    host = ConversationHost()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    await host_conversations(host, [], memory_sample)
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"retained memory per conversation {retained / memory_sample / 1024:.1f} KiB "
+          f"({memory_sample} conversations hosted)")
+    await host.close()
+    return passed
+
+
+if __name__ == '__main__':
+    sys.exit(0 if asyncio.run(run()) else 1)
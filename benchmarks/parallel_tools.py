@@ -0,0 +1,67 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+import conversation
+from function_tools import local_functions
+
+# Executes one requires_action step with simulated slow tools (blocking and async), one call after
+# the other as before and through UserProxy.execute_tools, and compares the step's wall time.
+#   python -m benchmarks.parallel_tools [calls]
+
+calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+
+def slow_quote(symbol, delay):
+    time.sleep(delay)
+    return 100.0
+
+
+async def slow_async_quote(symbol, delay):
+    await asyncio.sleep(delay)
+    return 100.0
+
+
+local_functions.runtime.register("slow_quote", slow_quote, kind="io")
+local_functions.runtime.register("slow_async_quote", slow_async_quote)
+
+
+class StepMediator():
+    async def tools_executed(self, results):
+        self.results = results
+
+
+def make_step():
+    tool_calls = []
+    for i in range(calls):
+        name = "slow_quote" if i % 2 == 0 else "slow_async_quote"
+        arguments = json.dumps({"symbol": f"SYM{i}", "delay": 0.2 + 0.1 * i})
+        tool_calls.append(SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name=name, arguments=arguments)))
+    return SimpleNamespace(id="run_bench", required_action=SimpleNamespace(
+        submit_tool_outputs=SimpleNamespace(tool_calls=tool_calls)))
+
+
+async def run():
+    step = make_step()
+    slowest = 0.2 + 0.1 * (calls - 1)
+    total = sum(0.2 + 0.1 * i for i in range(calls))
+
+    start = time.perf_counter()
+    for tool_call in step.required_action.submit_tool_outputs.tool_calls:
+        await local_functions.execute_function_async(tool_call.function.name, json.loads(tool_call.function.arguments))
+    print(f"one by one  {time.perf_counter() - start:5.2f} s  (sum of tools {total:.2f} s)")
+
+    mediator = StepMediator()
+    start = time.perf_counter()
+    await conversation.UserProxy(mediator).execute_tools(step)
+    print(f"concurrent  {time.perf_counter() - start:5.2f} s  (slowest tool {slowest:.2f} s)")
+    assert [result["call_id"] for result in mediator.results] == [f"call_{i}" for i in range(calls)]
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.fake_assistants import FakeAssistants, start_server
+
+# Measures the time between a run reaching 'completed' on the (fake) backend and the reply being handed to
+# the caller, for the fixed 1-second polling loop and for the adaptive run engine.
+#   python -m benchmarks.run_latency [turns]
+
+backend = FakeAssistants()
+server, base_url = start_server(backend)
+os.environ["OPENAI_BASE_URL"] = base_url
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ.setdefault("MEDIATOR_TYPE", "basic")
+
+import conversation
+import database
+from run_engine import LatencyStats, RunEngine
+
+
+async def measure(engine, turns):
+    stats = LatencyStats()
+    user_proxy = await conversation.start_conversation("asst_fake")
+    asst_proxy = user_proxy.mediator.asst_proxy
+    asst_proxy.engine = engine
+    calls = backend.calls
+    for i in range(turns):
+        user_proxy.send_user_message(f"message {i}")
+        await user_proxy.get_assistant_message()
+        delivered_at = time.monotonic()
+        stats.record(delivered_at - backend.runs[asst_proxy.run_id].completed_at)
+    return stats, (backend.calls - calls) / turns
+
+
+async def run(turns):
+    database.create_tables()
+    for name, engine in [("fixed 1s polling", RunEngine(min_interval=1, max_interval=1, jitter=0)),
+                         ("adaptive engine", RunEngine())]:
+        stats, calls = await measure(engine, turns)
+        summary = stats.summary()
+        print(f"{name:20} completed->delivery p50 {summary['p50'] * 1000:7.1f} ms"
+              f"  p99 {summary['p99'] * 1000:7.1f} ms  api calls/turn {calls:.1f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
@@ -0,0 +1,53 @@
+import asyncio
+import os
+import sys
+import time
+
+import database
+from benchmarks.fake_assistants import start_server_process
+from run_workers import ShardedConversations
+
+# Turns/sec of many concurrent conversations served by 1, 2, 4 ... worker processes (sharded by thread_id,
+# with the run state in the shared sqlite store), against the fake backend in its own process.
+# Throughput grows with the workers as long as there are cores left for them.
+#   python -m benchmarks.sharded_throughput [conversations] [turns] [max workers]
+
+conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+turns = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+
+async def converse(sharded, thread_id):
+    for i in range(turns):
+        await sharded.send(thread_id, f"message {i}")
+
+
+async def measure(workers):
+    sharded = ShardedConversations(workers)
+    sharded.start()
+    thread_ids = await asyncio.gather(*[sharded.start_conversation("asst_fake") for _ in range(conversations)])
+    start = time.perf_counter()
+    await asyncio.gather(*[converse(sharded, thread_id) for thread_id in thread_ids])
+    elapsed = time.perf_counter() - start
+    await sharded.close()
+    return conversations * turns / elapsed
+
+
+# not at import time: the workers are spawned and import this module again
+def run():
+    process, base_url = start_server_process(script=[("queued", 0.05), ("in_progress", 0.2), ("completed", None)],
+                                             latency=0.01)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ["RUN_STORE"] = "sqlite"
+    os.environ.setdefault("MEDIATOR_TYPE", "basic")
+    database.migrate()
+    workers = 1
+    while workers <= max(max_workers, 1):
+        rate = asyncio.run(measure(workers))
+        print(f"{workers:3} workers  {rate:7.1f} turns/s")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,49 @@
+import asyncio
+import os
+import sys
+import time
+
+import database
+from benchmarks.fake_assistants import start_server_process
+from run_engine import LatencyStats
+
+# Latency of conversation.start_conversation against the fake backend (150 ms per thread create), with
+# the threads created on start and taken from a warm pool, for conversations started every 100 ms.
+#   python -m benchmarks.startup [conversations] [pool size]
+
+conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+pool_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+
+async def start_all(conversation, size):
+    conversation.thread_pool = conversation.warm_threads.WarmThreadPool(size=size)
+    await conversation.thread_pool.warm_up()
+    stats = LatencyStats(conversations)
+    for i in range(conversations):
+        start = time.perf_counter()
+        await conversation.start_conversation("asst_fake")
+        stats.record(time.perf_counter() - start)
+        await asyncio.sleep(0.1)
+    pool = conversation.thread_pool.stats()
+    await conversation.thread_pool.close()
+    return stats.summary(), pool
+
+
+# not at import time: the backend runs in a spawned process, which imports this module again
+def run():
+    process, base_url = start_server_process(latency={"create_thread": 0.15})
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ.setdefault("MEDIATOR_TYPE", "basic")
+    import conversation
+    database.create_tables()
+
+    for name, size in [("no pool", 0), (f"pool of {pool_size}", pool_size)]:
+        summary, pool = asyncio.run(start_all(conversation, size))
+        print(f"{name:12} start_conversation p50 {summary['p50'] * 1000:7.1f} ms  p99 {summary['p99'] * 1000:7.1f} ms"
+              f"  pool hits {pool['hits']:3}  misses {pool['misses']:3}")
+    process.terminate()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,151 @@
+import asyncio
+import gc
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+
+from transitions.extensions.asyncio import AsyncMachine, AsyncState
+
+import conversation
+import events
+from models import XRunDetail
+
+# Creation cost and events/sec of MediatorStateMachine with the shared compiled transition table, against
+# the per-instance transitions AsyncMachine it replaced (rebuilt below as LegacyMediator). Both mediators
+# are first driven through the same events and must go through the same states and callbacks.
+# Audit rows are not written, so that only the state machines are measured.
+#   python -m benchmarks.state_machine [conversations]
+
+conversation.store = lambda data: None
+
+
+def legacy_init(self):
+    self._subscriptions = []
+    self.events = events.EventBus()
+    self.initiate_state_machine()
+
+
+def initiate_state_machine(self):
+    states = [
+        AsyncState(name='new'),
+        AsyncState(name='ready'),
+        AsyncState(name='started', on_enter=self.on_started),
+        AsyncState(name='requires_action'),
+        AsyncState(name='tools_executed', on_enter=self.on_tools_executed),
+        AsyncState(name='tool_outputs_submitted'),
+        AsyncState(name='completed', on_enter=self.on_completed),
+        AsyncState(name='running'),
+        AsyncState(name='failed', on_enter=self.on_failed)
+    ]
+    machine = AsyncMachine(model=self, states=states, initial='new', send_event=False)
+    for trigger, source, dest, after in conversation.mediator_transitions:
+        machine.add_transition(trigger, source, dest, after=after)
+    for state in states:
+        state.on_enter.append(self._store_state)
+    self.machine = machine
+
+
+# the mediator's methods, without the triggers bound from the compiled table, which the machine adds instead
+LegacyMediator = type("LegacyMediator", (), {
+    **{name: value for name, value in vars(conversation.MediatorStateMachine).items()
+       if name not in conversation.mediator_table.triggers and not name.startswith("__")},
+    "__init__": legacy_init,
+    "initiate_state_machine": initiate_state_machine
+})
+
+
+class StubProxy():
+    def __init__(self, log):
+        self.log = log
+        self.thread_id = "thread_1"
+        self.run_id = "run_1"
+        self.published = []
+
+    async def start_processing(self, user_message):
+        self.log.append("start_processing")
+
+    async def execute_tools(self, run_status):
+        self.log.append("execute_tools")
+
+    async def submit_tool_outputs(self, results):
+        self.log.append("submit_tool_outputs")
+
+    def set_asst_message(self, message):
+        self.log.append("set_asst_message")
+
+    def set_error(self, error):
+        self.log.append("set_error")
+
+    def save_state(self, state):
+        pass
+
+
+def make(mediator_cls, log=None):
+    mediator = mediator_cls()
+    proxy = StubProxy(log if log is not None else [])
+    mediator.set_proxies(proxy, proxy)
+    # events are delivered on their own, so they are compared apart from the calls
+    mediator.events.subscribe("error", lambda evt: proxy.published.append(evt.topic))
+    return mediator
+
+
+# one turn with a tool step, then one that fails
+async def drive(mediator):
+    await mediator.set_user_message("hello")
+    await mediator.started("hello")
+    await mediator.heartbeat("queued")
+    await mediator.action_required("run")
+    await mediator.tools_executed([])
+    await mediator.tool_outputs_submitted([])
+    await mediator.heartbeat("in_progress")
+    await mediator.assistant_message_retrieved("reply")
+    await mediator.set_user_message("again")
+    await mediator.started("again")
+    await mediator.run_failed(Exception("failed"))
+    return 11
+
+
+async def trace(mediator_cls):
+    log = []
+    mediator = make(mediator_cls, log)
+    states = []
+    conversation.store = lambda data: states.append(data.output)
+    await drive(mediator)
+    await mediator.events.join()
+    try:
+        await mediator.tools_executed([])
+    except Exception as e:
+        log.append(type(e).__name__)
+    conversation.store = lambda data: None
+    return states, log, mediator.user_proxy.published
+
+
+async def run(conversations):
+    legacy, compiled = await trace(LegacyMediator), await trace(conversation.MediatorStateMachine)
+    assert legacy == compiled, (legacy, compiled)
+
+    for name, mediator_cls in [("transitions AsyncMachine", LegacyMediator),
+                               ("compiled StateTable", conversation.MediatorStateMachine)]:
+        gc.collect()
+        start = time.perf_counter()
+        mediators = [make(mediator_cls) for _ in range(conversations)]
+        created = time.perf_counter() - start
+
+        rates = []
+        # with the mediator's own callbacks, then with the audit row construction left out as well
+        for mediators in [mediators, [make(mediator_cls) for _ in range(conversations)]]:
+            conversation.XRunDetail = (lambda **kwargs: None) if rates else XRunDetail
+            gc.collect()
+            start = time.perf_counter()
+            events = 0
+            for mediator in mediators:
+                events += await drive(mediator)
+            rates.append(events / (time.perf_counter() - start))
+        print(f"{name:25} creation {created / conversations * 1e6:7.1f} us/mediator"
+              f"  events {rates[0]:7.0f}/s  without audit rows {rates[1]:7.0f}/s")
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
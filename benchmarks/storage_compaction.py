@@ -0,0 +1,136 @@
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import insert, select, func
+
+import compact_storage
+import database
+import db_maintenance
+
+# Builds the same synthetic run_details table (18 rows per run over 90 days: compacted polls and state
+# changes, the user message, tool arguments and results, and the reply) in the plain and in the compact
+# storage format, and compares the file size and the history queries: the steps of a run (by run_id), the
+# events per type and the tool calls (full scans). Then the runs older than 30 days are rolled up into their
+# summaries and the database vacuumed.
+#   python -m benchmarks.storage_compaction [run_details rows]
+
+rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+runs = rows // 18
+days = 90
+
+random.seed(1)
+words = ["".join(random.choice("abcdefghijklmnopqrstuvwxyz") for i in range(random.randint(2, 9)))
+         for j in range(2000)]
+
+
+def text(low, high):
+    return " ".join(random.choice(words) for i in range(random.randint(low, high) // 6))
+
+
+def quote():
+    symbol = random.choice(["MSFT", "AAPL", "GOOG", "AMZN", "NVDA", "META"])
+    history = [{"date": f"2024-01-{day + 1:02}", "open": round(random.uniform(100, 500), 2),
+                "close": round(random.uniform(100, 500), 2), "volume": random.randint(10 ** 5, 10 ** 7)}
+               for day in range(random.randint(3, 30))]
+    return str({"symbol": symbol, "currency": "USD", "history": history}).replace("'", '"')
+
+
+messages = [text(30, 400) for i in range(500)]
+replies = [text(200, 2000) for i in range(500)]
+quotes = [quote() for i in range(500)]
+
+
+def run_rows(r, started):
+    at = lambda seconds: started + datetime.timedelta(seconds=seconds)
+    run_id = f"run_{r:08}"
+    output = random.choice(quotes)
+    events = [("submit_user_msg", None, random.choice(messages), None, 1),
+              ("state_change", None, None, "started", 1),
+              ("check_run_status", None, None, "queued", 2),
+              ("check_run_status", None, None, "in_progress", 12),
+              ("state_change", None, None, "running", 12),
+              ("check_run_status", None, None, "requires_action", 1),
+              ("state_change", None, None, "action_required", 1),
+              ("execute_tool", "get_stock_price", '{"symbol": "MSFT", "period": "1mo"}', output, 1),
+              ("execute_tool", "get_stock_price", '{"symbol": "AAPL", "period": "1mo"}', output, 1),
+              ("state_change", None, None, "tools_executed", 1),
+              ("submit_tool_outputs", "get_stock_price-call_1", output, None, 1),
+              ("submit_tool_outputs", "get_stock_price-call_2", output, None, 1),
+              ("state_change", None, None, "tool_outputs_submitted", 1),
+              ("check_run_status", None, None, "in_progress", 8),
+              ("state_change", None, None, "running", 8),
+              ("check_run_status", None, None, "completed", 1),
+              ("retrieve_asst_msg", None, None, random.choice(replies), 1),
+              ("state_change", None, None, "completed", 1)]
+    return [{"run_id": run_id, "type": type, "tool": tool, "input": input, "output": output,
+             "created_at": at(i), "seen_count": count, "last_seen_at": at(i + count - 1)}
+            for i, (type, tool, input, output, count) in enumerate(events)]
+
+
+def populate(engine):
+    database.metadata.create_all(bind=engine)
+    now = datetime.datetime.now()
+    chunk = []
+    with engine.begin() as conn:
+        for r in range(runs):
+            started = now - datetime.timedelta(days=days * (runs - r) / runs)
+            chunk.extend(run_rows(r, started))
+            if len(chunk) >= 50_000 or r == runs - 1:
+                conn.execute(insert(database.run_details), chunk)
+                chunk = []
+        # as kept up to date by run_metrics
+        conn.execute(insert(database.run_summaries), [
+            {"run_id": f"run_{r:08}", "num_events": 53, "num_tool_calls": 2, "num_polls": 24, "state": "completed",
+             "state_times": "{}", "started_at": now, "ended_at": now, "duration": 60.0} for r in range(runs)])
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ["", "-wal"] if os.path.exists(path + suffix)) / 2 ** 20
+
+
+def measure(engine, lookups=200):
+    table = database.run_details
+    run_ids = [f"run_{random.randrange(runs):08}" for i in range(lookups)]
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        for run_id in run_ids:
+            conn.execute(select(table).where(table.c.run_id == run_id).order_by(table.c.created_at)).all()
+        by_run = (time.perf_counter() - start) / lookups
+        start = time.perf_counter()
+        conn.execute(select(table.c.type, func.count()).group_by(table.c.type)).all()
+        per_type = time.perf_counter() - start
+        start = time.perf_counter()
+        conn.execute(select(table.c.output).where(table.c.type == "execute_tool")).all()
+        tool_calls = time.perf_counter() - start
+    return by_run, per_type, tool_calls
+
+
+def run(directory):
+    for name, compact in [("plain", False), ("compact", True)]:
+        compact_storage.enabled = compact
+        path = os.path.join(directory, f"{name}.db")
+        engine = database.create_db_engine(f"sqlite:///{path}")
+        start = time.perf_counter()
+        populate(engine)
+        populated = time.perf_counter() - start
+        by_run, per_type, tool_calls = measure(engine)
+        print(f"{name:8} {rows} rows in {populated:5.0f} s  {size(path):7.1f} MB  steps by run_id "
+              f"{by_run * 1000:6.3f} ms  events per type {per_type:6.2f} s  tool calls {tool_calls:6.2f} s")
+
+        start = time.perf_counter()
+        rolled_up, deleted = db_maintenance.roll_up(engine, days=30)
+        db_maintenance.vacuum(engine)
+        print(f"{'':8} retention of 30 days: {deleted} rows of {rolled_up} runs rolled up and vacuumed in "
+              f"{time.perf_counter() - start:5.0f} s  {size(path):7.1f} MB")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        run(directory)
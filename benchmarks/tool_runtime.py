@@ -0,0 +1,67 @@
+import asyncio
+import sys
+import time
+
+from function_tools.tool_runtime import ToolRuntime
+
+# How much tool calls hold up the event loop that polls every other conversation: a heartbeat ticks every
+# 10 ms while a batch of calls runs, and its worst delay (loop lag) is reported with the batch's wall time
+# and the tool's saturation metrics. Blocking I/O is run on the loop (as a sync tool called in place would),
+# on the thread pool, and on the thread pool with a concurrency limit; CPU-bound work on the thread pool
+# (where it still holds the GIL) and on the process pool.
+#   python -m benchmarks.tool_runtime [calls]
+
+calls = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+
+
+def blocking_quote(symbol):
+    time.sleep(0.1)
+    return 100.0
+
+
+# module-level, so that the process pool can pickle it
+def crunch(n):
+    return sum(i * i for i in range(n))
+
+
+async def heartbeat(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start - 0.01)
+
+
+async def measure(runtime, name, arguments):
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    await asyncio.gather(*[runtime.execute(name, arguments) for _ in range(calls)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    stats = runtime.stats()[name]
+    print(f"{name:22} {elapsed:6.2f} s   loop lag max {max(lags) * 1000:7.1f} ms   "
+          f"max running {stats['max_running']:2}   waited {stats['wait_time']:5.2f} s")
+
+
+async def run():
+    runtime = ToolRuntime(threads=8, processes=2, default_timeout=60)
+    runtime.register("io on the loop", blocking_quote, kind="light")
+    runtime.register("io on threads", blocking_quote, kind="io")
+    runtime.register("io on threads, max 2", blocking_quote, kind="io", max_concurrency=2)
+    runtime.register("cpu on threads", crunch, kind="io")
+    runtime.register("cpu on processes", crunch, kind="cpu")
+    # the process pool is started before measuring, as it spawns its workers on first use
+    await runtime.execute("cpu on processes", {"n": 10})
+
+    for name in ["io on the loop", "io on threads", "io on threads, max 2"]:
+        await measure(runtime, name, {"symbol": "MSFT"})
+    for name in ["cpu on threads", "cpu on processes"]:
+        await measure(runtime, name, {"n": 2_000_000})
+    runtime.process_pool.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(run())
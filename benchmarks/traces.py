@@ -0,0 +1,64 @@
+import json
+import sys
+
+# Traces of real runs, for the fake backend to replay: the statuses each run went through (with the time
+# spent in each pending status), the tool calls it requested and its reply, taken from the audit log.
+#   python -m benchmarks.traces <file> [runs]   records the latest runs of the local database to <file>
+
+PENDING_STATUSES = ["queued", "in_progress"]
+
+
+def script_from_steps(steps):
+    script = []
+    reply = None
+    status_started = None
+    for step in steps:
+        if step.type == "check_run_status":
+            status = step.output
+            if script and script[-1][0] == status and status in PENDING_STATUSES:
+                continue
+            if script and script[-1][0] in PENDING_STATUSES:
+                script[-1][1] = (step.created_at - status_started).total_seconds()
+            if status in PENDING_STATUSES:
+                script.append([status, 0])
+                status_started = step.created_at
+            else:
+                script.append([status, [] if status == "requires_action" else None])
+        elif step.type == "execute_tool" and script and script[-1][0] == "requires_action":
+            script[-1][1].append({"name": step.tool, "arguments": json.loads(step.input)})
+        elif step.type == "retrieve_asst_msg":
+            reply = step.output
+    # only runs that were followed to the end can be replayed
+    if not script or script[-1][0] in PENDING_STATUSES + ["requires_action"]:
+        return None
+    return {"script": script, "reply": reply}
+
+
+def from_audit_log(runs=100):
+    import db_access
+    from models import XRun
+
+    run_ids = [run.run_id for run in db_access.get_all(XRun)][-runs:]
+    steps = db_access.get_steps_as_df(run_ids)
+    traces = []
+    for run_id in run_ids:
+        trace = script_from_steps(steps[steps.run_id == run_id].itertuples())
+        if trace:
+            traces.append(trace)
+    return traces
+
+
+def save(traces, path):
+    with open(path, "w") as f:
+        json.dump(traces, f, indent=1)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    traces = from_audit_log(int(sys.argv[2]) if len(sys.argv) > 2 else 100)
+    save(traces, sys.argv[1])
+    print(f"recorded {len(traces)} runs to {sys.argv[1]}")
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.fake_assistants import FakeAssistants, TOOL_SCRIPT, start_server
+
+# Cost of the tracing spans, per span and per conversation turn, with tracing disabled and enabled,
+# and where the time of a turn goes according to the spans.
+#   python -m benchmarks.tracing_overhead [turns]
+
+backend = FakeAssistants(script=TOOL_SCRIPT)
+server, base_url = start_server(backend)
+os.environ["OPENAI_BASE_URL"] = base_url
+os.environ["OPENAI_API_KEY"] = "fake"
+os.environ.setdefault("MEDIATOR_TYPE", "basic")
+
+import conversation
+import database
+import tracing
+
+
+def span_cost(n=1_000_000):
+    start = time.perf_counter()
+    for _ in range(n):
+        pass
+    empty = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(n):
+        with tracing.span("bench", thread_id="thread", run_id="run"):
+            pass
+    return (time.perf_counter() - start - empty) / n
+
+
+async def turns_cpu(turns):
+    user_proxy = await conversation.start_conversation("asst_fake")
+    start = time.process_time()
+    for i in range(turns):
+        user_proxy.send_user_message(f"message {i}")
+        await user_proxy.get_assistant_message()
+    return (time.process_time() - start) / turns
+
+
+async def run(turns):
+    database.create_tables()
+    # warm up imports, connections and tables
+    await turns_cpu(2)
+    tracing.enabled = False
+    cpu_disabled = await turns_cpu(turns)
+    tracing.enabled = True
+    tracing.reset()
+    cpu_enabled = await turns_cpu(turns)
+    spans = len(tracing.recent_spans) / turns
+    summary = tracing.summary()
+
+    for enabled, cpu in [(False, cpu_disabled), (True, cpu_enabled)]:
+        tracing.enabled = enabled
+        per_span = span_cost(100_000 if enabled else 1_000_000)
+        label = "enabled " if enabled else "disabled"
+        print(f"tracing {label}  {per_span * 1e9:6.0f} ns/span  cpu/turn {cpu * 1000:6.2f} ms"
+              f"  spans/turn {spans:4.1f}  span cost/turn {per_span * spans * 1e6:6.1f} us"
+              f" ({per_span * spans / cpu:.3%} of cpu)")
+
+    print()
+    for name, s in summary.items():
+        print(f"{name:28} count {s['count']:5}  mean {s['total'] / s['count'] * 1000:8.2f} ms"
+              f"  p99 <= {s['p99'] * 1000:g} ms")
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 20))
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import time
+
+from benchmarks.fake_assistants import (MULTI_TOOL_SCRIPT, PLAIN_SCRIPT, TOOL_SCRIPT, FakePriceProvider,
+                                        fetch_stats, start_server_process)
+from benchmarks import traces
+
+# End-to-end turns of both mediators against the fake backend (in its own process), for a plain reply,
+# one tool step and two tool steps with two calls each, or for recorded traces. Reports the turn latency,
+# and the API calls, audit rows written and CPU time (of this process) per turn.
+#   python -m benchmarks.turns [turns] [traces.json]
+
+turns = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+latency = {"create_message": 0.02, "create_run": 0.02, "get_run": 0.01, "list_messages": 0.02,
+           "submit_tool_outputs": 0.02, "create_thread": 0.02}
+
+if len(sys.argv) > 2:
+    scenarios = {"replay": {"traces": traces.load(sys.argv[2])}}
+else:
+    scenarios = {"plain": {"script": PLAIN_SCRIPT},
+                 "single tool": {"script": TOOL_SCRIPT},
+                 "multi tool": {"script": MULTI_TOOL_SCRIPT}}
+
+# the backends are started before anything else, so that their processes fork from a process without threads
+servers = {name: start_server_process(latency=latency, **kwargs) for name, kwargs in scenarios.items()}
+os.environ["OPENAI_API_KEY"] = "fake"
+
+import conversation
+import database
+import db_access
+from function_tools import local_functions
+from models import XConversation, XMessage, XRun, XRunDetail
+from run_engine import LatencyStats
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+
+def count_rows():
+    db_access.flush()
+    with Session(db_access.engine) as session:
+        return sum(session.scalar(select(func.count(entity.id))) for entity in [XConversation, XRun, XRunDetail,
+                                                                                 XMessage])
+
+
+async def measure(mediator_type, base_url):
+    os.environ["MEDIATOR_TYPE"] = mediator_type
+    user_proxy = await conversation.start_conversation("asst_fake")
+    # warm up
+    user_proxy.send_user_message("warm up")
+    await user_proxy.get_assistant_message()
+
+    stats = LatencyStats(turns)
+    calls = fetch_stats(base_url)["calls"]
+    rows = count_rows()
+    cpu = time.process_time()
+    for i in range(turns):
+        start = time.perf_counter()
+        user_proxy.send_user_message(f"message {i}")
+        await user_proxy.get_assistant_message()
+        stats.record(time.perf_counter() - start)
+    cpu = time.process_time() - cpu
+    return (stats.summary(), (fetch_stats(base_url)["calls"] - calls) / turns, (count_rows() - rows) / turns,
+            cpu / turns)
+
+
+def run():
+    database.create_tables()
+    local_functions.set_price_provider(FakePriceProvider())
+    for name, (process, base_url) in servers.items():
+        os.environ["OPENAI_BASE_URL"] = base_url
+        for mediator_type in ["basic", "stateMachine"]:
+            summary, calls, rows, cpu = asyncio.run(measure(mediator_type, base_url))
+            print(f"{name:12} {mediator_type:13} turn p50 {summary['p50'] * 1000:7.1f} ms"
+                  f"  p99 {summary['p99'] * 1000:7.1f} ms  api calls/turn {calls:5.1f}"
+                  f"  db rows/turn {rows:5.1f}  cpu/turn {cpu * 1000:6.2f} ms")
+        process.terminate()
+
+
+if __name__ == '__main__':
+    run()
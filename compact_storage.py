@@ -0,0 +1,56 @@
+import os
+import zlib
+
+from dotenv import load_dotenv
+from sqlalchemy.types import TypeDecorator, String
+
+load_dotenv()
+
+# With compact storage, run_details keeps its low-cardinality values (event types, run statuses, mediator
+# states) as one-byte codes, and compresses input / output payloads of DB_COMPRESS_MIN characters or more
+# with zlib. Both are stored as blobs, which SQLite keeps as they are in the existing VARCHAR columns (an
+# integer would be turned back into text by their TEXT affinity), so no table rebuild is needed.
+# Values are decoded whatever their format, so the setting can change on an existing database;
+# db_maintenance.recode converts the rows already written.
+enabled = os.environ.get("DB_COMPACT_STORAGE", "false").lower() == "true"
+compress_min = int(os.environ.get("DB_COMPRESS_MIN", 256))
+
+# append only: a value's code is its position
+TYPES = ("submit_user_msg", "check_run_status", "state_change", "execute_tool", "submit_tool_outputs",
+         "retrieve_asst_msg", "run_timeout", "run_failed", "run_cancelled")
+STATES = ("queued", "in_progress", "requires_action", "cancelling", "cancelled", "failed", "completed", "expired",
+          "new", "ready", "started", "running", "action_required", "tools_executed", "tool_outputs_submitted")
+
+
+# A string column storing the given values as codes, and (with compress) long strings compressed.
+# Any other value is stored as it is.
+class Compact(TypeDecorator):
+    impl = String
+    cache_ok = True
+
+    def __init__(self, values=(), compress=False):
+        super().__init__()
+        self.values = tuple(values)
+        self.compress = compress
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def process_bind_param(self, value, dialect):
+        if not enabled or not isinstance(value, str):
+            return value
+        code = self.codes.get(value)
+        if code is not None:
+            return bytes([code])
+        if self.compress and len(value) >= compress_min:
+            encoded = value.encode()
+            compressed = zlib.compress(encoded)
+            if len(compressed) < len(encoded):
+                return compressed
+        return value
+
+    # a one-byte blob is a code; compressed data is always longer
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            if len(value) == 1:
+                return self.values[value[0]]
+            return zlib.decompress(value).decode()
+        return value
@@ -1,29 +1,70 @@
 import asyncio
 import os
+import time
 
 from dotenv import load_dotenv
 
-import openai_access
+import openai_async_access
+import run_store
+import tracing
+import warm_threads
 from function_tools import local_functions
+import db_access
+import events
 from db_access import store
-from transitions import Machine, State
+from run_engine import RunEngine, RunTimeout, delivery_stats, first_token_stats, PENDING_STATUSES
+from state_machine import StateTable
 from models import XConversation, XMessage, XRunDetail, XRun
 
 from openai.types.beta import Thread
 from openai.types.beta.threads import ThreadMessage, Run
 import json
 
-from pubsub import pub
-
 load_dotenv()
 
-def start_conversation(asst_id):
+# with streaming, runs report their progress and the reply's text deltas as server-sent events
+streaming = os.environ.get("STREAMING", "false").lower() == "true"
+
+# the run state of each conversation, saved on every state change so that its run can be resumed by
+# another process (see resume_run and conversation_host)
+run_states = run_store.create_store()
+
+# threads created ahead of the conversations that take them
+thread_pool = warm_threads.WarmThreadPool()
+
+async def start_conversation(asst_id):
     mediator = get_default_mediator()
     user_proxy = UserProxy(mediator)
     asst_proxy = AssistantProxy(mediator, asst_id)
+    await asst_proxy.create_thread()
+    mediator.set_proxies(asst_proxy, user_proxy)
+    return user_proxy
+
+# a conversation from its saved run state, e.g. in a worker taking over the conversation's shard
+def restore_conversation(state):
+    mediator = get_default_mediator()
+    user_proxy = UserProxy(mediator)
+    asst_proxy = AssistantProxy(mediator, state["assistant_id"])
+    asst_proxy.thread_id = state["thread_id"]
+    asst_proxy.run_id = state["run_id"]
+    asst_proxy.last_message_id = state["last_message_id"]
+    asst_proxy.last_reply = user_proxy.asst_message = state["asst_message"]
+    asst_proxy.saved = (state["run_id"], state["state"])
     mediator.set_proxies(asst_proxy, user_proxy)
     return user_proxy
 
+# picks up the run of a restored conversation where it stands: whichever step was in progress, the run
+# status is fetched again and handled as from 'running' (tools requested but not submitted run again)
+def resume_run(user_proxy):
+    mediator = user_proxy.mediator
+    mediator.state = 'running'
+    user_proxy.reply = asyncio.get_running_loop().create_future()
+    user_proxy.deltas = asyncio.Queue()
+    asst_proxy = mediator.asst_proxy
+    asst_proxy.sent_at = time.monotonic()
+    asst_proxy.first_token_at = None
+    asst_proxy.task = asyncio.create_task(asst_proxy.process())
+
 def get_default_mediator():
     type = os.environ["MEDIATOR_TYPE"]
     if type:
@@ -38,249 +79,482 @@ def get_mediator(type):
 
     return mediator
 
+# events go to the subscribers of the mediator's own conversation (see events.EventBus); the event is
+# only built when the topic has subscribers
+async def publish(mediator, event_type, *args):
+    if mediator.events.has_subscribers(event_type.topic):
+        asst_proxy = mediator.asst_proxy
+        await mediator.events.publish(event_type(asst_proxy.thread_id, asst_proxy.run_id, *args))
+
 class UserProxy():
     def __init__(self, mediator):
         self.mediator = mediator
         self.user_message = None
         self.asst_message = None
+        self.reply = None
+        self.task = None
 
     def send_user_message(self, msg):
         self.asst_message = None
         self.user_message = msg
-        self.mediator.set_user_message(self.user_message)
+        # completed by the mediator with the assistant's message, or with the error that ended the run
+        self.reply = asyncio.get_running_loop().create_future()
+        self.deltas = asyncio.Queue()
+        self.task = asyncio.create_task(self.send(self.user_message))
+
+    async def send(self, msg):
+        try:
+            await self.mediator.set_user_message(msg)
+        except Exception as e:
+            await self.mediator.run_failed(e)
 
     def set_asst_message(self, asst_msg):
         self.asst_message = asst_msg
-
-    async def get_assistant_message(self):
-        while self.asst_message == None:
-            await asyncio.sleep(1)
-        return self.asst_message
-
-    def execute_tools(self, run_status):
-        results = []
+        if self.reply and not self.reply.done():
+            self.reply.set_result(asst_msg)
+            self.deltas.put_nowait(None)
+
+    def set_error(self, error):
+        if self.reply and not self.reply.done():
+            self.reply.set_exception(error)
+            self.deltas.put_nowait(None)
+
+    def add_text_delta(self, delta):
+        self.deltas.put_nowait(delta)
+
+    # yields the reply to the last message as it is generated; without streaming, the whole reply at once
+    async def stream_assistant_message(self):
+        streamed = False
+        while (delta := await self.deltas.get()) is not None:
+            streamed = True
+            yield delta
+        message = await self.get_assistant_message()
+        if not streamed:
+            yield message
+
+    # waits for the reply to the last message; on timeout or cancellation the run is cancelled as well
+    async def get_assistant_message(self, timeout=None):
+        if self.reply is None:
+            raise Exception("No message has been sent")
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.reply), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            await self.cancel()
+            raise
+
+    async def cancel(self):
+        if self.reply and not self.reply.done():
+            self.reply.cancel()
+            self.deltas.put_nowait(None)
+        if self.task and not self.task.done():
+            self.task.cancel()
+        await self.mediator.cancel()
+
+    async def execute_tools(self, run_status):
         tool_calls = run_status.required_action.submit_tool_outputs.tool_calls
+        calls = []
         for tool_call in tool_calls:
-            arguments = json.loads(tool_call.function.arguments)
-            output = local_functions.execute_function(tool_call.function.name, arguments)
-            result = {
-                "call_id" : tool_call.id,
-                "function_name" : tool_call.function.name,
-                "arguments" : arguments,
-                "output" : output
-            }
-            results.append(result)
-
-            store(XRunDetail(run_id=run_status.id, type="execute_tool", tool=tool_call.function.name,
-                             input=json.dumps(arguments), output=json.dumps(output)))
-
-        self.mediator.tools_executed(results)
+            try:
+                calls.append((tool_call.function.name, parse_arguments(tool_call)))
+            except ValueError:
+                # reported as that call's output by execute_tool
+                pass
+        await local_functions.prefetch_async(calls)
+        # all the calls of a step run concurrently; gather keeps the results in the order of the calls
+        results = await asyncio.gather(*[self.execute_tool(run_status.id, tool_call) for tool_call in tool_calls])
+        await self.mediator.tools_executed(list(results))
+
+    async def execute_tool(self, run_id, tool_call):
+        # kept as sent when they are malformed
+        arguments = tool_call.function.arguments
+        try:
+            arguments = parse_arguments(tool_call)
+            with tracing.span("execute_tool", run_id=run_id, tool=tool_call.function.name):
+                output = await local_functions.execute_function_async(tool_call.function.name, arguments)
+        except asyncio.TimeoutError:
+            output = {"error": f"{tool_call.function.name} timed out"}
+        except Exception as e:
+            output = {"error": str(e)}
+        result = {
+            "call_id" : tool_call.id,
+            "function_name" : tool_call.function.name,
+            "arguments" : arguments,
+            "output" : output
+        }
+
+        store(XRunDetail(run_id=run_id, type="execute_tool", tool=tool_call.function.name,
+                         input=arguments if isinstance(arguments, str) else json.dumps(arguments),
+                         output=json.dumps(output)))
+        return result
+
+# the arguments the model sent for a tool call; ValueError when they are not a JSON object
+def parse_arguments(tool_call):
+    try:
+        arguments = json.loads(tool_call.function.arguments)
+    except ValueError as e:
+        raise ValueError(f"Malformed arguments for {tool_call.function.name}: {e}")
+    if not isinstance(arguments, dict):
+        raise ValueError(f"Malformed arguments for {tool_call.function.name}: not a JSON object")
+    return arguments
 
 class AssistantProxy():
     def __init__(self, mediator, asst_id):
         self.mediator = mediator
         self.asst_id = asst_id
-        self.create_thread()
+        self.thread_id = None
         self.run_id = None
-
-    def create_thread(self):
-        thread: Thread = openai_access.create_thread()
-        conv = XConversation(thread_id=thread.id, default_assistant_id=self.asst_id)
+        self.engine = RunEngine()
+        self.task = None
+        self.stream = None
+        self.sent_at = None
+        self.first_token_at = None
+        # newest message of the thread seen so far; replies are looked up after it
+        self.last_message_id = None
+        self.last_reply = None
+        self.saved = None
+
+    async def create_thread(self):
+        thread_id = thread_pool.take()
+        if thread_id is None:
+            thread: Thread = await openai_async_access.create_thread()
+            thread_id = thread.id
+        conv = XConversation(thread_id=thread_id, default_assistant_id=self.asst_id)
         store(conv)
-        self.thread_id = thread.id
-    def create_message(self, msg):
-        thread_message: ThreadMessage = openai_access.create_message( self.thread_id, "user", msg
-        )
-
-    def create_run(self):
-        run: Run = openai_access.create_run(thread_id=self.thread_id, assistant_id=self.asst_id)
-        self.run_id = run.id
-
-    def start_processing(self, user_message):
+        self.thread_id = thread_id
+        self.save_state('new')
+
+    # saves the run state when it changes (not on heartbeats)
+    def save_state(self, state):
+        if run_states is None or (self.run_id, state) == self.saved:
+            return
+        self.saved = (self.run_id, state)
+        run_states.save(self.thread_id, assistant_id=self.asst_id, run_id=self.run_id, state=state,
+                        last_message_id=self.last_message_id, asst_message=self.last_reply)
+    async def create_message(self, msg):
+        with tracing.span("create_message", thread_id=self.thread_id):
+            thread_message: ThreadMessage = await openai_async_access.create_message( self.thread_id, "user", msg
+            )
+        self.last_message_id = thread_message.id
+
+    async def create_run(self):
+        with tracing.span("create_run", thread_id=self.thread_id) as span:
+            run: Run = await openai_async_access.create_run(thread_id=self.thread_id, assistant_id=self.asst_id)
+            self.run_id = run.id
+            span.set("run_id", run.id)
+
+    async def create_run_stream(self):
+        with tracing.span("create_run", thread_id=self.thread_id) as span:
+            self.stream = await openai_async_access.stream_run(thread_id=self.thread_id, assistant_id=self.asst_id)
+            # the first event is the created run
+            event, data = await anext(self.stream)
+            self.run_id = data["id"]
+            span.set("run_id", self.run_id)
+
+    async def start_processing(self, user_message):
+        if self.run_id:
+            # e.g. the 'ready' state change, still recorded under the previous run
+            db_access.release(self.run_id)
         self.run_id = None
-        self.create_message(user_message)
-        self.create_run()
-        asyncio.create_task(self.process())
+        self.sent_at = time.monotonic()
+        self.first_token_at = None
+        await self.create_message(user_message)
+        if streaming:
+            await self.create_run_stream()
+        else:
+            await self.create_run()
 
         store(XRun(run_id=self.run_id, thread_id=self.thread_id, assistant_id=self.asst_id))
         store(XRunDetail(run_id=self.run_id, type="submit_user_msg", input=user_message))
         store(XMessage(thread_id=self.thread_id, source="user_proxy", content=user_message))
 
-        self.mediator.started(user_message)
+        await self.mediator.started(user_message)
+        self.task = asyncio.create_task(self.process())
+
+    async def get_run(self):
+        with tracing.span("poll", thread_id=self.thread_id, run_id=self.run_id):
+            return await openai_async_access.get_run(thread_id=self.thread_id, run_id=self.run_id)
+
+    # runs (and text deltas, forwarded to the mediator) from the current event stream, and from the
+    # stream opened by each tool output submission
+    async def run_events(self):
+        while self.stream is not None:
+            stream, self.stream = self.stream, None
+            try:
+                async for event, data in stream:
+                    if data.get("object") == "thread.run":
+                        yield Run.construct(**data)
+                    elif event == "thread.message.delta":
+                        for part in data["delta"].get("content", []):
+                            if part.get("type") == "text":
+                                await self.text_delta(part["text"]["value"])
+            finally:
+                await stream.aclose()
+
+    async def text_delta(self, delta):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+            first_token_stats.record(self.first_token_at - self.sent_at)
+        await self.mediator.text_delta(delta)
 
     async def process(self):
-        #TODO timeout
-        while (True):
-            run_status = openai_access.get_run( thread_id=self.thread_id, run_id=self.run_id)
-            #print(f"run status: {run_status.status}")
-            store(XRunDetail(run_id=self.run_id, type="check_run_status", output=run_status.status))
-
-            if run_status.status == 'completed':
-                result =  self.retrieve_completed_message()
-                self.mediator.assistant_message_retrieved(result)
-                break
-            elif run_status.status == 'requires_action':
-                self.mediator.action_required(run_status)
-            elif run_status.status in ['in_progress', 'queued']:
-                self.mediator.heartbeat(run_status.status)
-                await asyncio.sleep(1)
-            else:
-                raise Exception(f"Non-actionable status: {run_status.status}")
-
-    def retrieve_completed_message(self):
-        messages = openai_access.get_thread_messages(thread_id=self.thread_id)
-        response = messages.data[0].content[0].text.value
+        events = self.run_events() if streaming else None
+        try:
+            async for run_status in self.engine.watch(self.get_run, events):
+                #print(f"run status: {run_status.status}")
+                store(XRunDetail(run_id=self.run_id, type="check_run_status", output=run_status.status))
+
+                if run_status.status == 'completed':
+                    completed_at = time.monotonic()
+                    result = await self.retrieve_completed_message()
+                    await self.mediator.assistant_message_retrieved(result)
+                    delivery_stats.record(time.monotonic() - completed_at)
+                    tracing.observe("turn", time.monotonic() - self.sent_at, thread_id=self.thread_id,
+                                    run_id=self.run_id)
+                    await db_access.flush_async(self.run_id)
+                elif run_status.status == 'requires_action':
+                    await self.mediator.action_required(run_status)
+                elif run_status.status in PENDING_STATUSES:
+                    await self.mediator.heartbeat(run_status.status)
+                else:
+                    raise Exception(f"Non-actionable status: {run_status.status}")
+        except RunTimeout as e:
+            store(XRunDetail(run_id=self.run_id, type="run_timeout", output=str(e)))
+            await self.cancel_run()
+            await self.mediator.run_failed(e)
+        except Exception as e:
+            store(XRunDetail(run_id=self.run_id, type="run_failed", output=str(e)))
+            # e.g. while the run waits for tool outputs: left active, it would lock the thread for the next message
+            await self.cancel_run()
+            await self.mediator.run_failed(e)
+        finally:
+            db_access.release(self.run_id)
+            if events is not None:
+                await events.aclose()
+            # the stream of a tool output submission, left unread if the run ended first (e.g. failed)
+            if self.stream is not None:
+                stream, self.stream = self.stream, None
+                await stream.aclose()
+
+    async def cancel_run(self):
+        try:
+            await openai_async_access.cancel_run(thread_id=self.thread_id, run_id=self.run_id)
+        except Exception:
+            pass
+
+    async def cancel_processing(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+        if self.run_id:
+            store(XRunDetail(run_id=self.run_id, type="run_cancelled"))
+            await self.cancel_run()
+
+    async def retrieve_completed_message(self):
+        # only the messages added since the last one seen, so the cost does not grow with the thread
+        with tracing.span("retrieve_message", thread_id=self.thread_id, run_id=self.run_id):
+            messages = await openai_async_access.list_new_messages(thread_id=self.thread_id,
+                                                                   after=self.last_message_id)
+        if messages:
+            self.last_message_id = messages[-1].id
+        replies = [msg for msg in messages if msg.role == "assistant" and msg.run_id in [self.run_id, None]]
+        response = "\n\n".join(openai_async_access.message_text(msg) for msg in replies)
+        self.last_reply = response
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+            first_token_stats.record(self.first_token_at - self.sent_at)
         store(XRunDetail(run_id=self.run_id, type="retrieve_asst_msg", output=response))
         store(XMessage(thread_id=self.thread_id, source="asst_proxy", content=response))
         return response
 
-    def submit_tool_outputs(self, evt):
+    async def submit_tool_outputs(self, evt):
         tool_outputs = [{"tool_call_id": result["call_id"], "output":json.dumps(result["output"])} for result in evt]
-        openai_access.submit_tool_outputs(
-            thread_id=self.thread_id,
-            run_id=self.run_id,
-            tool_outputs=tool_outputs
-        )
+        with tracing.span("submit_tool_outputs", thread_id=self.thread_id, run_id=self.run_id):
+            if streaming:
+                # picked up by run_events, which reports the rest of the run from this stream
+                self.stream = await openai_async_access.stream_tool_outputs(
+                    thread_id=self.thread_id,
+                    run_id=self.run_id,
+                    tool_outputs=tool_outputs
+                )
+            else:
+                await openai_async_access.submit_tool_outputs(
+                    thread_id=self.thread_id,
+                    run_id=self.run_id,
+                    tool_outputs=tool_outputs
+                )
 
         for result in evt:
             store(XRunDetail(run_id=self.run_id, type="submit_tool_outputs",
-                             tool=f"{result['function_name']}-{result['call_id']}", input=result['output']))
+                             tool=f"{result['function_name']}-{result['call_id']}", input=json.dumps(result['output'])))
 
-        self.mediator.tool_outputs_submitted(evt);
+        await self.mediator.tool_outputs_submitted(evt);
 
 class MediatorBasic():
 
     def __init__(self):
         self.state = 'new'
+        self.events = events.EventBus()
 
     def set_proxies(self, asst_proxy, user_proxy):
         self.user_proxy = user_proxy
         self.asst_proxy = asst_proxy
 
-    def set_user_message(self, user_message):
+    async def set_user_message(self, user_message):
         self.state = 'ready'
         self.store_state()
-        self.asst_proxy.start_processing(user_message)
+        await self.asst_proxy.start_processing(user_message)
 
-    def started(self, user_message):
+    async def started(self, user_message):
         self.state = 'started'
         self.store_state()
-        pub.sendMessage("sentMessage", evt=f"📡 Sent message, run_id {self.asst_proxy.run_id}: {user_message}")
+        await publish(self, events.SentMessage, user_message)
 
-    def heartbeat(self, status):
+    async def heartbeat(self, status):
         self.state = 'running'
         self.store_state()
 
-    def action_required(self, run_status):
+    async def action_required(self, run_status):
         self.state = 'action_required'
         self.store_state()
-        self.user_proxy.execute_tools(run_status)
+        await self.user_proxy.execute_tools(run_status)
 
-    def tools_executed(self, tool_results):
+    async def tools_executed(self, tool_results):
         self.state = 'tools_executed'
         self.store_state()
-        self.asst_proxy.submit_tool_outputs(tool_results)
+        await self.asst_proxy.submit_tool_outputs(tool_results)
         for result in tool_results:
-            function_name = result["function_name"]
-            arguments = result["arguments"]
-            output = json.dumps(result["output"])
-            pub.sendMessage("executedTool", evt=f"🔧 {function_name} 🔧 : {arguments} ➡️ {output}")
+            await publish(self, events.ExecutedTool, result["call_id"], result["function_name"], result["arguments"],
+                          result["output"])
 
-    def tool_outputs_submitted(self, evt):
+    async def tool_outputs_submitted(self, evt):
         self.state = 'tool_outputs_submitted'
         self.store_state()
 
-    def assistant_message_retrieved(self, asst_message):
+    async def assistant_message_retrieved(self, asst_message):
         self.state = 'completed'
         self.store_state()
         self.user_proxy.set_asst_message(asst_message)
-        pub.sendMessage("retrievedMessage", evt="📡 Retrieved message : " + asst_message)
+        await publish(self, events.RetrievedMessage, asst_message)
+
+    async def text_delta(self, delta):
+        self.user_proxy.add_text_delta(delta)
+        await publish(self, events.TextDelta, delta)
+
+    async def run_failed(self, error):
+        self.state = 'failed'
+        self.store_state()
+        self.user_proxy.set_error(error)
+        await publish(self, events.RunError, error)
+
+    async def cancel(self):
+        await self.asst_proxy.cancel_processing()
+        await self.run_failed(Exception("Run cancelled"))
 
     def store_state(self):
         #print(f"**state**: {self.state}")
         run_id = self.asst_proxy.run_id or "TBD"
         store(XRunDetail(run_id=run_id, type="state_change", output=self.state))
-
+        self.asst_proxy.save_state(self.state)
+
+# compiled once, shared by all the MediatorStateMachine instances
+mediator_states = {
+    'new': [],
+    'ready': [],
+    'started': ['on_started'],
+    'requires_action': [],
+    'tools_executed': ['on_tools_executed'],
+    'tool_outputs_submitted': [],
+    'completed': ['on_completed'],
+    'running': [],
+    'failed': ['on_failed']
+}
+
+mediator_transitions = [
+    # the fastest way through the cycle, no actions
+    ('set_user_message', 'new', 'ready', ['_start_processing']),
+    ('started', 'ready', 'started', []),
+    ('assistant_message_retrieved', 'started', 'completed', ['_receive_asst_message']),
+
+    # the fastest way through the cycle, with actions
+    ('action_required', 'started', 'requires_action', ['_execute_tools']),
+    ('tools_executed', 'requires_action', 'tools_executed', ['_submit_tool_outputs']),
+    ('tool_outputs_submitted', 'tools_executed', 'tool_outputs_submitted', []),
+    ('assistant_message_retrieved', 'tool_outputs_submitted', 'completed', ['_receive_asst_message']),
+
+    # action after action
+    ('action_required', 'tool_outputs_submitted', 'requires_action', ['_execute_tools']),
+
+    # accomodate for the 'running' state (i.e.'in_progress' and 'queued')
+    ('action_required', 'running', 'requires_action', ['_execute_tools']),
+    ('assistant_message_retrieved', 'running', 'completed', ['_receive_asst_message']),
+    ('heartbeat', 'started', 'running', []),
+    ('heartbeat', 'tool_outputs_submitted', 'running', []),
+    ('heartbeat', 'running', 'running', []),
+
+    # a run can fail (or time out) at any point
+    ('run_failed', '*', 'failed', ['_receive_error']),
+
+    # restart
+    ('set_user_message', 'completed', 'ready', ['_start_processing']),
+    ('set_user_message', 'failed', 'ready', ['_start_processing']),
+]
+
+mediator_table = StateTable(mediator_states, mediator_transitions, on_enter_all=['_store_state'])
+
+# the triggers (set_user_message, started, heartbeat, ...) are added by mediator_table.bind
 class MediatorStateMachine():
 
     def __init__(self):
         self._subscriptions = []
-        self.initiate_state_machine()
-
-    def initiate_state_machine(self):
-        states = [
-            State(name='new'),
-            State(name='ready'),
-            State(name='started', on_enter=self.on_started),
-            State(name='requires_action'),
-            State(name='tools_executed', on_enter=self.on_tools_executed),
-            State(name='tool_outputs_submitted'),
-            State(name='completed', on_enter=self.on_completed),
-            State(name='running')
-        ]
-
-        machine = Machine( model=self, states=states, initial='new', send_event=False)
-        transition = machine.add_transition
-
-        # the fastest way through the cycle, no actions
-        transition('set_user_message', 'new', 'ready', after='_start_processing')
-        transition('started', 'ready', 'started')
-        transition('assistant_message_retrieved', 'started', 'completed', after='_receive_asst_message')
-
-        # the fastest way through the cycle, with actions
-        transition('action_required', 'started', 'requires_action', after='_execute_tools')
-        transition('tools_executed', 'requires_action', 'tools_executed', after='_submit_tool_outputs')
-        transition('tool_outputs_submitted', 'tools_executed', 'tool_outputs_submitted')
-        transition('assistant_message_retrieved', 'tool_outputs_submitted', 'completed', after='_receive_asst_message')
-
-        # action after action
-        transition('action_required', 'tool_outputs_submitted', 'requires_action', after='_execute_tools')
-
-        # accomodate for the 'running' state (i.e.'in_progress' and 'queued')
-        transition('action_required', 'running', 'requires_action', after='_execute_tools')
-        transition('assistant_message_retrieved', 'running', 'completed', after='_receive_asst_message')
-        transition('heartbeat', 'started', 'running')
-        transition('heartbeat', 'tool_outputs_submitted', 'running')
-        transition('heartbeat', 'running', 'running')
-
-        # restart
-        transition('set_user_message', 'completed', 'ready', after='_start_processing')
-
-        for state in states:
-            state.on_enter.append(self._store_state)
-
-        self.machine = machine
+        self.events = events.EventBus()
+        self.state = 'new'
+        self.transition_tasks = []
 
     def set_proxies(self, asst_proxy, user_proxy):
         self.user_proxy = user_proxy
         self.asst_proxy = asst_proxy
 
-    def _start_processing(self, evt):
-        self.asst_proxy.start_processing(evt)
+    async def _start_processing(self, evt):
+        await self.asst_proxy.start_processing(evt)
 
     def _receive_asst_message(self, evt):
         self.user_proxy.set_asst_message(evt)
 
-    def _execute_tools(self, evt):
-        self.user_proxy.execute_tools(evt)
+    def _receive_error(self, error):
+        self.user_proxy.set_error(error)
+
+    # not a transition: text deltas arrive while 'running'
+    async def text_delta(self, delta):
+        self.user_proxy.add_text_delta(delta)
+        await publish(self, events.TextDelta, delta)
 
-    def _submit_tool_outputs(self, evt):
-        self.asst_proxy.submit_tool_outputs(evt)
+    async def cancel(self):
+        await self.asst_proxy.cancel_processing()
+        await self.run_failed(Exception("Run cancelled"))
+
+    async def _execute_tools(self, evt):
+        await self.user_proxy.execute_tools(evt)
+
+    async def _submit_tool_outputs(self, evt):
+        await self.asst_proxy.submit_tool_outputs(evt)
 
     def _store_state(self, *args):
         #print(f"**state**: {self.state}")
         run_id = self.asst_proxy.run_id or "TBD"
         store(XRunDetail(run_id=run_id, type="state_change", output=self.state))
+        self.asst_proxy.save_state(self.state)
 
-    def on_completed(self, asst_message):
-        pub.sendMessage("retrievedMessage", evt="📡 Retrieved message : " + asst_message)
+    async def on_completed(self, asst_message):
+        await publish(self, events.RetrievedMessage, asst_message)
 
-    def on_started(self, user_message):
-        pub.sendMessage("sentMessage", evt=f"📡 Sent message, run_id {self.asst_proxy.run_id}: {user_message}")
+    async def on_failed(self, error):
+        await publish(self, events.RunError, error)
 
-    def on_tools_executed(self, results):
+    async def on_started(self, user_message):
+        await publish(self, events.SentMessage, user_message)
+
+    async def on_tools_executed(self, results):
         for result in results:
-            function_name = result["function_name"]
-            arguments = result["arguments"]
-            output = json.dumps(result["output"])
-            pub.sendMessage("executedTool", evt=f"🔧 {function_name} 🔧 : {arguments} ➡️ {output}")
\ No newline at end of file
+            await publish(self, events.ExecutedTool, result["call_id"], result["function_name"], result["arguments"],
+                          result["output"])
+
+mediator_table.bind(MediatorStateMachine)
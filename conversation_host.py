@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import conversation
+
+load_dotenv()
+
+
+class HostedConversation():
+    def __init__(self, user_proxy):
+        self.user_proxy = user_proxy
+        self.last_used = time.monotonic()
+
+    @property
+    def thread_id(self):
+        return self.user_proxy.mediator.asst_proxy.thread_id
+
+    def busy(self):
+        asst_proxy = self.user_proxy.mediator.asst_proxy
+        return any(task is not None and not task.done() for task in [self.user_proxy.task, asst_proxy.task])
+
+
+# Hosts many concurrent conversations in one asyncio process, keyed by thread_id.
+# Events are delivered to the subscribers of each conversation only, see events.EventBus.
+# Conversations idle for longer than idle_timeout are evicted, and so are the least recently used idle
+# ones when more than max_conversations are retained; an evicted conversation can be resumed with
+# the same thread_id, as its history lives in the OpenAI thread.
+# max_conversations caps a count, not bytes: a conversation keeps its proxies, its last reply and the events
+# queued for its subscribers (20-50 KiB each in benchmarks.host_load, more with long replies or slow
+# subscribers), and busy conversations are not evicted, so the count can go above the cap while they finish.
+class ConversationHost():
+    def __init__(self, max_conversations=None, idle_timeout=None, sweep_interval=60):
+        self.max_conversations = max_conversations or int(os.environ.get("HOST_MAX_CONVERSATIONS", 10000))
+        self.idle_timeout = idle_timeout or float(os.environ.get("HOST_IDLE_TIMEOUT", 1800))
+        self.sweep_interval = sweep_interval
+        self.conversations = OrderedDict()
+        self.evictions = 0
+        self.sweeper = None
+        # a host starts conversations all along, see warm_threads
+        conversation.thread_pool.enable()
+
+    async def start_conversation(self, asst_id):
+        user_proxy = await conversation.start_conversation(asst_id)
+        return self.add(user_proxy)
+
+    # asst_id: None to take the assistant from the conversation's run record
+    def resume_conversation(self, asst_id, thread_id):
+        # with a run store, the conversation continues from its saved run state
+        state = conversation.run_states.get(thread_id) if conversation.run_states else None
+        if state:
+            return self.add(conversation.restore_conversation(state))
+        if asst_id is None:
+            raise KeyError(f"No run state for conversation: {thread_id}")
+        mediator = conversation.get_default_mediator()
+        user_proxy = conversation.UserProxy(mediator)
+        asst_proxy = conversation.AssistantProxy(mediator, asst_id)
+        asst_proxy.thread_id = thread_id
+        mediator.set_proxies(asst_proxy, user_proxy)
+        return self.add(user_proxy)
+
+    def add(self, user_proxy):
+        hosted = HostedConversation(user_proxy)
+        self.conversations[hosted.thread_id] = hosted
+        self.enforce_limit()
+        if self.sweeper is None:
+            self.sweeper = asyncio.create_task(self.sweep())
+        return hosted.thread_id
+
+    # resumes the runs left under way (e.g. by a crashed worker) in the run store, for the conversations of
+    # one shard, or all of them
+    def recover(self, shard=None, shards=None):
+        recovered = []
+        for state in conversation.run_states.active(shard, shards):
+            if state["thread_id"] in self.conversations:
+                continue
+            user_proxy = conversation.restore_conversation(state)
+            self.add(user_proxy)
+            conversation.resume_run(user_proxy)
+            recovered.append(state["thread_id"])
+        return recovered
+
+    def get(self, thread_id):
+        hosted = self.conversations.get(thread_id)
+        if hosted is None:
+            raise KeyError(f"Unknown or evicted conversation: {thread_id}")
+        hosted.last_used = time.monotonic()
+        self.conversations.move_to_end(thread_id)
+        return hosted.user_proxy
+
+    # topic: a topic or a list of topics; options: maxsize and overflow of the subscription's queue
+    def subscribe(self, thread_id, topic, listener, **options):
+        return self.get(thread_id).mediator.events.subscribe(topic, listener, **options)
+
+    async def send(self, thread_id, message):
+        user_proxy = self.get(thread_id)
+        user_proxy.send_user_message(message)
+        reply = await user_proxy.get_assistant_message()
+        self.conversations[thread_id].last_used = time.monotonic()
+        return reply
+
+    def evict(self, thread_id):
+        if self.conversations.pop(thread_id, None):
+            self.evictions += 1
+
+    def enforce_limit(self):
+        if len(self.conversations) <= self.max_conversations:
+            return
+        # the most recently used conversation, e.g. the one just added, is kept even when the others are busy
+        for thread_id, hosted in list(self.conversations.items())[:-1]:
+            if len(self.conversations) <= self.max_conversations:
+                break
+            if not hosted.busy():
+                self.evict(thread_id)
+
+    def evict_idle(self):
+        now = time.monotonic()
+        for thread_id, hosted in list(self.conversations.items()):
+            if now - hosted.last_used > self.idle_timeout and not hosted.busy():
+                self.evict(thread_id)
+
+    async def sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.evict_idle()
+
+    async def close(self):
+        if self.sweeper:
+            self.sweeper.cancel()
+            self.sweeper = None
+        self.conversations.clear()
+
+    def stats(self):
+        return {"conversations": len(self.conversations),
+                "busy": sum(1 for hosted in self.conversations.values() if hosted.busy()),
+                "evictions": self.evictions}
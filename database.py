@@ -1,9 +1,11 @@
-from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, Float, Index
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 
 import os
 
+from compact_storage import Compact, TYPES, STATES
+
 metadata = MetaData()
 
 folder_path = 'dbstorage'
@@ -13,7 +15,36 @@ if not os.path.exists(folder_path):
 # Create database instance
 DATABASE_URL = f"sqlite:///./{folder_path}/.db"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite settings suited to many concurrent writers: WAL lets readers run alongside the writer,
+# synchronous=NORMAL only fsyncs at checkpoints, and busy_timeout makes writers wait for the lock
+# instead of failing with "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # in KiB, i.e. 64 MB
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000
+}
+
+def create_db_engine(url, tuned=True):
+    if not tuned:
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 5},
+                           pool_size=int(os.environ.get("DB_POOL_SIZE", 10)),
+                           max_overflow=int(os.environ.get("DB_POOL_OVERFLOW", 20)))
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+engine = create_db_engine(DATABASE_URL, os.environ.get("DB_TUNING", "true").lower() == "true")
 
 conversations = Table(
     "conversations",
@@ -21,7 +52,9 @@ conversations = Table(
     Column("id", Integer, primary_key=True),
     Column("thread_id", String, nullable=False),  # ID returned by OpenAI API
     Column("default_assistant_id", String, nullable=False),
-    Column("created_at", DateTime, nullable=False)
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_conversations_thread_id", "thread_id"),
+    Index("ix_conversations_created_at", "created_at")
 )
 
 conversation_messages = Table(
@@ -31,7 +64,8 @@ conversation_messages = Table(
     Column("thread_id", String, nullable=False),  # ID returned by OpenAI API
     Column("source", String, nullable=False),
     Column("content", String, nullable=False),
-    Column("created_at", DateTime, nullable=False)
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_conversation_messages_thread_id_created_at", "thread_id", "created_at")
 )
 
 conversation_runs = Table(
@@ -41,7 +75,9 @@ conversation_runs = Table(
     Column("run_id", String, nullable=False),  # ID returned by OpenAI API
     Column("thread_id", String, nullable=False),  # ID returned by OpenAI API
     Column("assistant_id", String, nullable=False),
-    Column("created_at", DateTime, nullable=False)
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_runs_run_id", "run_id"),
+    Index("ix_runs_thread_id_created_at", "thread_id", "created_at")
 )
 
 run_details = Table(
@@ -49,15 +85,81 @@ run_details = Table(
     metadata,
     Column("id", Integer, primary_key=True),
     Column("run_id", String, nullable=False),  # ID returned by OpenAI API
-    Column("type", String, nullable=False),
+    # stored as codes / compressed with DB_COMPACT_STORAGE (see compact_storage), read back as strings
+    Column("type", Compact(TYPES), nullable=False),
     Column("tool", String, nullable=True),
-    Column("input", String, nullable=True),
-    Column("output", String, nullable=True),
-    Column("created_at", DateTime, nullable=False)
+    Column("input", Compact(compress=True), nullable=True),
+    Column("output", Compact(STATES, compress=True), nullable=True),
+    Column("created_at", DateTime, nullable=False),  # first seen, for a row standing for repeated events
+    # repeated check_run_status / state_change events with the same output are kept as one row (see db_access)
+    Column("seen_count", Integer, nullable=True),
+    Column("last_seen_at", DateTime, nullable=True),
+    Index("ix_run_details_run_id_created_at", "run_id", "created_at")
+)
+
+# Aggregates maintained incrementally as run_details rows are written (see run_metrics)
+run_summaries = Table(
+    "run_summaries",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("run_id", String, nullable=False, unique=True),  # ID returned by OpenAI API
+    Column("thread_id", String, nullable=True),  # ID returned by OpenAI API
+    Column("num_events", Integer, nullable=False),
+    Column("num_tool_calls", Integer, nullable=False),
+    Column("num_polls", Integer, nullable=False),
+    Column("state", String, nullable=True),  # current mediator state
+    Column("state_entered_at", DateTime, nullable=True),
+    Column("state_times", String, nullable=True),  # JSON: seconds spent in each mediator state
+    Column("started_at", DateTime, nullable=False),
+    Column("ended_at", DateTime, nullable=False),
+    Column("duration", Float, nullable=False),  # seconds from the first to the last event
+    Column("rolled_up_at", DateTime, nullable=True),  # when the run's details were deleted (see db_maintenance)
+    Index("ix_run_summaries_thread_id", "thread_id")
+)
+
+conversation_summaries = Table(
+    "conversation_summaries",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("thread_id", String, nullable=False, unique=True),  # ID returned by OpenAI API
+    Column("num_runs", Integer, nullable=False),
+    Column("num_events", Integer, nullable=False),
+    Column("num_tool_calls", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=True),
+    Column("last_activity_at", DateTime, nullable=True)
+)
+
+# The current run of each conversation, so that any worker can resume it (see run_store)
+run_states = Table(
+    "run_states",
+    metadata,
+    Column("thread_id", String, primary_key=True),  # ID returned by OpenAI API
+    Column("assistant_id", String, nullable=False),
+    Column("run_id", String, nullable=True),  # ID returned by OpenAI API
+    Column("state", String, nullable=False),  # mediator state
+    Column("last_message_id", String, nullable=True),  # newest message of the thread seen so far
+    Column("asst_message", String, nullable=True),  # the last reply
+    Column("updated_at", DateTime, nullable=False),
+    Index("ix_run_states_state", "state")
 )
 
 def create_tables():
     metadata.create_all(bind=engine)
 
+# brings databases created before the indexes (or the nullable columns added since) up to date
+def migrate(bind=None):
+    bind = bind or engine
+    metadata.create_all(bind=bind)
+    with bind.begin() as connection:
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
 def get_engine():
     return engine
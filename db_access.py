@@ -1,22 +1,90 @@
+import atexit
+import os
+
 import pandas as pd
+from dotenv import load_dotenv
 
 import database
-from models import XConversation,  XRunDetail
+import db_writer
+import run_metrics
+from models import XConversation,  XRunDetail, XRun, XRunSummary, XConversationSummary
 from sqlalchemy import select
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 import datetime
 
 
+load_dotenv()
+
 engine = database.get_engine()
 
+# run and conversation summaries are updated in the same transaction as the rows they summarize
+on_write = run_metrics.apply if os.environ.get("RUN_METRICS", "true").lower() == "true" else None
+
+# with write-behind enabled, store() only queues the record and a background thread does the SQLite I/O
+writer = None
+if os.environ.get("DB_WRITE_BEHIND", "true").lower() == "true":
+    writer = db_writer.start(engine, int(os.environ.get("DB_WRITE_BATCH", 500)),
+                             float(os.environ.get("DB_WRITE_DELAY", 0.5)), on_write)
+
+# With compaction, a check_run_status or state_change event repeating the last one of its type for the run
+# (same output) is not written: the row of the first one is held back and counts the repeats instead, from
+# created_at (first seen) to last_seen_at. A held row is written once a different event of its type arrives
+# for the run, or when the run is released (see flush).
+compact = os.environ.get("DB_COMPACT_EVENTS", "true").lower() == "true"
+COMPACTED_TYPES = ["check_run_status", "state_change"]
+held = {}
+
 def store(data):
     data.created_at=datetime.datetime.now() #TODO
 
+    if compact and isinstance(data, XRunDetail) and data.type in COMPACTED_TYPES and data.run_id != "TBD":
+        key = (data.run_id, data.type)
+        last = held.get(key)
+        if last is not None and last.output == data.output:
+            last.seen_count += 1
+            last.last_seen_at = data.created_at
+            return
+        if last is not None:
+            write(last)
+        data.seen_count = 1
+        data.last_seen_at = data.created_at
+        held[key] = data
+        return
+
+    write(data)
+
+def write(data):
+    if writer:
+        writer.put(data)
+        return
+
     with Session(engine) as session:
         session.add(data)
+        if on_write:
+            on_write(session, [data])
         session.commit()
 
+# writes the rows held back for a run (all runs by default); a run's rows are looked up by key, as a host
+# holds the last rows of every conversation it keeps
+def release(run_id=None):
+    keys = list(held) if run_id is None else [(run_id, type) for type in COMPACTED_TYPES if (run_id, type) in held]
+    for key in keys:
+        write(held.pop(key))
+
+def flush(run_id=None):
+    release(run_id)
+    if writer:
+        writer.flush()
+
+async def flush_async(run_id=None):
+    release(run_id)
+    if writer:
+        await writer.flush_async()
+
+# runs before the write-behind queue is closed, as atexit calls run in reverse order
+atexit.register(release)
+
 def get_all(entity):
     session = Session(engine)
     stmt = select(entity)
@@ -44,3 +112,48 @@ def get_run_steps_as_df():
     df_data = pd.read_sql(stmt, con = session.bind)
     return df_data
 
+def get_run_summaries_as_df(run_ids=None):
+    session = Session(engine)
+    stmt = select(XRunSummary)
+    if run_ids is not None:
+        stmt = stmt.where(XRunSummary.run_id.in_(list(run_ids)))
+    df_data = pd.read_sql(stmt, con = session.bind)
+    return df_data
+
+def get_conversation_summaries_as_df(thread_ids=None):
+    session = Session(engine)
+    stmt = select(XConversationSummary)
+    if thread_ids is not None:
+        stmt = stmt.where(XConversationSummary.thread_id.in_(list(thread_ids)))
+    df_data = pd.read_sql(stmt, con = session.bind)
+    return df_data
+
+# Keyset pagination over conversations, newest first: the next page starts below the smallest id of
+# the current one, so a page costs the same however many conversations there are.
+def get_conversations_page_as_df(before_id=None, limit=10):
+    session = Session(engine)
+    stmt = select(XConversation).order_by(XConversation.id.desc()).limit(limit)
+    if before_id is not None:
+        stmt = stmt.where(XConversation.id < before_id)
+    df_data = pd.read_sql(stmt, con = session.bind)
+    return df_data
+
+def get_runs_as_df(thread_ids):
+    session = Session(engine)
+    stmt = select(XRun).where(XRun.thread_id.in_(list(thread_ids))).order_by(XRun.id)
+    df_data = pd.read_sql(stmt, con = session.bind)
+    return df_data
+
+def get_steps_as_df(run_ids):
+    session = Session(engine)
+    # held rows are written after the events that followed them, so rows are ordered by time
+    stmt = (select(XRunDetail).where(XRunDetail.run_id.in_(list(run_ids)))
+            .order_by(XRunDetail.created_at, XRunDetail.id))
+    df_data = pd.read_sql(stmt, con = session.bind)
+    return df_data
+
+# changes whenever rows are added, to invalidate cached history pages
+def get_history_version():
+    session = Session(engine)
+    return tuple(session.scalar(select(func.max(entity.id))) for entity in [XConversation, XRun, XRunDetail])
+
@@ -0,0 +1,77 @@
+import datetime
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete, func, bindparam
+from sqlalchemy.orm import Session
+
+import database
+import run_metrics
+from models import XRunDetail, XRunSummary
+
+load_dotenv()
+
+retention_days = float(os.environ.get("DB_RETENTION_DAYS", 30))
+
+
+# Rewrites run_details in the current storage format (see compact_storage), e.g. after turning
+# DB_COMPACT_STORAGE on for a database with rows written before. Returns the number of rows rewritten.
+def recode(engine, chunk_size=50000):
+    table = database.run_details
+    columns = [table.c.id, table.c.type, table.c.input, table.c.output]
+    # the SET clause comes from the parameters
+    statement = update(table).where(table.c.id == bindparam("_id"))
+    rewritten = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(select(*columns).where(table.c.id > last_id)
+                                      .order_by(table.c.id).limit(chunk_size)).all()
+            if not rows:
+                return rewritten
+            # the values are decoded when read, and encoded again when written
+            connection.execute(statement, [{"_id": row.id, "type": row.type, "input": row.input, "output": row.output}
+                                           for row in rows])
+        rewritten += len(rows)
+        last_id = rows[-1].id
+
+
+# Deletes the run_details of the runs whose last event is older than `days`, keeping their run summary
+# (event, tool call and poll counts, duration, time in each state) as the record of the run. Runs without
+# a summary (written with RUN_METRICS=false) get one from their rows first. Rows of no run yet ('TBD')
+# older than `days` are deleted too. Returns the number of runs and of rows deleted.
+def roll_up(engine, days=None, chunk_size=500):
+    now = datetime.datetime.now()
+    cutoff = now - datetime.timedelta(days=retention_days if days is None else days)
+    last_seen_at = func.coalesce(XRunDetail.last_seen_at, XRunDetail.created_at)
+    with Session(engine) as session:
+        run_ids = session.scalars(select(XRunDetail.run_id).where(XRunDetail.run_id != "TBD")
+                                  .group_by(XRunDetail.run_id).having(func.max(last_seen_at) < cutoff)).all()
+        deleted = session.execute(delete(XRunDetail).where(XRunDetail.run_id == "TBD", last_seen_at < cutoff)
+                                  .execution_options(synchronize_session=False)).rowcount
+        session.commit()
+
+    for start in range(0, len(run_ids), chunk_size):
+        chunk = run_ids[start:start + chunk_size]
+        with Session(engine) as session:
+            summarized = set(session.scalars(select(XRunSummary.run_id).where(XRunSummary.run_id.in_(chunk))))
+            missing = [run_id for run_id in chunk if run_id not in summarized]
+            if missing:
+                run_metrics.apply(session, session.scalars(
+                    select(XRunDetail).where(XRunDetail.run_id.in_(missing))
+                    .order_by(XRunDetail.created_at, XRunDetail.id)).all())
+                session.flush()
+            session.execute(update(XRunSummary).where(XRunSummary.run_id.in_(chunk)).values(rolled_up_at=now)
+                            .execution_options(synchronize_session=False))
+            deleted += session.execute(delete(XRunDetail).where(XRunDetail.run_id.in_(chunk))
+                                       .execution_options(synchronize_session=False)).rowcount
+            session.commit()
+    return len(run_ids), deleted
+
+
+# Rewrites the database file without the space freed by deleted rows, and empties the WAL file. It holds
+# the write lock until done, and needs as much free disk space as the database takes.
+def vacuum(engine):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("VACUUM")
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
@@ -1,4 +1,21 @@
-from database import create_tables
+import sys
+
+from database import migrate, get_engine
+import db_maintenance
+import run_metrics
 
 if __name__ == '__main__':
-    create_tables()
\ No newline at end of file
+    # creates the schema, or adds what is missing (e.g. indexes) to an existing database
+    migrate()
+    if "--rebuild-summaries" in sys.argv:
+        # recomputes run_summaries and conversation_summaries from the audit tables
+        run_metrics.rebuild(get_engine())
+    if "--recode" in sys.argv:
+        # rewrites run_details in the storage format set by DB_COMPACT_STORAGE
+        print(f"{db_maintenance.recode(get_engine())} run_details rows rewritten")
+    if "--retention" in sys.argv:
+        # deletes the run_details of runs older than DB_RETENTION_DAYS, keeping their run summaries
+        runs, rows = db_maintenance.roll_up(get_engine())
+        print(f"{rows} run_details rows of {runs} runs rolled up")
+    if "--recode" in sys.argv or "--retention" in sys.argv:
+        db_maintenance.vacuum(get_engine())
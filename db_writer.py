@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.orm import Session
+
+
+# Buffers ORM records and writes them from a background thread, in one transaction per batch.
+# A batch is written when it reaches max_batch records or when its oldest record is max_delay seconds old.
+class WriteBehindQueue():
+    def __init__(self, engine, max_batch=500, max_delay=0.5, on_write=None):
+        self.engine = engine
+        self.on_write = on_write  # called with (session, batch) before each batch is committed
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.rows_written = 0
+        self.batches_written = 0
+        self.failures = 0  # failed commits
+        self.rows_dropped = 0  # rows that could not be written at all
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self.worker.start()
+
+    def put(self, data):
+        if self.closed:
+            raise Exception("Write-behind queue is closed")
+        self.queue.put(data)
+
+    # blocks until every record queued before the call has been written
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    # the same, awaited on the event loop rather than holding a thread of its executor
+    async def flush_async(self):
+        done = Future()
+        self.queue.put(done)
+        await asyncio.wrap_future(done)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.worker.join()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write(batch)
+                batch, deadline = [], None
+                continue
+
+            # None shuts the worker down, an Event or a Future is a flush request
+            if item is None or isinstance(item, (threading.Event, Future)):
+                requests = [item]
+                # the records and flush requests queued meanwhile (e.g. by turns ending together) are written
+                # in the same transaction
+                while item is not None and len(batch) < self.max_batch:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None or isinstance(item, (threading.Event, Future)):
+                        requests.append(item)
+                    else:
+                        batch.append(item)
+                self._write(batch)
+                batch, deadline = [], None
+                for request in requests:
+                    if isinstance(request, threading.Event):
+                        request.set()
+                    elif request is not None and request.set_running_or_notify_cancel():
+                        request.set_result(None)
+                if None in requests:
+                    return
+                continue
+
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.max_delay
+            if len(batch) >= self.max_batch:
+                self._write(batch)
+                batch, deadline = [], None
+
+    # A batch that fails (e.g. the database is locked) is tried again once; if it fails again, its rows are
+    # written one by one, so that a bad row only loses itself.
+    def _write(self, batch, retry_delay=0.5):
+        if not batch:
+            return
+        if self._commit(batch):
+            return
+        time.sleep(retry_delay)
+        if self._commit(batch):
+            return
+        for record in batch:
+            if not self._commit([record]):
+                self.rows_dropped += 1
+                values = {key: value for key, value in vars(record).items() if not key.startswith("_")}
+                logging.error(f"Dropped {type(record).__name__} row: {values}")
+
+    def _commit(self, batch):
+        try:
+            with Session(self.engine, expire_on_commit=False) as session:
+                session.add_all(batch)
+                if self.on_write:
+                    self.on_write(session, batch)
+                session.commit()
+        except Exception:
+            # the session's rollback leaves the records as they were before being added, to be added again
+            self.failures += 1
+            logging.exception(f"Writing {len(batch)} rows failed")
+            return False
+        self.rows_written += len(batch)
+        self.batches_written += 1
+        return True
+
+
+def start(engine, max_batch=500, max_delay=0.5, on_write=None):
+    writer = WriteBehindQueue(engine, max_batch, max_delay, on_write)
+    atexit.register(writer.close)
+    return writer
@@ -0,0 +1,194 @@
+import asyncio
+import json
+import time
+import traceback
+from collections import deque
+
+
+# Events published by a mediator about its conversation. They carry the data, not the text: format()
+# (and str()) renders the message shown in the apps, and only runs for the subscribers that ask for it.
+class Event():
+    topic = None
+    __slots__ = ["thread_id", "run_id", "created_at"]
+
+    def __init__(self, thread_id, run_id):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.created_at = time.time()
+
+    def format(self):
+        return self.topic
+
+    def __str__(self):
+        return self.format()
+
+
+class SentMessage(Event):
+    topic = "sentMessage"
+    __slots__ = ["message"]
+
+    def __init__(self, thread_id, run_id, message):
+        super().__init__(thread_id, run_id)
+        self.message = message
+
+    def format(self):
+        return f"📡 Sent message, run_id {self.run_id}: {self.message}"
+
+
+class ExecutedTool(Event):
+    topic = "executedTool"
+    __slots__ = ["call_id", "function_name", "arguments", "output"]
+
+    def __init__(self, thread_id, run_id, call_id, function_name, arguments, output):
+        super().__init__(thread_id, run_id)
+        self.call_id = call_id
+        self.function_name = function_name
+        self.arguments = arguments
+        self.output = output
+
+    def format(self):
+        return f"🔧 {self.function_name} 🔧 : {self.arguments} ➡️ {json.dumps(self.output)}"
+
+
+class RetrievedMessage(Event):
+    topic = "retrievedMessage"
+    __slots__ = ["message"]
+
+    def __init__(self, thread_id, run_id, message):
+        super().__init__(thread_id, run_id)
+        self.message = message
+
+    def format(self):
+        return "📡 Retrieved message : " + self.message
+
+
+class TextDelta(Event):
+    topic = "textDelta"
+    __slots__ = ["delta"]
+
+    def __init__(self, thread_id, run_id, delta):
+        super().__init__(thread_id, run_id)
+        self.delta = delta
+
+    def format(self):
+        return self.delta
+
+
+class RunError(Event):
+    topic = "error"
+    __slots__ = ["error"]
+
+    def __init__(self, thread_id, run_id, error):
+        super().__init__(thread_id, run_id)
+        self.error = error
+
+    def format(self):
+        return f"❌ Run {self.run_id} failed: {self.error}"
+
+
+TOPICS = [event_type.topic for event_type in [SentMessage, ExecutedTool, RetrievedMessage, TextDelta, RunError]]
+
+
+# A subscriber's bounded queue, drained by its own task so that a slow handler never runs on the
+# publisher's path. When the queue is full, the oldest event is dropped ("drop_oldest"), or the publisher
+# waits for the subscriber to catch up ("wait"). The drain task only lives while there are events to
+# deliver, and is started on the running loop, so an idle subscriber costs no task.
+class Subscription():
+    def __init__(self, bus, topics, handler, maxsize=100, overflow="drop_oldest"):
+        if overflow not in ["drop_oldest", "wait"]:
+            raise Exception(f"Unknown overflow policy: {overflow}")
+        self.bus = bus
+        self.topics = topics
+        self.handler = handler
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.queue = deque()
+        self.task = None
+        self.space = None
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_queued = 0
+
+    async def put(self, event):
+        while len(self.queue) >= self.maxsize:
+            if self.overflow == "drop_oldest":
+                self.queue.popleft()
+                self.dropped += 1
+            else:
+                self.start()
+                if self.space is None or self.space.done():
+                    self.space = asyncio.get_running_loop().create_future()
+                await self.space
+        self.queue.append(event)
+        self.max_queued = max(self.max_queued, len(self.queue))
+        self.start()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.drain())
+
+    async def drain(self):
+        while self.queue:
+            event = self.queue.popleft()
+            if self.space is not None and not self.space.done():
+                self.space.set_result(None)
+            try:
+                result = self.handler(event)
+                if asyncio.iscoroutine(result):
+                    await result
+                self.delivered += 1
+            except Exception:
+                self.errors += 1
+                print(traceback.format_exc())
+
+    # waits until the events queued so far are delivered
+    async def join(self):
+        while self.task is not None and not self.task.done():
+            await asyncio.shield(self.task)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def stats(self):
+        return {"topics": self.topics, "queued": len(self.queue), "max_queued": self.max_queued,
+                "delivered": self.delivered, "dropped": self.dropped, "errors": self.errors}
+
+
+# The events of one conversation, indexed by topic: publishing only reaches the subscribers of that
+# conversation and topic, and costs nothing (not even the event object) when there are none.
+class EventBus():
+    def __init__(self):
+        self.subscriptions = {}
+
+    # handler(event), sync or async; one subscription (and queue) can cover several topics
+    def subscribe(self, topics, handler, maxsize=100, overflow="drop_oldest"):
+        topics = [topics] if isinstance(topics, str) else list(topics)
+        subscription = Subscription(self, topics, handler, maxsize, overflow)
+        for topic in topics:
+            self.subscriptions.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for topic in subscription.topics:
+            subscribers = self.subscriptions.get(topic, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+
+    def has_subscribers(self, topic):
+        return bool(self.subscriptions.get(topic))
+
+    async def publish(self, event):
+        for subscription in self.subscriptions.get(event.topic, []):
+            await subscription.put(event)
+
+    def all_subscriptions(self):
+        return list({id(subscription): subscription
+                     for subscribers in self.subscriptions.values() for subscription in subscribers}.values())
+
+    async def join(self):
+        for subscription in self.all_subscriptions():
+            await subscription.join()
+
+    def stats(self):
+        return [subscription.stats() for subscription in self.all_subscriptions()]
@@ -1,18 +1,80 @@
+import os
 from random import randint
 
 import yfinance as yf
 
+from function_tools.tool_cache import ToolCache
+from function_tools.tool_runtime import ToolRuntime
+
+# sync I/O-bound tools run on a bounded thread pool so that their blocking I/O stays off the event loop,
+# CPU-bound ones on a process pool, see ToolRuntime
+runtime = ToolRuntime(threads=int(os.environ.get("TOOL_THREADS", 8)),
+                      processes=int(os.environ["TOOL_PROCESSES"]) if os.environ.get("TOOL_PROCESSES") else None,
+                      default_timeout=float(os.environ.get("TOOL_TIMEOUT", 30)))
+
+# the same few tickers get asked about over and over, across conversations
+cache = ToolCache(maxsize=int(os.environ.get("TOOL_CACHE_SIZE", 1024)),
+                  ttls={"get_stock_price": float(os.environ.get("STOCK_PRICE_TTL", 60))})
+
+def get_function(name):
+    return runtime.get(name).func
+
 def execute_function(name, arguments):
-    funcs = {"get_stock_price": get_stock_price, "buy_or_sell": buy_or_sell}
-    if name in funcs.keys():
-        func = funcs[name]
-        return func(**arguments)
-    else:
-        raise Exception(f"Unknown function: {name}")
+    return runtime.execute_sync(name, arguments)
+
+async def execute_function_async(name, arguments):
+    return await runtime.execute(name, arguments)
+
+# Batching stage for the calls of one run step: all the stock prices the step asks for are fetched with
+# one request and seeded into the cache, where the individual get_stock_price calls then find them.
+# The batch runs as a get_stock_price call (its slots, timeout and stats), and not at all without caching.
+# Failures are ignored here; the individual calls fetch (and report errors) on their own.
+async def prefetch_async(calls):
+    # calls with a malformed symbol are left to get_stock_price, which reports the error for that call only
+    symbols = [arguments["symbol"].upper() for name, arguments in calls
+               if name == "get_stock_price" and isinstance(arguments.get("symbol"), str)]
+    if len(symbols) < 2 or cache.ttl("get_stock_price") <= 0:
+        return
+    try:
+        await runtime.execute("get_stock_price", {"symbols": symbols}, func=prefetch_stock_prices)
+    except Exception:
+        pass
+
+def prefetch_stock_prices(symbols):
+    return cache.get_many_or_load("get_stock_price", symbols, get_stock_prices)
+
+class YahooPriceProvider():
+    def get_price(self, symbol):
+        stock = yf.Ticker(symbol)
+        return stock.history(period="1d")['Close'].iloc[-1]
+
+    # one multi-symbol download instead of a request per symbol
+    def get_prices(self, symbols):
+        if len(symbols) == 1:
+            return {symbols[0]: self.get_price(symbols[0])}
+        closes = yf.download(symbols, period="1d", progress=False)['Close']
+        prices = {}
+        for symbol in symbols:
+            if symbol in closes and not closes[symbol].dropna().empty:
+                prices[symbol] = closes[symbol].dropna().iloc[-1]
+        return prices
+
+price_provider = YahooPriceProvider()
+
+# any object with get_price(symbol), and optionally get_prices(symbols), e.g. a fake provider for offline runs
+def set_price_provider(provider):
+    global price_provider
+    price_provider = provider
+    cache.clear()
+
+def get_stock_prices(symbols):
+    if hasattr(price_provider, "get_prices"):
+        return price_provider.get_prices(symbols)
+    return {symbol: price_provider.get_price(symbol) for symbol in symbols}
 
 def get_stock_price(symbol: str) -> float:
-    stock = yf.Ticker(symbol)
-    price = stock.history(period="1d")['Close'].iloc[-1]
+    symbol = symbol.upper()
+    price = cache.get_or_load("get_stock_price", symbol, lambda: price_provider.get_price(symbol))
     #print("function get_stock_price got called")
     return price
 
@@ -23,6 +85,6 @@ def buy_or_sell(symbol:str, price:str):
         case 2 : return "sell"
         case 3 : return "hold"
 
-
-
-
+runtime.register("get_stock_price", get_stock_price, kind="io",
+                 max_concurrency=int(os.environ.get("STOCK_PRICE_CONCURRENCY", 4)), timeout=10)
+runtime.register("buy_or_sell", buy_or_sell, kind="light", timeout=5)
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+# Thread-safe LRU cache for tool results with per-tool TTLs. Concurrent misses for the same key are
+# coalesced: the first caller loads the value, the others wait for its result (single flight).
+class ToolCache():
+    def __init__(self, maxsize=1024, ttls=None, default_ttl=0):
+        self.maxsize = maxsize
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()  # (tool, key) -> (expires_at, value)
+        self.inflight = {}  # (tool, key) -> Future
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def ttl(self, tool):
+        return self.ttls.get(tool, self.default_ttl)
+
+    def get_or_load(self, tool, key, load):
+        ttl = self.ttl(tool)
+        if ttl <= 0:
+            return load()
+
+        cache_key = (tool, key)
+        leader = False
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            future = self.inflight.get(cache_key)
+            if future:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                future = self.inflight[cache_key] = Future()
+                leader = True
+        if not leader:
+            return future.result()
+
+        try:
+            value = load()
+        except Exception as e:
+            with self.lock:
+                del self.inflight[cache_key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self._put(cache_key, value, ttl)
+            del self.inflight[cache_key]
+        future.set_result(value)
+        return value
+
+    # batch variant of get_or_load: keys that are neither cached nor being loaded are loaded with a single
+    # load_many(keys) call, which returns a dict; returns the values found for the requested keys
+    def get_many_or_load(self, tool, keys, load_many):
+        ttl = self.ttl(tool)
+        if ttl <= 0:
+            return load_many(list(keys))
+
+        values = {}
+        waiting = {}
+        loading = {}
+        with self.lock:
+            now = time.monotonic()
+            for key in dict.fromkeys(keys):
+                cache_key = (tool, key)
+                entry = self.entries.get(cache_key)
+                if entry and entry[0] > now:
+                    self.entries.move_to_end(cache_key)
+                    self.hits += 1
+                    values[key] = entry[1]
+                elif cache_key in self.inflight:
+                    self.coalesced += 1
+                    waiting[key] = self.inflight[cache_key]
+                else:
+                    self.misses += 1
+                    loading[key] = self.inflight[cache_key] = Future()
+
+        if loading:
+            try:
+                loaded = load_many(list(loading.keys()))
+            except Exception as e:
+                loaded = {}
+                error = e
+            else:
+                error = None
+            with self.lock:
+                for key in loading:
+                    del self.inflight[(tool, key)]
+                    if key in loaded:
+                        self._put((tool, key), loaded[key], ttl)
+            for key, future in loading.items():
+                if key in loaded:
+                    values[key] = loaded[key]
+                    future.set_result(loaded[key])
+                else:
+                    future.set_exception(error or KeyError(key))
+
+        for key, future in waiting.items():
+            try:
+                values[key] = future.result()
+            except Exception:
+                pass
+        return values
+
+    def _put(self, cache_key, value, ttl):
+        self.entries[cache_key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(cache_key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "evictions": self.evictions, "size": len(self.entries)}
@@ -0,0 +1,170 @@
+import asyncio
+import inspect
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import tracing
+
+KINDS = ["io", "cpu", "light"]
+
+
+# A tool as declared to the runtime. kind tells where a sync function runs: "io" (blocking I/O) on the
+# thread pool, "cpu" (CPU-heavy; the function and its arguments must be picklable) on the process pool,
+# "light" (quick, non-blocking) on the event loop itself. Async functions always run on the event loop.
+class Tool():
+    def __init__(self, name, func, kind="io", max_concurrency=None, timeout=None):
+        if kind not in KINDS:
+            raise Exception(f"Unknown tool kind: {kind}")
+        self.name = name
+        self.func = func
+        self.is_async = inspect.iscoroutinefunction(func)
+        self.kind = kind
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.calls = 0
+        self.running = 0
+        self.waiting = 0
+        self.max_running = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.errors = 0
+
+    def stats(self):
+        return {"kind": "async" if self.is_async else self.kind, "max_concurrency": self.max_concurrency,
+                "calls": self.calls, "running": self.running, "waiting": self.waiting,
+                "max_running": self.max_running, "wait_time": self.wait_time, "timeouts": self.timeouts,
+                "errors": self.errors,
+                "saturation": self.running / self.max_concurrency if self.max_concurrency else None}
+
+
+# Registry of the tools the assistants can call, and the executors they run on. Each tool runs at most
+# max_concurrency calls at a time (further calls wait for a slot), and each call is given `timeout` seconds,
+# including the wait, so a slow or saturated tool only holds up the calls to it, not the event loop.
+class ToolRuntime():
+    def __init__(self, threads=8, processes=None, default_timeout=30):
+        self.tools = {}
+        self.default_timeout = default_timeout
+        self.thread_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="tool")
+        self.threads = threads
+        self.processes = processes
+        self.process_pool = None
+        self.pool_lock = threading.Lock()
+        # slots belong to the event loop they were created on, see openai_async_access.open_client
+        self.slots = {}
+        self.slots_loop = None
+
+    def register(self, name, func, kind="io", max_concurrency=None, timeout=None):
+        self.tools[name] = Tool(name, func, kind, max_concurrency, timeout)
+        return func
+
+    # decorator form of register, the tool taking the function's name
+    def tool(self, kind="io", max_concurrency=None, timeout=None):
+        def decorate(func):
+            return self.register(func.__name__, func, kind, max_concurrency, timeout)
+        return decorate
+
+    def get(self, name):
+        if name not in self.tools:
+            raise Exception(f"Unknown function: {name}")
+        return self.tools[name]
+
+    def timeout(self, name):
+        return self.get(name).timeout or self.default_timeout
+
+    def get_process_pool(self):
+        with self.pool_lock:
+            if self.process_pool is None:
+                # spawned rather than forked, as the process already runs threads
+                self.process_pool = ProcessPoolExecutor(max_workers=self.processes,
+                                                        mp_context=multiprocessing.get_context("spawn"))
+            return self.process_pool
+
+    def get_slots(self, tool):
+        loop = asyncio.get_running_loop()
+        if self.slots_loop is not loop:
+            self.slots = {}
+            self.slots_loop = loop
+        if tool.name not in self.slots:
+            self.slots[tool.name] = asyncio.Semaphore(tool.max_concurrency)
+        return self.slots[tool.name]
+
+    # func, when given, runs instead of the tool's function (e.g. a batched variant of it), taking up the
+    # tool's slots, timeout and stats all the same
+    async def execute(self, name, arguments, func=None):
+        tool = self.get(name)
+        tool.calls += 1
+        try:
+            return await asyncio.wait_for(self._execute(tool, arguments, func or tool.func), self.timeout(name))
+        except asyncio.TimeoutError:
+            tool.timeouts += 1
+            raise
+        except Exception:
+            tool.errors += 1
+            raise
+
+    async def _execute(self, tool, arguments, func):
+        slots = None
+        if tool.max_concurrency is not None:
+            slots = self.get_slots(tool)
+            tool.waiting += 1
+            queued_at = time.perf_counter()
+            try:
+                await slots.acquire()
+            finally:
+                tool.waiting -= 1
+            waited = time.perf_counter() - queued_at
+            tool.wait_time += waited
+            tracing.observe("tool_wait", waited, tool=tool.name)
+        tool.running += 1
+        tool.max_running = max(tool.max_running, tool.running)
+
+        def release():
+            tool.running -= 1
+            if slots is not None:
+                slots.release()
+        return await self._run(tool, arguments, func, release)
+
+    async def _run(self, tool, arguments, func, release):
+        if inspect.iscoroutinefunction(func) or tool.kind == "light":
+            try:
+                if inspect.iscoroutinefunction(func):
+                    return await func(**arguments)
+                return func(**arguments)
+            finally:
+                release()
+        loop = asyncio.get_running_loop()
+        try:
+            executor = self.get_process_pool() if tool.kind == "cpu" else self.thread_pool
+            future = executor.submit(call, func, arguments)
+        except BaseException:
+            release()
+            raise
+        # A call that times out is not stopped: its thread (or process) goes on, so it keeps its slot and counts
+        # as running until it is done. Calls still queued in the executor are cancelled.
+        future.add_done_callback(lambda done: release_on(loop, release))
+        return await asyncio.wrap_future(future)
+
+    # calls outside an event loop, e.g. from scripts
+    def execute_sync(self, name, arguments):
+        tool = self.get(name)
+        if tool.is_async:
+            return asyncio.run(tool.func(**arguments))
+        return tool.func(**arguments)
+
+    def stats(self):
+        return {name: tool.stats() for name, tool in self.tools.items()}
+
+
+# runs release on the event loop, from the executor's thread; once the loop is closed, its slots are gone
+def release_on(loop, release):
+    try:
+        loop.call_soon_threadsafe(release)
+    except RuntimeError:
+        release()
+
+
+# module-level, so that it can be sent to the process pool
+def call(func, arguments):
+    return func(**arguments)
@@ -0,0 +1,57 @@
+import db_access
+from models import XRunDetail, XRun, XConversation
+
+
+# Builds the conversation -> runs -> steps hierarchy shown by the history page: each conversation row
+# gets its runs (and counts), each run row its steps. Rows are grouped with one pass over each table,
+# instead of a filter over all steps per run and over all runs per conversation.
+def load_history_data():
+    return build_history(db_access.get_all_as_df(XConversation), db_access.get_all_as_df(XRun),
+                         db_access.get_all_as_df(XRunDetail), db_access.get_run_summaries_as_df(),
+                         db_access.get_conversation_summaries_as_df())
+
+# one page of the history, loading only the runs and steps of the conversations on that page
+def load_history_page(before_id=None, limit=10):
+    conversations = db_access.get_conversations_page_as_df(before_id, limit)
+    runs = db_access.get_runs_as_df(conversations["thread_id"])
+    steps = db_access.get_steps_as_df(runs["run_id"])
+    return build_history(conversations, runs, steps, db_access.get_run_summaries_as_df(runs["run_id"]),
+                         db_access.get_conversation_summaries_as_df(conversations["thread_id"]))
+
+# The counts come from the run and conversation summaries (see run_metrics), which still count the events of
+# rolled-up runs. Runs and conversations without a summary (written with RUN_METRICS=false) are counted
+# from their rows.
+def build_history(conversations, runs, steps, run_summaries=None, conversation_summaries=None):
+    runs = runs.copy()
+    runs["steps"] = nest(runs, steps, "run_id")
+    # a compacted row stands for seen_count events (see db_access.store)
+    events_per_run = steps["seen_count"].fillna(1).groupby(steps["run_id"]).sum()
+    runs["num_events"] = summarized(runs, "run_id", run_summaries, "num_events", events_per_run)
+
+    conversations = conversations.copy()
+    conversations["runs"] = nest(conversations, runs, "thread_id")
+    runs_per_thread = runs.groupby("thread_id").size()
+    conversations["num_runs"] = summarized(conversations, "thread_id", conversation_summaries, "num_runs",
+                                           runs_per_thread)
+    events_per_thread = runs.groupby("thread_id")["num_events"].sum()
+    conversations["num_events"] = summarized(conversations, "thread_id", conversation_summaries, "num_events",
+                                             events_per_thread)
+    return conversations
+
+# `column` of each row's summary, or of `counted` (indexed by `key`) for rows without one
+def summarized(rows, key, summaries, column, counted):
+    values = rows[key].map(counted)
+    if summaries is not None:
+        values = rows[key].map(summaries.set_index(key)[column]).fillna(values)
+    return values.fillna(0).astype(int)
+
+# the rows of `children` matching each row of `parents` on `key`, as data frames
+def nest(parents, children, key):
+    empty = children.iloc[0:0]
+    groups = dict(tuple(children.groupby(key, sort=False)))
+    return [groups.get(value, empty) for value in parents[key]]
+
+# one row per recorded event, repeating each compacted row seen_count times (see db_access.store)
+def expand_steps(steps):
+    counts = steps["seen_count"].fillna(1).astype(int)
+    return steps.loc[steps.index.repeat(counts)].reset_index(drop=True)
@@ -17,9 +17,17 @@ class XMessage:
 class XRunDetail:
     pass
 
+class XRunSummary:
+    pass
+
+class XConversationSummary:
+    pass
+
 mapper_registry = registry()
 
 mapper_registry.map_imperatively(XConversation, database.conversations)
 mapper_registry.map_imperatively(XMessage, database.conversation_messages)
 mapper_registry.map_imperatively(XRun, database.conversation_runs)
-mapper_registry.map_imperatively(XRunDetail, database.run_details)
\ No newline at end of file
+mapper_registry.map_imperatively(XRunDetail, database.run_details)
+mapper_registry.map_imperatively(XRunSummary, database.run_summaries)
+mapper_registry.map_imperatively(XConversationSummary, database.conversation_summaries)
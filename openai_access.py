@@ -1,55 +1,115 @@
+import functools
 import os
 
+import openai._models
+import pydantic
 from dotenv import load_dotenv
 from openai import OpenAI
 
+import request_policy
+import tracing
+
 load_dotenv()
 
+
+# openai 1.3 builds a new pydantic TypeAdapter (a schema compile, 0.3-0.7 ms) for every union or
+# Optional[object] field of every response it parses: in a ConversationHost, event-loop time on every API
+# call. An adapter depends on the type only, so one is built per type, as later openai releases do.
+@functools.lru_cache(maxsize=None)
+def type_adapter(type_):
+    return pydantic.TypeAdapter(type_)
+
+
+def validate_non_model_type(*, type_, value):
+    return type_adapter(type_).validate_python(value)
+
+
+if getattr(openai._models, "PYDANTIC_V2", False) and hasattr(openai._models, "_validate_non_model_type"):
+    openai._models._validate_non_model_type = validate_non_model_type
+
 openai_api_key = os.environ["OPENAI_API_KEY"]
-client: OpenAI = OpenAI(api_key=openai_api_key)
+# retries are left to request_policy
+client: OpenAI = OpenAI(api_key=openai_api_key, max_retries=0)
 
 
 def get_oai_client():
     return client
 
 
+@request_policy.guarded(read=True)
+@tracing.traced("api.get_assistant")
 def get_assistant(id):
     return client.beta.assistants.retrieve(id)
 
 
-def list_messages(thread_id):
-    messages = client.beta.threads.messages.list(thread_id, limit=100, order="asc")
+# all the content parts of a message, as text
+def message_text(msg):
+    parts = []
+    for content in msg.content:
+        if content.type == "text":
+            parts.append(content.text.value)
+        elif content.type == "image_file":
+            parts.append(f"[image file: {content.image_file.file_id}]")
+    return "\n\n".join(parts)
+
+
+# messages in chronological order; with `after`, only those newer than that message id
+@request_policy.guarded(read=True)
+@tracing.traced("api.list_messages")
+def list_messages(thread_id, after=None):
+    params = {"after": after} if after else {}
+    messages = client.beta.threads.messages.list(thread_id, limit=100, order="asc", **params)
     list = []
     for msg in messages:
-        list.append(msg.content[0].text.value)
+        list.append(message_text(msg))
     return list
 
 
+@request_policy.guarded()
 def create_assistant(name, model, instructions, tools, file_ids):
     asst = client.beta.assistants.create(name=name, model=model, instructions=instructions,  # ,
         tools=tools, file_ids=file_ids)
     return asst
 
 
+@request_policy.guarded()
+@tracing.traced("api.create_thread")
 def create_thread():
     return client.beta.threads.create()
 
 
+@request_policy.guarded(tokens=lambda thread_id, role, msg: request_policy.estimate_tokens(msg))
+@tracing.traced("api.create_message")
 def create_message(thread_id, role, msg):
     return client.beta.threads.messages.create(thread_id=thread_id, role=role, content=msg)
 
 
+@request_policy.guarded()
+@tracing.traced("api.create_run")
 def create_run(thread_id, assistant_id):
     return client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
 
 
+@request_policy.guarded(read=True)
+@tracing.traced("api.get_run")
 def get_run(thread_id, run_id):
     return client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
 
 
-def get_thread_messages(thread_id):
-    return client.beta.threads.messages.list(thread_id=thread_id)
+@request_policy.guarded(read=True)
+@tracing.traced("api.get_thread_messages")
+def get_thread_messages(thread_id, after=None, order="desc", limit=20):
+    params = {"after": after} if after else {}
+    return client.beta.threads.messages.list(thread_id=thread_id, order=order, limit=limit, **params)
 
 
+@request_policy.guarded(tokens=lambda thread_id, run_id, tool_outputs: request_policy.estimate_tokens(tool_outputs))
+@tracing.traced("api.submit_tool_outputs")
 def submit_tool_outputs(thread_id, run_id, tool_outputs):
     return client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run_id, tool_outputs=tool_outputs)
+
+
+@request_policy.guarded()
+@tracing.traced("api.cancel_run")
+def cancel_run(thread_id, run_id):
+    return client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
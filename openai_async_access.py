@@ -0,0 +1,253 @@
+import asyncio
+import functools
+import importlib.util
+import json
+import os
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+import request_policy
+import tracing
+from openai_access import message_text
+
+load_dotenv()
+
+# One pooled HTTP client shared by every conversation in the process, so that concurrent
+# conversations reuse keep-alive connections and overlap their network waits.
+max_connections = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 100))
+max_keepalive_connections = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20))
+keepalive_expiry = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", 30))
+http2 = os.environ.get("OPENAI_HTTP2", "true").lower() == "true" and importlib.util.find_spec("h2") is not None
+
+openai_api_key = os.environ["OPENAI_API_KEY"]
+client: AsyncOpenAI = None
+client_loop = None
+client_opening = None  # task creating the client of a new loop, shared by its first requests
+client_closer = None  # closes the client when its loop shuts down, see close_with_loop
+request_slots = None
+
+
+def create_client():
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                            keepalive_expiry=keepalive_expiry),
+        timeout=httpx.Timeout(float(os.environ.get("OPENAI_TIMEOUT", 60)), connect=5.0),
+        http2=http2
+    )
+    # retries are left to request_policy
+    oai_client = AsyncOpenAI(api_key=openai_api_key, http_client=http_client, max_retries=0)
+    # the SDK probes the platform (running a subprocess) for the headers of its first request
+    oai_client.default_headers
+    return oai_client
+
+
+# The connections of a client belong to its event loop, and can only be closed on it. Started on that loop,
+# this async generator is closed by the loop's shutdown (asyncio.run() does it after cancelling the tasks
+# left), which closes the client.
+async def close_with_loop(oai_client):
+    try:
+        yield
+    finally:
+        await oai_client.close()
+
+
+def use_client(new_client, closer, loop):
+    global client, client_loop, client_closer, request_slots
+    old_closer, old_loop = client_closer, client_loop
+    client, client_loop, client_closer = new_client, loop, closer
+    request_slots = asyncio.Semaphore(max_connections)
+    # the client of a loop that is still open (e.g. running in another thread) is closed on it; that of a
+    # closed loop was closed by the loop's shutdown
+    if old_closer is not None and not old_loop.is_closed():
+        try:
+            asyncio.run_coroutine_threadsafe(old_closer.aclose(), old_loop)
+        except RuntimeError:
+            pass  # the loop closed meanwhile
+
+
+# pooled connections belong to the event loop that opened them, so a new loop
+# (e.g. one asyncio.run() per Streamlit rerun) gets a new client, opened by open_client
+def get_oai_client():
+    if client is None or client_loop is not asyncio.get_running_loop():
+        raise Exception("No OpenAI client opened on this event loop: await open_client() first")
+    return client
+
+
+# Creating a client loads the CA certificates and sets up the SDK, tens of milliseconds during which no
+# other conversation would make progress: requests open it in a thread instead.
+async def open_client():
+    global client_opening
+    loop = asyncio.get_running_loop()
+    if client is not None and client_loop is loop:
+        return
+    if client_opening is None or client_opening.done() or client_opening.get_loop() is not loop:
+        client_opening = asyncio.create_task(create_client_in_thread())
+    await asyncio.shield(client_opening)
+
+
+async def create_client_in_thread():
+    new_client = await asyncio.to_thread(create_client)
+    closer = close_with_loop(new_client)
+    await anext(closer)
+    use_client(new_client, closer, asyncio.get_running_loop())
+
+
+# Requests beyond the pool size wait here rather than in the HTTP client's own queue, which gets
+# slow (quadratic) when thousands of conversations queue requests at once.
+# Each call goes through request_policy (rate limits, retries, circuit breaker): read=True for calls that
+# can safely be retried after any transient error, tokens(*args, **kwargs) estimates the tokens sent.
+def pooled(read=False, tokens=None):
+    def decorate(func):
+        # the span covers each attempt of the request itself, not the waits for the limits and a slot
+        func = tracing.traced(f"api.{func.__name__}")(func)
+
+        async def attempt(*args, **kwargs):
+            await open_client()
+            async with request_slots:
+                return await func(*args, **kwargs)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await request_policy.policy.call_async(func.__name__, functools.partial(attempt, *args, **kwargs),
+                                                          read, tokens(*args, **kwargs) if tokens else 0)
+        return wrapper
+    return decorate
+
+
+async def close():
+    global client, client_closer
+    if client_closer is not None:
+        await client_closer.aclose()
+        client, client_closer = None, None
+
+
+@pooled(read=True)
+async def get_assistant(id):
+    return await get_oai_client().beta.assistants.retrieve(id)
+
+
+# messages in chronological order; with `after`, only those newer than that message id
+@pooled(read=True)
+async def list_messages(thread_id, after=None):
+    params = {"after": after} if after else {}
+    list = []
+    async for msg in get_oai_client().beta.threads.messages.list(thread_id, limit=100, order="asc", **params):
+        list.append(message_text(msg))
+    return list
+
+
+# the messages added to a thread after the message `after`, across pages, in chronological order
+@pooled(read=True)
+async def list_new_messages(thread_id, after=None):
+    params = {"after": after} if after else {}
+    return [msg async for msg in get_oai_client().beta.threads.messages.list(thread_id, limit=100, order="asc",
+                                                                              **params)]
+
+
+@pooled()
+async def create_thread():
+    return await get_oai_client().beta.threads.create()
+
+
+@pooled(tokens=lambda thread_id, role, msg: request_policy.estimate_tokens(msg))
+async def create_message(thread_id, role, msg):
+    return await get_oai_client().beta.threads.messages.create(thread_id=thread_id, role=role, content=msg)
+
+
+@pooled()
+async def create_run(thread_id, assistant_id):
+    return await get_oai_client().beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+
+
+@pooled(read=True)
+async def get_run(thread_id, run_id):
+    return await get_oai_client().beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+
+
+@pooled(read=True)
+async def get_thread_messages(thread_id, after=None, order="desc", limit=20):
+    params = {"after": after} if after else {}
+    return await get_oai_client().beta.threads.messages.list(thread_id=thread_id, order=order, limit=limit,
+                                                             **params)
+
+
+@pooled(tokens=lambda thread_id, run_id, tool_outputs: request_policy.estimate_tokens(tool_outputs))
+async def submit_tool_outputs(thread_id, run_id, tool_outputs):
+    return await get_oai_client().beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run_id,
+                                                              tool_outputs=tool_outputs)
+
+
+@pooled()
+async def cancel_run(thread_id, run_id):
+    return await get_oai_client().beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+
+
+async def open_stream(path, body):
+    await open_client()
+    client = get_oai_client()
+    headers = {"Authorization": f"Bearer {client.api_key}", "OpenAI-Beta": "assistants=v1",
+               "Accept": "text/event-stream"}
+    request = client._client.build_request("POST", client.base_url.join(path), json={**body, "stream": True},
+                                           headers=headers)
+    response = await client._client.send(request, stream=True)
+    if response.is_error:
+        await response.aread()
+        await response.aclose()
+        response.raise_for_status()
+    return response
+
+
+# Server-sent events for a run: yields (event, data) pairs, e.g. ("thread.run.completed", {...run...}) or
+# ("thread.message.delta", {...}), until the run ends or pauses for tool outputs. The request is sent when
+# the stream is opened, and the response read as the stream is iterated.
+# Streams are not counted against request_slots, as they stay open for the whole run; opening one goes
+# through request_policy as a write.
+async def stream_events(path, body):
+    response = await request_policy.policy.call_async("stream_events", functools.partial(open_stream, path, body))
+    return EventStream(response)
+
+
+class EventStream():
+    def __init__(self, response):
+        self.response = response
+        self.events = read_events(response)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await anext(self.events)
+
+    # also closes the response of a stream that was never iterated
+    async def aclose(self):
+        await self.events.aclose()
+        await self.response.aclose()
+
+
+async def read_events(response):
+    try:
+        event, data = None, []
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+            elif line == "" and data:
+                payload = "\n".join(data)
+                if payload == "[DONE]":
+                    return
+                yield event, json.loads(payload)
+                event, data = None, []
+    finally:
+        await response.aclose()
+
+
+async def stream_run(thread_id, assistant_id):
+    return await stream_events(f"threads/{thread_id}/runs", {"assistant_id": assistant_id})
+
+
+async def stream_tool_outputs(thread_id, run_id, tool_outputs):
+    return await stream_events(f"threads/{thread_id}/runs/{run_id}/submit_tool_outputs", {"tool_outputs": tool_outputs})
+
@@ -0,0 +1,254 @@
+import asyncio
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+from dotenv import load_dotenv
+
+import tracing
+
+load_dotenv()
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+# Called with the seconds to wait on every 429 of the calls made in the current context (e.g. the task of a
+# batch prompt and the tasks it starts), including the ones retried here, which the caller would not see.
+throttle_listener = contextvars.ContextVar("throttle_listener", default=None)
+
+
+# seconds to wait given by a response's retry-after-ms / retry-after headers, or None
+def retry_after(headers):
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+# (status, headers) of a failed API call; status None for connection errors and timeouts.
+# None for errors that do not come from the API (e.g. bugs), which are neither retried nor counted.
+def describe(error):
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code, error.response.headers
+    if isinstance(error, openai.APIConnectionError):
+        return None, {}
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code, error.response.headers
+    if isinstance(error, httpx.TransportError):
+        return None, {}
+    return None
+
+
+# a rough count of the tokens in a text (4 characters per token), for the tokens/min limit
+def estimate_tokens(text):
+    return len(str(text)) // 4 + 1
+
+
+# Thread-safe token bucket refilled at per_minute / 60 a second, holding up to `capacity` (a second's
+# worth by default). reserve() takes the tokens right away, possibly into debt, and returns how long the
+# caller has to wait for them, so that concurrent callers queue up in order.
+class TokenBucket():
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60
+        self.capacity = capacity or max(1, per_minute / 60)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0, -self.tokens / self.rate)
+
+
+# Opens after `threshold` consecutive failures (server errors, connection errors, timeouts), and then fails
+# calls right away for `cooldown` seconds. After that, one call goes through as a trial: it closes the
+# circuit when it succeeds, and opens it again when it fails.
+class CircuitBreaker():
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def check(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                raise CircuitOpen(f"Circuit open after {self.failures} consecutive failures")
+            # the trial call; the others wait for its outcome as for a new cooldown
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    self.opens += 1
+                self.opened_at = time.monotonic()
+
+    def state(self):
+        return "closed" if self.opened_at is None else "open"
+
+
+# What happens around every API call: the shared requests/min and tokens/min limits (0 for none), a circuit
+# breaker per operation (so that e.g. failing polls are not reset by messages created fine), and retries with
+# exponential backoff (with jitter) or the delay the API asks for.
+# 429s are retried for every call, as the request was not processed; server errors, connection errors and
+# timeouts only for reads, as a write may have been processed before it failed.
+class RequestPolicy():
+    def __init__(self, rpm=None, tpm=None, max_retries=None, backoff_base=None, backoff_max=None,
+                 breaker_threshold=None, breaker_cooldown=None):
+        rpm = int(os.environ.get("OPENAI_RPM", 0)) if rpm is None else rpm
+        tpm = int(os.environ.get("OPENAI_TPM", 0)) if tpm is None else tpm
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_retries = int(os.environ.get("OPENAI_MAX_RETRIES", 4)) if max_retries is None else max_retries
+        self.backoff_base = backoff_base or float(os.environ.get("OPENAI_BACKOFF_BASE", 0.5))
+        self.backoff_max = backoff_max or float(os.environ.get("OPENAI_BACKOFF_MAX", 20))
+        self.breaker_threshold = breaker_threshold or int(os.environ.get("OPENAI_BREAKER_THRESHOLD", 10))
+        self.breaker_cooldown = breaker_cooldown or float(os.environ.get("OPENAI_BREAKER_COOLDOWN", 30))
+        self.breakers = {}
+        self.calls = 0
+        self.retried = 0
+        self.throttled = 0
+        self.failed = 0
+        self.limited = 0
+        self.limit_wait = 0.0
+
+    def breaker(self, name):
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers.setdefault(name, CircuitBreaker(self.breaker_threshold, self.breaker_cooldown))
+        return breaker
+
+    # checks the circuit and takes the call's share of the limits; returns the seconds to wait for them
+    def admit(self, breaker, tokens=0):
+        breaker.check()
+        wait = 0
+        if self.requests:
+            wait = self.requests.reserve()
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            self.limited += 1
+            self.limit_wait += wait
+            tracing.observe("rate_limit_wait", wait)
+        return wait
+
+    def backoff(self, retry):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** retry)
+        return random.uniform(delay / 2, delay)
+
+    # the delay before retrying a failed call, or None when it is not retried
+    def on_error(self, breaker, error, retry, read):
+        described = describe(error)
+        if described is None:
+            return None
+        status, headers = described
+        transient = status is None or status >= 500
+        if transient:
+            breaker.record_failure()
+        else:
+            # the API answered
+            breaker.record_success()
+        if status == 429:
+            self.throttled += 1
+            delay = retry_after(headers) or self.backoff(retry)
+            listener = throttle_listener.get()
+            if listener is not None:
+                listener(delay)
+            if retry < self.max_retries:
+                self.retried += 1
+                return delay
+        elif transient and read and retry < self.max_retries:
+            self.retried += 1
+            return self.backoff(retry)
+        self.failed += 1
+        return None
+
+    async def call_async(self, name, attempt, read=False, tokens=0):
+        self.calls += 1
+        breaker = self.breaker(name)
+        retry = 0
+        while True:
+            wait = self.admit(breaker, tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await attempt()
+            except Exception as e:
+                delay = self.on_error(breaker, e, retry, read)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                retry += 1
+                continue
+            breaker.record_success()
+            return result
+
+    def call(self, name, attempt, read=False, tokens=0):
+        self.calls += 1
+        breaker = self.breaker(name)
+        retry = 0
+        while True:
+            wait = self.admit(breaker, tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                result = attempt()
+            except Exception as e:
+                delay = self.on_error(breaker, e, retry, read)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                retry += 1
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self):
+        return {"calls": self.calls, "retried": self.retried, "throttled": self.throttled, "failed": self.failed,
+                "limited": self.limited, "limit_wait": self.limit_wait,
+                "open_circuits": [name for name, breaker in self.breakers.items() if breaker.state() == "open"],
+                "circuit_opens": sum(breaker.opens for breaker in self.breakers.values()),
+                "rejected": sum(breaker.rejected for breaker in self.breakers.values())}
+
+
+# shared by openai_access and openai_async_access, so that their calls count against the same limits
+policy = RequestPolicy()
+
+
+# applies the policy to a blocking API call; tokens(*args, **kwargs) estimates the tokens it sends
+def guarded(read=False, tokens=None):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return policy.call(func.__name__, lambda: func(*args, **kwargs), read,
+                               tokens(*args, **kwargs) if tokens else 0)
+        return wrapper
+    return decorate
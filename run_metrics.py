@@ -0,0 +1,185 @@
+from sqlalchemy import select, delete, update, insert, func, case, and_, bindparam, DateTime
+from sqlalchemy.orm import Session
+
+import database
+from models import XConversation, XRun, XRunDetail, XRunSummary, XConversationSummary
+
+runs_table = database.run_summaries
+conversations_table = database.conversation_summaries
+
+# mediator states that end a run: its summary takes no further state changes
+TERMINAL_STATES = ("completed", "failed")
+# mediator states recorded between two runs
+BETWEEN_RUNS = ("ready",)
+
+
+# Updates the run and conversation summaries with a batch of records being written, in the same session,
+# so analytics read one row per run / conversation instead of counting run_details.
+# The batch is added up per run and per conversation first, and the sums are added in SQL: a summary row is
+# inserted unless it exists (INSERT OR IGNORE), then incremented (UPDATE ... SET n = n + :n). Nothing is read
+# and written back, so worker processes writing rows of the same runs / conversations neither overwrite
+# each other's counts nor race to insert the same summary.
+def apply(session, records):
+    runs = {}
+    conversations = {}
+    transitions = []
+
+    def conversation_sums(thread_id):
+        return conversations.setdefault(thread_id, {"_thread_id": thread_id, "_runs": 0, "_created_at": None,
+                                                    "_last_activity_at": None})
+
+    def run_sums(run_id, at):
+        sums = runs.setdefault(run_id, {"_run_id": run_id, "_thread_id": None, "_events": 0, "_tool_calls": 0,
+                                        "_polls": 0, "_started_at": None, "_ended_at": None, "_last_seen_at": None})
+        if at is not None:
+            sums["_started_at"] = earlier(sums["_started_at"], at)
+            sums["_ended_at"] = later(sums["_ended_at"], at)
+        return sums
+
+    for record in records:
+        if isinstance(record, XConversation):
+            conversation = conversation_sums(record.thread_id)
+            conversation["_created_at"] = min(conversation["_created_at"] or record.created_at, record.created_at)
+            conversation["_last_activity_at"] = later(conversation["_last_activity_at"], record.created_at)
+
+        elif isinstance(record, XRun):
+            run_sums(record.run_id, record.created_at)["_thread_id"] = record.thread_id
+            conversation = conversation_sums(record.thread_id)
+            conversation["_runs"] += 1
+            conversation["_last_activity_at"] = later(conversation["_last_activity_at"], record.created_at)
+
+        elif isinstance(record, XRunDetail) and record.run_id != "TBD":
+            # a compacted row stands for seen_count events, from created_at to last_seen_at
+            count = record.seen_count or 1
+            last_seen_at = record.last_seen_at or record.created_at
+            # 'ready' is the next turn starting, recorded under the run before (see the mediators' store_state):
+            # an event of that run, but not part of its time
+            between_runs = record.type == "state_change" and record.output in BETWEEN_RUNS
+            run = run_sums(record.run_id, None if between_runs else record.created_at)
+            if not between_runs:
+                run["_ended_at"] = later(run["_ended_at"], last_seen_at)
+            run["_last_seen_at"] = later(run["_last_seen_at"], last_seen_at)
+            run["_events"] += count
+            run["_tool_calls"] += record.type == "execute_tool"
+            run["_polls"] += count if record.type == "check_run_status" else 0
+            if record.type == "state_change" and not between_runs:
+                transitions.append({"_run_id": record.run_id, "_state": record.output, "_at": record.created_at})
+
+    if conversations:
+        session.execute(add_conversation, [{"thread_id": thread_id} for thread_id in conversations])
+        session.execute(count_conversation, list(conversations.values()))
+    if runs:
+        adopted = [sums for sums in runs.values() if sums["_thread_id"]]
+        if adopted:
+            session.execute(adopt_run_events, adopted)
+        session.execute(add_run, [{"run_id": sums["_run_id"], "started_at": sums["_started_at"],
+                                   "ended_at": sums["_started_at"]} for sums in runs.values()])
+        session.execute(count_run, list(runs.values()))
+    if transitions:
+        session.execute(enter_state, transitions)
+    events = [sums for sums in runs.values() if sums["_last_seen_at"]]
+    if events:
+        session.execute(count_run_events, events)
+
+
+def later(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def earlier(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+# the later of two datetime columns / parameters, either of which may be NULL
+def latest(a, b):
+    return func.max(func.coalesce(a, b), func.coalesce(b, a))
+
+
+def earliest(a, b):
+    return func.min(func.coalesce(a, b), func.coalesce(b, a))
+
+
+# seconds between two datetimes as stored by SQLAlchemy ('YYYY-MM-DD HH:MM:SS.ffffff'), to the microsecond
+# (SQLite's date functions round to the millisecond)
+def seconds(start, end):
+    return (func.strftime("%s", func.substr(end, 1, 19)) - func.strftime("%s", func.substr(start, 1, 19))
+            + (func.substr(end, 20) - func.substr(start, 20)))
+
+
+# The statements of apply, built once so that they are compiled once. In SQLite, the SET expressions of an
+# UPDATE read the row as it was before the update.
+add_conversation = insert(conversations_table).prefix_with("OR IGNORE").values(num_runs=0, num_events=0,
+                                                                                num_tool_calls=0)
+
+count_conversation = update(conversations_table).where(conversations_table.c.thread_id == bindparam("_thread_id")).values(
+    num_runs=conversations_table.c.num_runs + bindparam("_runs"),
+    created_at=func.coalesce(conversations_table.c.created_at, bindparam("_created_at", type_=DateTime)),
+    last_activity_at=latest(conversations_table.c.last_activity_at, bindparam("_last_activity_at", type_=DateTime)))
+
+
+# events written before the run itself are added to its conversation when the run is
+def before_run(column):
+    return func.coalesce(select(column).where(runs_table.c.run_id == bindparam("_run_id"),
+                                              runs_table.c.thread_id.is_(None)).scalar_subquery(), 0)
+
+
+adopt_run_events = update(conversations_table).where(conversations_table.c.thread_id == bindparam("_thread_id")).values(
+    num_events=conversations_table.c.num_events + before_run(runs_table.c.num_events),
+    num_tool_calls=conversations_table.c.num_tool_calls + before_run(runs_table.c.num_tool_calls))
+
+add_run = insert(runs_table).prefix_with("OR IGNORE").values(num_events=0, num_tool_calls=0, num_polls=0,
+                                                             state_times="{}", duration=0.0)
+
+# a batch with only rows between runs leaves the times as they are
+started_at = earliest(runs_table.c.started_at, bindparam("_started_at", type_=DateTime))
+ended_at = latest(runs_table.c.ended_at, bindparam("_ended_at", type_=DateTime))
+count_run = update(runs_table).where(runs_table.c.run_id == bindparam("_run_id")).values(
+    thread_id=func.coalesce(runs_table.c.thread_id, bindparam("_thread_id")),
+    num_events=runs_table.c.num_events + bindparam("_events"),
+    num_tool_calls=runs_table.c.num_tool_calls + bindparam("_tool_calls"),
+    num_polls=runs_table.c.num_polls + bindparam("_polls"),
+    started_at=started_at,
+    ended_at=ended_at,
+    duration=func.coalesce(seconds(started_at, ended_at), 0.0))
+
+# enters the run into a new mediator state, adding the time spent in the previous one to state_times
+# (JSON: seconds per state)
+state_path = func.printf('$."%s"', runs_table.c.state)
+enter_state = update(runs_table).where(runs_table.c.run_id == bindparam("_run_id"),
+                                       *[func.coalesce(runs_table.c.state, "") != state
+                                         for state in TERMINAL_STATES]).values(
+    state_times=case((and_(runs_table.c.state.is_not(None), runs_table.c.state_entered_at.is_not(None)),
+                      func.json_set(runs_table.c.state_times, state_path,
+                                    func.coalesce(func.json_extract(runs_table.c.state_times, state_path), 0)
+                                    + seconds(runs_table.c.state_entered_at, bindparam("_at", type_=DateTime)))),
+                     else_=runs_table.c.state_times),
+    state=bindparam("_state"),
+    state_entered_at=bindparam("_at", type_=DateTime))
+
+# the events of a run whose conversation is known
+count_run_events = update(conversations_table).where(
+    conversations_table.c.thread_id == select(runs_table.c.thread_id)
+    .where(runs_table.c.run_id == bindparam("_run_id")).scalar_subquery()).values(
+    num_events=conversations_table.c.num_events + bindparam("_events"),
+    num_tool_calls=conversations_table.c.num_tool_calls + bindparam("_tool_calls"),
+    last_activity_at=latest(conversations_table.c.last_activity_at, bindparam("_last_seen_at", type_=DateTime)))
+
+
+# recomputes all the summaries from the audit tables, e.g. for databases created before they existed.
+# The summaries of runs whose details were rolled up (see db_maintenance) are kept, and added back to
+# their conversation as the runs are replayed.
+def rebuild(engine, chunk_size=50000):
+    with Session(engine) as session:
+        session.execute(delete(XRunSummary).where(XRunSummary.rolled_up_at.is_(None)))
+        session.execute(update(XRunSummary).values(thread_id=None))
+        session.execute(delete(XConversationSummary))
+        session.commit()
+
+    with Session(engine) as reader, Session(engine) as writer:
+        for entity in [XConversation, XRun, XRunDetail]:
+            stmt = select(entity).order_by(entity.id).execution_options(yield_per=chunk_size)
+            for records in reader.scalars(stmt).partitions():
+                apply(writer, records)
+                writer.commit()
+                writer.expunge_all()
+            reader.expunge_all()
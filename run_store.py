@@ -0,0 +1,158 @@
+import atexit
+import datetime
+import logging
+import os
+import threading
+import time
+import zlib
+
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+import database
+
+load_dotenv()
+
+# Mediator states of a run that is under way and can be resumed: the run exists, and has not ended.
+# A conversation in 'ready' has not created its run yet, so its message has to be sent again.
+# MediatorBasic saves 'action_required' where MediatorStateMachine saves 'requires_action'.
+ACTIVE_STATES = ['started', 'running', 'requires_action', 'action_required', 'tools_executed',
+                 'tool_outputs_submitted']
+
+FIELDS = ['assistant_id', 'run_id', 'state', 'last_message_id', 'asst_message']
+
+
+# the shard (worker) of a conversation; stable across processes, unlike hash()
+def shard_of(thread_id, shards):
+    return zlib.crc32(thread_id.encode()) % shards
+
+
+# Run state of each conversation, keyed by thread_id, in the sqlite database shared by the workers.
+# With write-behind, save() only records the state and a background thread writes it, so the event loop
+# does not wait for SQLite on every state change: the saves of a conversation made while a write is under
+# way are merged into one, and those of all the conversations are written in one transaction.
+class SqliteRunStore():
+    def __init__(self, engine=None, write_behind=None):
+        self.engine = engine or database.get_engine()
+        self.table = database.run_states
+        if write_behind is None:
+            write_behind = os.environ.get("DB_WRITE_BEHIND", "true").lower() == "true"
+        self.pending = {}
+        self.writing = {}
+        self.saves = 0
+        self.written = 0
+        self.failures = 0
+        self.changed = threading.Condition()
+        self.worker = None
+        if write_behind:
+            self.worker = threading.Thread(target=self._run, name="run-store-write-behind", daemon=True)
+            self.worker.start()
+            atexit.register(self.flush, 5)
+
+    def save(self, thread_id, **fields):
+        values = {**fields, "updated_at": datetime.datetime.now()}
+        if self.worker is None:
+            self._write({thread_id: values})
+            return
+        with self.changed:
+            self.pending.setdefault(thread_id, {}).update(values)
+            self.saves += 1
+            self.changed.notify_all()
+
+    # blocks until every state saved before the call has been written; False when timeout expires first
+    def flush(self, timeout=None):
+        with self.changed:
+            saves = self.saves
+            return self.changed.wait_for(lambda: self.written >= saves, timeout)
+
+    def _run(self):
+        while True:
+            with self.changed:
+                self.changed.wait_for(lambda: self.pending)
+                pending, self.pending = self.pending, {}
+                self.writing = pending
+                saves = self.saves
+            try:
+                self._write(pending)
+            except Exception:
+                # e.g. the database is locked: the states are written with the next batch, unless saved again
+                logging.exception("Writing run states failed")
+                self.failures += 1
+                with self.changed:
+                    self.writing = {}
+                    for thread_id, values in pending.items():
+                        self.pending[thread_id] = {**values, **self.pending.get(thread_id, {})}
+                time.sleep(1)
+                continue
+            with self.changed:
+                self.writing = {}
+                self.written = saves
+                self.changed.notify_all()
+
+    def _write(self, states):
+        with self.engine.begin() as connection:
+            for thread_id, values in states.items():
+                stmt = insert(self.table).values(thread_id=thread_id, **values)
+                connection.execute(stmt.on_conflict_do_update(index_elements=["thread_id"], set_=values))
+
+    def get(self, thread_id):
+        with self.engine.connect() as connection:
+            row = connection.execute(select(self.table).where(self.table.c.thread_id == thread_id)).first()
+        state = dict(row._mapping) if row else None
+        # states saved but not written yet
+        with self.changed:
+            pending = {**self.writing.get(thread_id, {}), **self.pending.get(thread_id, {})}
+        if pending:
+            state = {"thread_id": thread_id, **{field: None for field in FIELDS}, **(state or {}), **pending}
+        return state
+
+    # the states of the runs under way; when the states saved by this process are not all written within
+    # timeout (e.g. the database is locked), those still pending are taken from memory
+    def active(self, shard=None, shards=None, timeout=5):
+        if not self.flush(timeout):
+            logging.warning(f"Run states not written within {timeout} s, reading the active runs without them")
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(self.table).where(self.table.c.state.in_(ACTIVE_STATES))).all()
+        states = {row.thread_id: dict(row._mapping) for row in rows}
+        with self.changed:
+            pending = {thread_id: {**self.writing.get(thread_id, {}), **self.pending.get(thread_id, {})}
+                       for thread_id in {**self.writing, **self.pending}}
+        for thread_id, values in pending.items():
+            state = {"thread_id": thread_id, **{field: None for field in FIELDS}, **states.get(thread_id, {}),
+                     **values}
+            if state["state"] in ACTIVE_STATES:
+                states[thread_id] = state
+            else:
+                states.pop(thread_id, None)
+        return [state for thread_id, state in states.items()
+                if shards is None or shard_of(thread_id, shards) == shard]
+
+
+# Same interface, in the process's memory, e.g. for tests and benchmarks.
+class MemoryRunStore():
+    def __init__(self):
+        self.states = {}
+
+    def save(self, thread_id, **fields):
+        state = self.states.setdefault(thread_id, {"thread_id": thread_id, **{field: None for field in FIELDS}})
+        state.update(fields, updated_at=datetime.datetime.now())
+
+    def flush(self, timeout=None):
+        return True
+
+    def get(self, thread_id):
+        state = self.states.get(thread_id)
+        return dict(state) if state else None
+
+    def active(self, shard=None, shards=None, timeout=None):
+        return [dict(state) for thread_id, state in self.states.items()
+                if state["state"] in ACTIVE_STATES and (shards is None or shard_of(thread_id, shards) == shard)]
+
+
+def create_store(kind=None):
+    match kind or os.environ.get("RUN_STORE", "sqlite"):
+        case "sqlite": return SqliteRunStore()
+        case "memory": return MemoryRunStore()
+        case "none": return None
+        case other: raise Exception(f"Unknown run store: {other}")
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from run_store import shard_of
+
+load_dotenv()
+
+# seconds a worker waits for the run state of a conversation it starts for another shard to be written
+HANDOVER_TIMEOUT = 5
+
+
+# Spreads conversations over worker processes: each worker hosts the conversations whose thread_id hashes to
+# its shard, and messages are routed to the worker of their conversation. A worker takes a conversation over
+# from the run store when it does not host it yet, with the assistant of its run record, and on start it
+# resumes the runs of its shard that were left under way (e.g. by a crashed worker), see
+# ConversationHost.recover. As the workers share the run store, it has to be the sqlite one.
+# A worker that dies is started again, with a new request queue: the requests it had not answered fail, and
+# the new worker resumes the runs of its shard.
+class ShardedConversations():
+    def __init__(self, shards=None):
+        if os.environ.get("RUN_STORE", "sqlite") != "sqlite":
+            raise Exception("ShardedConversations needs the run store shared by its workers: RUN_STORE=sqlite")
+        self.shards = shards or int(os.environ.get("WORKERS", os.cpu_count()))
+        self.context = multiprocessing.get_context("spawn")
+        self.requests = [None] * self.shards
+        self.workers = [None] * self.shards
+        self.results = self.context.Queue()
+        self.pending = {}
+        self.request_ids = itertools.count()
+        self.next_shard = itertools.cycle(range(self.shards))
+        self.loop = None
+        self.receiver = None
+        self.supervisor = None
+        self.closing = False
+        self.restarts = 0
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        for shard in range(self.shards):
+            self.start_worker(shard)
+        self.receiver = threading.Thread(target=self.receive, name="conversation-results", daemon=True)
+        self.receiver.start()
+        self.supervisor = threading.Thread(target=self.supervise, name="conversation-supervisor", daemon=True)
+        self.supervisor.start()
+
+    def start_worker(self, shard):
+        requests = self.context.Queue()
+        worker = self.context.Process(target=serve, args=(shard, self.shards, requests, self.results),
+                                      name=f"conversation-worker-{shard}", daemon=True)
+        worker.start()
+        self.requests[shard] = requests
+        self.workers[shard] = worker
+
+    def receive(self):
+        while (result := self.results.get()) is not None:
+            self.loop.call_soon_threadsafe(self.resolve, *result)
+
+    # waits for worker processes to exit, and has the dead ones restarted on the event loop
+    def supervise(self):
+        restarting = set()
+        while not self.closing:
+            sentinels = {worker.sentinel: (shard, worker) for shard, worker in enumerate(self.workers)
+                         if worker not in restarting}
+            for sentinel in multiprocessing.connection.wait(list(sentinels), timeout=1):
+                shard, worker = sentinels[sentinel]
+                restarting.add(worker)
+                if not self.closing:
+                    self.loop.call_soon_threadsafe(self.restart, shard, worker)
+
+    def restart(self, shard, worker):
+        if self.closing or self.workers[shard] is not worker:
+            return
+        worker.join(1)
+        logging.error(f"Conversation worker {shard} died (exit code {worker.exitcode}), starting it again")
+        self.restarts += 1
+        for request_id, (request_shard, future) in list(self.pending.items()):
+            if request_shard == shard:
+                del self.pending[request_id]
+                future.set_exception(Exception(f"Conversation worker {shard} died"))
+        self.start_worker(shard)
+
+    def resolve(self, request_id, result, error):
+        # e.g. failed already, as its worker died
+        if request_id not in self.pending:
+            return
+        shard, future = self.pending.pop(request_id)
+        if error is not None:
+            future.set_exception(Exception(error))
+        else:
+            future.set_result(result)
+
+    async def request(self, shard, op, args):
+        request_id = next(self.request_ids)
+        future = self.loop.create_future()
+        self.pending[request_id] = (shard, future)
+        self.requests[shard].put((request_id, op, args))
+        return await future
+
+    async def start_conversation(self, asst_id):
+        return await self.request(next(self.next_shard), "start", (asst_id,))
+
+    async def send(self, thread_id, message):
+        return await self.request(shard_of(thread_id, self.shards), "send", (thread_id, message))
+
+    async def close(self):
+        self.closing = True
+        for requests in self.requests:
+            requests.put(None)
+        for worker in self.workers:
+            await asyncio.to_thread(worker.join)
+        self.results.put(None)
+
+
+def serve(shard, shards, requests, results):
+    asyncio.run(work(shard, shards, requests, results))
+
+
+async def work(shard, shards, requests, results):
+    # imported in the worker process, which opens its own connections
+    import conversation
+    import conversation_host
+
+    host = conversation_host.ConversationHost()
+    if conversation.run_states is not None:
+        host.recover(shard, shards)
+
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    while (request := await loop.run_in_executor(None, requests.get)) is not None:
+        task = asyncio.create_task(handle(host, shard, shards, request, results))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+    await host.close()
+
+
+async def handle(host, shard, shards, request, results):
+    import conversation
+
+    request_id, op, args = request
+    try:
+        if op == "start":
+            thread_id = await host.start_conversation(*args)
+            # new conversations are started by any worker, and handed over to the worker of their shard,
+            # which reads their state from the run store
+            if shard_of(thread_id, shards) != shard:
+                if not await asyncio.to_thread(conversation.run_states.flush, HANDOVER_TIMEOUT):
+                    raise Exception(f"Run state of {thread_id} not written within {HANDOVER_TIMEOUT} s")
+                host.evict(thread_id)
+            result = thread_id
+        else:
+            thread_id, message = args
+            if thread_id not in host.conversations:
+                host.resume_conversation(None, thread_id)
+            result = await host.send(thread_id, message)
+        results.put((request_id, result, None))
+    except Exception as e:
+        results.put((request_id, None, repr(e)))
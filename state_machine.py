@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+
+from transitions import MachineError
+
+# The task whose trigger started the transition in progress; nested triggers (fired from callbacks) run
+# within it, and so do the tasks created by its callbacks, which inherit the context.
+current_transition = contextvars.ContextVar("current_transition", default=None)
+
+
+# A transition table compiled once and shared by every model (e.g. every mediator) that uses it:
+# (state, trigger) -> (dest, on_enter callbacks, after callbacks), with the callbacks given as method names.
+# Each model only keeps its current state in `state`, and the tasks in a transition in `transition_tasks`.
+# It behaves like the transitions AsyncMachine it replaces: the first transition added for a source and
+# trigger wins, '*' stands for every state, each transition (even to the same state) runs the on_enter
+# callbacks of its dest and then its after callbacks, with the trigger's arguments, an invalid trigger
+# raises MachineError, and taking a transition cancels the model's transitions in progress in other tasks.
+class StateTable():
+    def __init__(self, states, transitions, on_enter_all=()):
+        self.states = list(states)
+        self.table = {}
+        for trigger, source, dest, after in transitions:
+            for state in (self.states if source == '*' else [source]):
+                self.table.setdefault((state, trigger), (dest, tuple(states[dest]) + tuple(on_enter_all),
+                                                         tuple(after)))
+        self.triggers = {trigger for state, trigger in self.table}
+
+    # adds a coroutine method for each trigger to the model class
+    def bind(self, cls):
+        for trigger in self.triggers:
+            setattr(cls, trigger, self.trigger_method(trigger))
+        return cls
+
+    def trigger_method(self, trigger):
+        async def fire(model, *args, **kwargs):
+            return await self.fire(model, trigger, args, kwargs)
+        fire.__name__ = trigger
+        return fire
+
+    async def fire(self, model, trigger, args, kwargs):
+        if current_transition.get() is not None:
+            return await self.execute(model, trigger, args, kwargs)
+        task = asyncio.current_task()
+        token = current_transition.set(task)
+        model.transition_tasks.append(task)
+        try:
+            return await self.execute(model, trigger, args, kwargs)
+        except asyncio.CancelledError:
+            return False
+        finally:
+            model.transition_tasks.remove(task)
+            current_transition.reset(token)
+
+    async def execute(self, model, trigger, args, kwargs):
+        entry = self.table.get((model.state, trigger))
+        if entry is None:
+            raise MachineError(f"Can't trigger event {trigger} from state {model.state}!")
+        dest, on_enter, after = entry
+
+        current = current_transition.get()
+        for task in model.transition_tasks:
+            if task is not current and not task.done():
+                task.cancel(trigger)
+
+        model.state = dest
+        for name in on_enter:
+            result = getattr(model, name)(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                await result
+        for name in after:
+            result = getattr(model, name)(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                await result
+        return True
@@ -5,18 +5,18 @@ from typing import MutableMapping
 from dotenv import load_dotenv
 import streamlit as st
 import conversation
-from pubsub import pub
 from conversation import UserProxy
 
 load_dotenv()
 
 default_assistant_id = os.environ["ASSISTANT_ID"]
+# events of the current conversation, formatted here (see events.py)
 def listener1(evt):
-    st.chat_message("system").write(evt)
-    store_message("system", evt)
+    st.chat_message("system").write(evt.format())
+    store_message("system", evt.format())
 
 def listener2(evt):
-    run_details.append(evt)
+    run_details.append(evt.format())
 
 @st.cache_resource
 def initialize():
@@ -26,12 +26,6 @@ def initialize():
         "thread_id": None
     }
     run_details_ = []
-    pub.subscribe(listener=listener1, topicName="executedTool") #s1, ok =
-
-    pub.subscribe(listener=listener2, topicName="sentMessage")
-    pub.subscribe(listener=listener2, topicName="error")
-    pub.subscribe(listener=listener2, topicName="executedTool")
-    pub.subscribe(listener=listener2, topicName="retrievedMessage")
     return [store, cache_dict, run_details_, listener1, listener2]
 
 def store_message(role, content):
@@ -49,6 +43,9 @@ def clean_up():
     run_details.clear()
 
 async def run():
+    # threads for the next conversations are created while this run goes on, see warm_threads
+    conversation.thread_pool.enable()
+    conversation.thread_pool.refill()
     sidebar = st.sidebar
     with sidebar:
 
@@ -58,8 +55,11 @@ async def run():
         if st.button("Start", type="secondary", key="start"):
             if asst_id:
                 clean_up()
-                user_proxy = conversation.start_conversation(asst_id)
+                user_proxy = await conversation.start_conversation(asst_id)
                 thread_id = user_proxy.mediator.asst_proxy.thread_id
+                user_proxy.mediator.events.subscribe("executedTool", listener1)
+                user_proxy.mediator.events.subscribe(["sentMessage", "error", "executedTool", "retrievedMessage"],
+                                                     listener2)
                 cache["chat"] = user_proxy
                 cache["thread_id"] = thread_id
 
@@ -98,12 +98,21 @@ async def run():
             ###response = await cache["chat"].send_message_and_retrieve_response(prompt)
             user_proxy : UserProxy = cache["chat"]
             user_proxy.send_user_message(prompt)
+            placeholder = None
+            response = ""
+            async for delta in user_proxy.stream_assistant_message():
+                if placeholder is None:
+                    placeholder = st.chat_message("assistant").empty()
+                response += delta
+                placeholder.write(response)
             response = await user_proxy.get_assistant_message()
             store_message("assistant", response)
-            st.chat_message("assistant").write(response)
         except Exception as e:
             st.chat_message("system").write(e)
             raise
+        finally:
+            # the run's events are delivered before the run details are shown
+            await user_proxy.mediator.events.join()
 
     with sidebar:
         if (len(run_details) > 0):
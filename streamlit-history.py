@@ -2,52 +2,34 @@ import streamlit as st
 from st_aggrid import AgGrid, JsCode, GridUpdateMode, ColumnsAutoSizeMode
 
 import db_access
-from models import XRunDetail, XRun, XConversation
+from history import load_history_page
 
-#@st.cache_resource
-def load_run_steps():
-    return db_access.get_all_as_df(XRunDetail)
+PAGE_SIZE = 10
 
-def load_runs():
-    return db_access.get_all_as_df(XRun)
-
-def load_conversations():
-    return db_access.get_all_as_df(XConversation)
-
-def load_history_data():
-    all_conversations = load_conversations()
-    all_runs = load_runs()
-    all_steps = load_run_steps()
-    df_r_steps = []
-    df_r_num_calls = []
-    for index, row in all_runs.iterrows():
-        run_steps = all_steps.query(f"run_id == '{row['run_id']}'")
-        df_r_steps.append(run_steps)
-        df_r_num_calls.append(len(run_steps))
-
-    all_runs["steps"] = df_r_steps
-    all_runs["num_events"] = df_r_num_calls
-
-    df_c_runs = []
-    df_c_num_runs = []
-    df_c_num_events = []
-    for index, row in all_conversations.iterrows():
-        c_runs = all_runs.query(f"thread_id == '{row['thread_id']}'")
-        df_c_runs.append(c_runs)
-        df_c_num_runs.append(len(c_runs))
-        df_c_num_events.append(c_runs["num_events"].sum())
-
-    all_conversations["runs"] = df_c_runs
-    all_conversations["num_runs"] = df_c_num_runs
-    all_conversations["num_events"] = df_c_num_events
-    return all_conversations
+# pages are cached per cursor; the version (the highest ids in the tables) changes when rows are added
+@st.cache_data(max_entries=50)
+def load_page(before_id, version):
+    return load_history_page(before_id, PAGE_SIZE)
 
 def run() :
     st.set_page_config(page_title="test", layout="wide")
 
     st.header("Conversation History and Log")
 
-    all_conversations = load_history_data()
+    # the cursor (smallest conversation id of the previous page) of each page visited so far
+    if "cursors" not in st.session_state:
+        st.session_state.cursors = [None]
+    cursors = st.session_state.cursors
+
+    all_conversations = load_page(cursors[-1], db_access.get_history_version())
+
+    newer, older, _ = st.columns([1, 1, 8])
+    if newer.button("⬅️ Newer", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if older.button("Older ➡️", disabled=len(all_conversations) < PAGE_SIZE):
+        cursors.append(int(all_conversations["id"].min()))
+        st.rerun()
 
     gridOptions = {
         # enable Master / Detail
@@ -57,9 +39,8 @@ def run() :
         "tooltipHideDelay": 2000,
         "detailRowAutoHeight": False,
         "detailRowHeight": 400,
-        "pagination": True,
-        "paginationAutoPageSize": False,
-        "paginationPageSize": 10,
+        # pages come from the database, see load_page
+        "pagination": False,
         # the first Column is configured to use agGroupCellRenderer
         "columnDefs": [
             {
@@ -120,7 +101,10 @@ def run() :
                             {"field": "tool", "tooltipField": "tool"},
                             {"field": "input", "tooltipField": "input"},
                             {"field": "output", "tooltipField": "output"},
-                            {"field": "created_at", "tooltipField": "created_at"}
+                            {"field": "created_at", "tooltipField": "created_at"},
+                            # repeated events kept as one row: how many, and the last one
+                            {"field": "seen_count", "tooltipField": "seen_count"},
+                            {"field": "last_seen_at", "tooltipField": "last_seen_at"}
                         ],
                         "defaultColDef": {
                             "sortable": True,
@@ -5,15 +5,16 @@ import os
 
 async def run():
     asst_id = os.environ["ASSISTANT_ID"]
-    user_proxy = conversation.start_conversation(asst_id)
+    user_proxy = await conversation.start_conversation(asst_id)
     while (True):
         user_input = input("\nUser: ")
         if (user_input.lower() == "exit"):
             break
         user_proxy.send_user_message(user_input)
-        response = await user_proxy.get_assistant_message()
         print("Assistant: ")
-        print(response)
+        async for delta in user_proxy.stream_assistant_message():
+            print(delta, end="", flush=True)
+        print()
 
 
 if __name__ == '__main__':
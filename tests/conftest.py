@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No network and no shared state: database.py creates its dbstorage folder in the working directory, and
+# rows are written right away rather than from the write-behind thread.
+os.chdir(tempfile.mkdtemp(prefix="assistants-tests-"))
+os.environ["OPENAI_API_KEY"] = "test"
+os.environ["MEDIATOR_TYPE"] = "basic"
+os.environ["DB_WRITE_BEHIND"] = "false"
+os.environ["DB_COMPACT_EVENTS"] = "true"
+os.environ["RUN_STORE"] = "none"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    import database
+    database.create_tables()
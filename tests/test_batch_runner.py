@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+
+import httpx
+import openai
+import pytest
+
+import request_policy
+from batch_runner import AdmissionControl, BatchRunner
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://api.test/v1/threads/runs")
+    return openai.RateLimitError("rate limited", response=httpx.Response(429, request=request), body=None)
+
+
+def run_batch(runner, items):
+    async def run():
+        return [result async for result in runner.run(items)]
+    return asyncio.run(run())
+
+
+def test_the_limit_is_halved_once_per_burst_of_429s():
+    control = AdmissionControl(16)
+    control.throttle(60)
+    control.throttle(60)
+    assert control.limit == 8 and control.throttled == 2
+
+    control.paused_until = 0
+    control.throttle(60)
+    assert control.limit == 4
+
+
+def test_the_limit_recovers_by_one_after_as_many_successes():
+    control = AdmissionControl(4)
+    control.limit = 2
+    for _ in range(2):
+        control.active += 1
+        control.release()
+    assert control.limit == 3
+    control.active += 1
+    control.release(succeeded=False)
+    for _ in range(2):
+        control.active += 1
+        control.release()
+    assert control.limit == 3
+    control.active += 1
+    control.release()
+    assert control.limit == 4
+
+
+def test_no_prompt_is_admitted_before_the_retry_after():
+    async def run():
+        control = AdmissionControl(4)
+        control.throttle(0.2)
+        start = time.monotonic()
+        await control.acquire()
+        return time.monotonic() - start, control
+    waited, control = asyncio.run(run())
+
+    assert waited >= 0.19
+    assert control.active == 1 and control.limit == 2
+
+
+def test_prompts_beyond_the_limit_wait_for_a_release():
+    async def run():
+        control = AdmissionControl(1)
+        await control.acquire()
+        waiting = asyncio.create_task(control.acquire())
+        await asyncio.sleep(0.01)
+        admitted_before = waiting.done()
+        control.release()
+        await asyncio.wait_for(waiting, 1)
+        return admitted_before
+    assert asyncio.run(run()) is False
+
+
+def test_an_interrupted_batch_resumes_from_its_results_file(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(json.dumps({"id": "0", "reply": "done before", "error": None}) + "\n"
+                      + json.dumps({"id": "1", "reply": None, "error": "RuntimeError()"}) + "\n"
+                      + '{"id": "2", "rep')
+    runner = BatchRunner("asst_1", concurrency=2, output=str(output))
+    prompts = []
+
+    async def turn(prompt):
+        prompts.append(prompt)
+        return f"thread_{prompt}", f"reply to {prompt}"
+    runner.turn = turn
+
+    results = run_batch(runner, ["a", "b", "c", {"id": "x", "prompt": "d"}])
+    assert sorted(prompts) == ["b", "c", "d"]
+    assert sorted(result["id"] for result in results) == ["1", "2", "x"]
+    assert runner.stats()["skipped"] == 1
+    lines = [json.loads(line) for line in output.read_text().splitlines()[3:]]
+    assert sorted(line["reply"] for line in lines) == ["reply to b", "reply to c", "reply to d"]
+
+
+def test_rate_limited_prompts_are_tried_again_up_to_max_attempts():
+    runner = BatchRunner("asst_1", concurrency=4, max_attempts=3)
+    attempts = {}
+
+    async def turn(prompt):
+        attempts[prompt] = attempts.get(prompt, 0) + 1
+        if prompt == "always limited" or attempts[prompt] == 1:
+            raise rate_limit_error()
+        return "thread_1", "ok"
+    runner.turn = turn
+
+    results = {result["id"]: result for result in run_batch(runner, ["limited once", "always limited"])}
+    assert results["0"]["reply"] == "ok" and results["0"]["attempts"] == 2
+    assert "RateLimitError" in results["1"]["error"] and results["1"]["attempts"] == 3
+    assert runner.stats()["retries"] == 3 and runner.stats()["failed"] == 1
+
+
+def test_the_429s_retried_by_the_request_policy_lower_the_concurrency():
+    runner = BatchRunner("asst_1", concurrency=8)
+
+    async def turn(prompt):
+        # what request_policy does on a 429 it retries itself
+        request_policy.throttle_listener.get()(0.01)
+        return "thread_1", "ok"
+    runner.turn = turn
+
+    results = run_batch(runner, ["a"])
+    assert results[0]["error"] is None
+    assert runner.control.throttled == 1 and runner.control.limit == 4
+    assert request_policy.throttle_listener.get() is None
+
+
+def test_an_invalid_prompt_ends_the_batch():
+    runner = BatchRunner("asst_1")
+
+    async def turn(prompt):
+        return "thread_1", "ok"
+    runner.turn = turn
+
+    with pytest.raises(KeyError):
+        run_batch(runner, [{"id": "1", "text": "no prompt"}])
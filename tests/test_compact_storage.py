@@ -0,0 +1,58 @@
+import datetime
+
+import pytest
+from sqlalchemy import select, text
+
+import compact_storage
+import database
+
+LONG_OUTPUT = "The price of MSFT is 420.00 USD. " * 20
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path}/test.db")
+    database.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def insert(engine, type, output):
+    with engine.begin() as connection:
+        connection.execute(database.run_details.insert().values(run_id="run_1", type=type, output=output,
+                                                                created_at=datetime.datetime.now()))
+
+
+def stored(engine):
+    with engine.connect() as connection:
+        return connection.execute(text("select type, output from run_details order by id")).all()
+
+
+def read(engine):
+    with engine.connect() as connection:
+        return connection.execute(select(database.run_details.c.type, database.run_details.c.output)
+                                  .order_by(database.run_details.c.id)).all()
+
+
+def test_known_values_are_stored_as_codes_and_long_ones_compressed(engine, monkeypatch):
+    monkeypatch.setattr(compact_storage, "enabled", True)
+    insert(engine, "state_change", "running")
+    insert(engine, "retrieve_asst_msg", LONG_OUTPUT)
+    insert(engine, "execute_tool", "42")
+
+    (type, output), (_, compressed), (_, short) = stored(engine)
+    assert type == bytes([compact_storage.TYPES.index("state_change")])
+    assert output == bytes([compact_storage.STATES.index("running")])
+    assert isinstance(compressed, bytes) and len(compressed) < len(LONG_OUTPUT)
+    assert short == "42"
+    assert read(engine) == [("state_change", "running"), ("retrieve_asst_msg", LONG_OUTPUT), ("execute_tool", "42")]
+
+
+def test_rows_of_either_format_are_read_back_whatever_the_setting(engine, monkeypatch):
+    monkeypatch.setattr(compact_storage, "enabled", True)
+    insert(engine, "state_change", "running")
+    monkeypatch.setattr(compact_storage, "enabled", False)
+    insert(engine, "retrieve_asst_msg", LONG_OUTPUT)
+
+    assert stored(engine)[1] == ("retrieve_asst_msg", LONG_OUTPUT)
+    assert read(engine) == [("state_change", "running"), ("retrieve_asst_msg", LONG_OUTPUT)]
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import conversation
+from function_tools import local_functions
+
+
+class FakePrices():
+    def get_price(self, symbol):
+        return {"MSFT": 410.0, "AAPL": 190.0}[symbol]
+
+
+class RecordingMediator():
+    def __init__(self):
+        self.results = None
+
+    async def tools_executed(self, results):
+        self.results = results
+
+
+def tool_call(call_id, name, arguments):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def run_step(*tool_calls):
+    local_functions.set_price_provider(FakePrices())
+    mediator = RecordingMediator()
+    run_status = SimpleNamespace(id="run_1", required_action=SimpleNamespace(
+        submit_tool_outputs=SimpleNamespace(tool_calls=list(tool_calls))))
+    asyncio.run(conversation.UserProxy(mediator).execute_tools(run_status))
+    return {result["call_id"]: result for result in mediator.results}
+
+
+def test_malformed_arguments_fail_only_their_call():
+    results = run_step(tool_call("call_1", "get_stock_price", '{"symbol": "MSFT"}'),
+                       tool_call("call_2", "get_stock_price", '{"symbol": '),
+                       tool_call("call_3", "buy_or_sell", '["MSFT", "410"]'),
+                       tool_call("call_4", "get_stock_price", '{"symbol": "AAPL"}'))
+
+    assert results["call_1"]["output"] == 410.0
+    assert results["call_4"]["output"] == 190.0
+    assert results["call_2"]["output"]["error"].startswith("Malformed arguments for get_stock_price")
+    assert results["call_2"]["arguments"] == '{"symbol": '
+    assert "not a JSON object" in results["call_3"]["output"]["error"]
+
+
+def test_a_failing_tool_fails_only_its_call():
+    results = run_step(tool_call("call_1", "get_stock_price", '{"symbol": "MSFT"}'),
+                       tool_call("call_2", "get_stock_price", '{"symbol": "NOPE"}'),
+                       tool_call("call_3", "no_such_tool", '{}'))
+
+    assert results["call_1"]["output"] == 410.0
+    assert "error" in results["call_2"]["output"]
+    assert results["call_3"]["output"] == {"error": "Unknown function: no_such_tool"}
+
+
+def test_results_keep_the_order_of_the_calls():
+    calls = [tool_call(f"call_{i}", "buy_or_sell", '{"symbol": "MSFT", "price": "410"}') for i in range(5)]
+    results = run_step(*calls)
+    assert list(results) == [f"call_{i}" for i in range(5)]
+    assert all(result["output"] in ["buy", "sell", "hold"] for result in results.values())
+
+
+class FailingEngine():
+    def __init__(self, error):
+        self.error = error
+
+    async def watch(self, get_run, events=None):
+        yield SimpleNamespace(status="requires_action")
+        raise self.error
+
+
+class FailureMediator():
+    def __init__(self):
+        self.failed = None
+
+    async def action_required(self, run_status):
+        pass
+
+    async def run_failed(self, error):
+        self.failed = error
+
+
+def fail_run(monkeypatch, error):
+    cancelled = []
+
+    async def cancel_run(thread_id, run_id):
+        cancelled.append(run_id)
+    monkeypatch.setattr(conversation.openai_async_access, "cancel_run", cancel_run)
+    mediator = FailureMediator()
+    proxy = conversation.AssistantProxy(mediator, "asst_1")
+    proxy.thread_id, proxy.run_id = "thread_1", "run_1"
+    proxy.engine = FailingEngine(error)
+    asyncio.run(proxy.process())
+    return mediator, cancelled
+
+
+def test_a_failed_run_is_cancelled(monkeypatch):
+    mediator, cancelled = fail_run(monkeypatch, RuntimeError("tool outputs rejected"))
+    assert str(mediator.failed) == "tool outputs rejected"
+    assert cancelled == ["run_1"]
+
+
+def test_a_timed_out_run_is_cancelled(monkeypatch):
+    mediator, cancelled = fail_run(monkeypatch, conversation.RunTimeout("too slow"))
+    assert isinstance(mediator.failed, conversation.RunTimeout)
+    assert cancelled == ["run_1"]
@@ -0,0 +1,135 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import conversation
+import run_store
+from conversation_host import ConversationHost
+
+PENDING = SimpleNamespace(done=lambda: False)
+
+
+class FakeUserProxy():
+    def __init__(self, thread_id, reply="hi"):
+        self.mediator = SimpleNamespace(asst_proxy=SimpleNamespace(thread_id=thread_id, task=None))
+        self.task = None
+        self.reply = reply
+        self.sent = []
+
+    def busy(self):
+        self.task = PENDING
+
+    def send_user_message(self, message):
+        self.sent.append(message)
+
+    async def get_assistant_message(self):
+        return self.reply
+
+
+@pytest.fixture(autouse=True)
+def no_thread_pool(monkeypatch):
+    # a host turns the warm thread pool on, which would create threads through the API
+    monkeypatch.setattr(conversation.thread_pool, "size", conversation.thread_pool.size)
+
+
+def hosted(host, *thread_ids):
+    return [host.add(FakeUserProxy(thread_id)) for thread_id in thread_ids]
+
+
+def test_least_recently_used_idle_conversations_are_evicted_beyond_the_cap():
+    async def run():
+        host = ConversationHost(max_conversations=2)
+        hosted(host, "a", "b")
+        host.get("a")
+        hosted(host, "c")
+        await host.close()
+        return host
+    host = asyncio.run(run())
+
+    assert host.evictions == 1
+    with pytest.raises(KeyError):
+        host.get("b")
+
+
+def test_busy_conversations_are_kept_and_the_new_one_too():
+    async def run():
+        host = ConversationHost(max_conversations=1)
+        hosted(host, "a")
+        host.get("a").busy()
+        hosted(host, "b")
+        hosted(host, "c")
+        conversations, stats = list(host.conversations), host.stats()
+        await host.close()
+        return conversations, stats
+    conversations, stats = asyncio.run(run())
+
+    # b was idle, a is busy, and c was just added
+    assert conversations == ["a", "c"]
+    assert stats == {"conversations": 2, "busy": 1, "evictions": 1}
+
+
+def test_idle_conversations_are_evicted_after_the_timeout():
+    async def run():
+        host = ConversationHost(idle_timeout=60)
+        hosted(host, "a", "b", "c")
+        for thread_id in ["a", "b"]:
+            host.conversations[thread_id].last_used -= 61
+        host.get("b").busy()
+        host.evict_idle()
+        await host.close()
+        return host
+    host = asyncio.run(run())
+
+    assert host.evictions == 1
+    assert "a" not in host.conversations
+
+
+def test_send_returns_the_reply_of_the_conversation():
+    async def run():
+        host = ConversationHost()
+        user_proxies = {thread_id: FakeUserProxy(thread_id, reply=f"reply to {thread_id}") for thread_id in "ab"}
+        for user_proxy in user_proxies.values():
+            host.add(user_proxy)
+        reply = await host.send("b", "hello")
+        await host.close()
+        return reply, user_proxies
+    reply, user_proxies = asyncio.run(run())
+
+    assert reply == "reply to b"
+    assert user_proxies["b"].sent == ["hello"] and user_proxies["a"].sent == []
+
+
+def test_an_evicted_conversation_is_resumed_with_its_thread():
+    async def run():
+        host = ConversationHost()
+        thread_id = host.resume_conversation("asst_1", "thread_1")
+        user_proxy = host.get(thread_id)
+        await host.close()
+        return thread_id, user_proxy
+    thread_id, user_proxy = asyncio.run(run())
+
+    assert thread_id == "thread_1"
+    assert user_proxy.mediator.asst_proxy.asst_id == "asst_1"
+
+
+def test_recover_resumes_the_active_runs_not_already_hosted(monkeypatch):
+    states = run_store.MemoryRunStore()
+    for thread_id, state in [("thread_1", "running"), ("thread_2", "ready"), ("thread_3", "action_required"),
+                             ("thread_4", "started")]:
+        states.save(thread_id, assistant_id="asst_1", run_id=f"run_{thread_id}", state=state)
+    monkeypatch.setattr(conversation, "run_states", states)
+    resumed = []
+    monkeypatch.setattr(conversation, "resume_run", lambda user_proxy: resumed.append(user_proxy))
+
+    async def run():
+        host = ConversationHost()
+        hosted(host, "thread_4")
+        recovered = host.recover()
+        await host.close()
+        return recovered
+    recovered = asyncio.run(run())
+
+    assert sorted(recovered) == ["thread_1", "thread_3"]
+    assert sorted(user_proxy.mediator.asst_proxy.run_id for user_proxy in resumed) == ["run_thread_1",
+                                                                                      "run_thread_3"]
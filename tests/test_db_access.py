@@ -0,0 +1,83 @@
+import pytest
+
+import database
+import db_access
+from history import expand_steps
+from models import XRunDetail
+
+
+@pytest.fixture(autouse=True)
+def engine(tmp_path, monkeypatch):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path}/test.db")
+    database.metadata.create_all(bind=engine)
+    monkeypatch.setattr(db_access, "engine", engine)
+    monkeypatch.setattr(db_access, "writer", None)
+    monkeypatch.setattr(db_access, "compact", True)
+    monkeypatch.setattr(db_access, "held", {})
+    yield engine
+    engine.dispose()
+
+
+def store(run_id, type, output=None):
+    db_access.store(XRunDetail(run_id=run_id, type=type, output=output))
+
+
+def test_repeated_events_are_stored_as_one_row_with_a_count():
+    for status in ["queued", "in_progress", "in_progress", "in_progress", "completed"]:
+        store("run_1", "check_run_status", status)
+    db_access.flush("run_1")
+
+    steps = db_access.get_steps_as_df(["run_1"])
+    assert list(steps["output"]) == ["queued", "in_progress", "completed"]
+    assert list(steps["seen_count"]) == [1, 3, 1]
+    in_progress = steps.iloc[1]
+    assert in_progress["last_seen_at"] > in_progress["created_at"]
+
+
+def test_expand_steps_gives_back_one_row_per_event():
+    events = [("check_run_status", "queued"), ("state_change", "started"), ("check_run_status", "in_progress"),
+              ("state_change", "running"), ("check_run_status", "in_progress"), ("state_change", "running"),
+              ("check_run_status", "in_progress"), ("state_change", "running"), ("execute_tool", "42"),
+              ("check_run_status", "completed"), ("state_change", "completed")]
+    for type, output in events:
+        store("run_1", type, output)
+    db_access.flush("run_1")
+
+    steps = db_access.get_steps_as_df(["run_1"])
+    assert len(steps) < len(events)
+    expanded = expand_steps(steps)
+    assert len(expanded) == len(events)
+    # per type, the events come back in the order they were stored
+    for type in ["check_run_status", "state_change", "execute_tool"]:
+        assert (list(expanded[expanded["type"] == type]["output"])
+                == [output for event_type, output in events if event_type == type])
+
+
+def test_only_status_checks_and_state_changes_are_compacted():
+    for i in range(3):
+        store("run_1", "execute_tool", "same result")
+        store("TBD", "check_run_status", "queued")
+    db_access.flush()
+
+    assert len(db_access.get_steps_as_df(["run_1"])) == 3
+    assert list(db_access.get_steps_as_df(["TBD"])["seen_count"].fillna(1)) == [1, 1, 1]
+
+
+def test_held_rows_are_written_when_the_run_is_released():
+    store("run_1", "check_run_status", "in_progress")
+    store("run_2", "check_run_status", "in_progress")
+    assert db_access.get_steps_as_df(["run_1", "run_2"]).empty
+
+    db_access.release("run_1")
+    assert list(db_access.get_steps_as_df(["run_1", "run_2"])["run_id"]) == ["run_1"]
+    assert list(db_access.held) == [("run_2", "check_run_status")]
+
+
+def test_without_compaction_every_event_is_a_row(monkeypatch):
+    monkeypatch.setattr(db_access, "compact", False)
+    for i in range(3):
+        store("run_1", "check_run_status", "in_progress")
+
+    steps = db_access.get_steps_as_df(["run_1"])
+    assert len(steps) == 3
+    assert len(expand_steps(steps)) == 3
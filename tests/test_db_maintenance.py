@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+import compact_storage
+import database
+import db_maintenance
+import run_metrics
+from models import XRunDetail, XRunSummary
+
+now = datetime.datetime.now()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path}/test.db")
+    database.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def days_ago(days, seconds=0):
+    return now - datetime.timedelta(days=days) + datetime.timedelta(seconds=seconds)
+
+
+# a run with a tool call, whose last event is `days` old
+def run(run_id, days):
+    return [XRunDetail(run_id=run_id, type="submit_user_msg", created_at=days_ago(days)),
+            XRunDetail(run_id=run_id, type="state_change", output="started", created_at=days_ago(days)),
+            XRunDetail(run_id=run_id, type="execute_tool", output="42", created_at=days_ago(days, 1)),
+            XRunDetail(run_id=run_id, type="state_change", output="completed", created_at=days_ago(days, 2))]
+
+
+def write(engine, records, metrics=True):
+    with Session(engine) as session:
+        session.add_all(records)
+        if metrics:
+            run_metrics.apply(session, records)
+        session.commit()
+
+
+def run_ids(engine, model):
+    with Session(engine) as session:
+        return sorted(set(session.scalars(select(model.run_id))))
+
+
+def test_old_runs_are_rolled_up_into_their_summaries(engine):
+    write(engine, run("run_old", 40) + run("run_new", 1))
+    # written with RUN_METRICS=false: summarized by the roll-up
+    write(engine, run("run_unsummarized", 40), metrics=False)
+    write(engine, [XRunDetail(run_id="TBD", type="submit_user_msg", created_at=days_ago(40))], metrics=False)
+
+    assert db_maintenance.roll_up(engine, days=30) == (2, 9)
+
+    assert run_ids(engine, XRunDetail) == ["run_new"]
+    with Session(engine) as session:
+        summaries = {summary.run_id: summary for summary in session.scalars(select(XRunSummary))}
+    assert sorted(summaries) == ["run_new", "run_old", "run_unsummarized"]
+    for run_id in ["run_old", "run_unsummarized"]:
+        assert summaries[run_id].num_tool_calls == 1 and summaries[run_id].num_events == 4
+        assert summaries[run_id].duration == 2 and summaries[run_id].rolled_up_at is not None
+    assert summaries["run_new"].rolled_up_at is None
+
+
+def test_recode_rewrites_the_rows_in_the_current_format(engine, monkeypatch):
+    write(engine, run("run_1", 1))
+    monkeypatch.setattr(compact_storage, "enabled", True)
+
+    assert db_maintenance.recode(engine, chunk_size=3) == 4
+
+    with engine.connect() as connection:
+        types = connection.execute(text("select type from run_details")).scalars().all()
+    assert all(isinstance(type, bytes) and len(type) == 1 for type in types)
+    with Session(engine) as session:
+        assert [detail.output for detail in session.scalars(select(XRunDetail).order_by(XRunDetail.id))] == \
+            [None, "started", "42", "completed"]
+
+
+def test_vacuum_keeps_the_rows(engine):
+    write(engine, run("run_1", 40) + run("run_2", 1))
+    db_maintenance.roll_up(engine, days=30)
+    db_maintenance.vacuum(engine)
+
+    assert run_ids(engine, XRunDetail) == ["run_2"]
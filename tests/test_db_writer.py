@@ -0,0 +1,74 @@
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+import database
+import db_writer
+from models import XRunDetail
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path}/test.db")
+    database.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def detail(run_id):
+    return XRunDetail(run_id=run_id, type="execute_tool", output="42", created_at=datetime.datetime.now())
+
+
+def test_flush_async_waits_for_the_rows_queued_before_it(engine):
+    writer = db_writer.WriteBehindQueue(engine, max_delay=60)
+    for i in range(3):
+        writer.put(detail(f"run_{i}"))
+    asyncio.run(writer.flush_async())
+    assert writer.rows_written == 3
+    writer.close()
+
+
+def test_flushes_requested_during_a_write_share_the_next_transaction(engine):
+    writing, release = threading.Event(), threading.Event()
+
+    def on_write(session, batch):
+        writing.set()
+        release.wait(5)
+
+    writer = db_writer.WriteBehindQueue(engine, max_delay=60, on_write=on_write)
+
+    async def run():
+        writer.put(detail("run_0"))
+        first = asyncio.create_task(writer.flush_async())
+        await asyncio.to_thread(writing.wait, 5)
+        # e.g. turns ending while the first one's rows are being written, each with its rows and its flush
+        flushes = []
+        for i in range(1, 4):
+            writer.put(detail(f"run_{i}"))
+            flushes.append(asyncio.create_task(writer.flush_async()))
+            await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *flushes)
+    asyncio.run(run())
+
+    assert writer.rows_written == 4
+    assert writer.batches_written == 2
+    writer.close()
+
+
+def test_a_cancelled_flush_does_not_stop_the_writer(engine):
+    writer = db_writer.WriteBehindQueue(engine, max_delay=60)
+
+    async def run():
+        writer.put(detail("run_0"))
+        flush = asyncio.create_task(writer.flush_async())
+        await asyncio.sleep(0)
+        flush.cancel()
+        writer.put(detail("run_1"))
+        await asyncio.wait_for(writer.flush_async(), 5)
+    asyncio.run(run())
+
+    assert writer.rows_written == 2
+    writer.close()
@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import conversation
+from function_tools import local_functions
+
+
+class FakePrices():
+    def __init__(self):
+        self.batches = []
+        self.single = []
+
+    def get_price(self, symbol):
+        self.single.append(symbol)
+        return 100.0
+
+    def get_prices(self, symbols):
+        self.batches.append(symbols)
+        return {symbol: 100.0 for symbol in symbols}
+
+
+def prefetch(monkeypatch, calls, ttl=60):
+    provider = FakePrices()
+    local_functions.set_price_provider(provider)
+    monkeypatch.setitem(local_functions.cache.ttls, "get_stock_price", ttl)
+    asyncio.run(local_functions.prefetch_async(calls))
+    return provider
+
+
+def test_prefetch_fetches_the_symbols_of_a_step_in_one_request(monkeypatch):
+    provider = prefetch(monkeypatch, [("get_stock_price", {"symbol": "msft"}), ("buy_or_sell", {"symbol": "MSFT"}),
+                         ("get_stock_price", {"symbol": "AAPL"})])
+    assert provider.batches == [["MSFT", "AAPL"]]
+    assert local_functions.get_stock_price("MSFT") == 100.0
+    assert provider.single == []
+
+
+def test_prefetch_skips_malformed_symbols(monkeypatch):
+    provider = prefetch(monkeypatch, [("get_stock_price", {"symbol": 42}), ("get_stock_price", {}),
+                         ("get_stock_price", {"symbol": "MSFT"}), ("get_stock_price", {"symbol": "AAPL"})])
+    assert provider.batches == [["MSFT", "AAPL"]]
+
+
+def test_no_prefetch_without_caching(monkeypatch):
+    provider = prefetch(monkeypatch, [("get_stock_price", {"symbol": "MSFT"}), ("get_stock_price", {"symbol": "AAPL"})], ttl=0)
+    assert provider.batches == []
+
+
+def test_prefetch_counts_as_a_get_stock_price_call(monkeypatch):
+    calls = local_functions.runtime.get("get_stock_price").calls
+    prefetch(monkeypatch, [("get_stock_price", {"symbol": "MSFT"}), ("get_stock_price", {"symbol": "AAPL"})])
+    assert local_functions.runtime.get("get_stock_price").calls == calls + 1
+
+
+class RecordingMediator():
+    async def tools_executed(self, results):
+        self.results = results
+
+
+def test_a_malformed_symbol_fails_only_its_call_in_a_multi_call_step():
+    local_functions.set_price_provider(FakePrices())
+    tool_calls = [SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name="get_stock_price", arguments=arguments))
+                  for i, arguments in enumerate(['{"symbol": "MSFT"}', '{"symbol": 42}', '{"symbol": "AAPL"}'])]
+    run_status = SimpleNamespace(id="run_1", required_action=SimpleNamespace(
+        submit_tool_outputs=SimpleNamespace(tool_calls=tool_calls)))
+    mediator = RecordingMediator()
+    asyncio.run(conversation.UserProxy(mediator).execute_tools(run_status))
+
+    outputs = [result["output"] for result in mediator.results]
+    assert outputs[0] == 100.0 and outputs[2] == 100.0
+    assert "error" in outputs[1]
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import pytest
+
+import openai_async_access
+
+
+class FakeClient():
+    def __init__(self):
+        self.closed_on = None
+
+    async def close(self):
+        self.closed_on = asyncio.get_running_loop()
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    for name in ["client", "client_loop", "client_opening", "client_closer"]:
+        monkeypatch.setattr(openai_async_access, name, None)
+    clients = []
+
+    def create_client():
+        clients.append(FakeClient())
+        return clients[-1]
+    monkeypatch.setattr(openai_async_access, "create_client", create_client)
+    return clients
+
+
+async def open_client():
+    await openai_async_access.open_client()
+    return openai_async_access.get_oai_client(), asyncio.get_running_loop()
+
+
+def test_concurrent_requests_share_the_client_of_their_loop(clients):
+    async def run():
+        return await asyncio.gather(*[open_client() for _ in range(5)])
+    opened = asyncio.run(run())
+
+    assert len(clients) == 1
+    assert all(oai_client is clients[0] for oai_client, loop in opened)
+
+
+def test_the_client_of_a_loop_is_closed_when_the_loop_shuts_down(clients):
+    first, first_loop = asyncio.run(open_client())
+    assert first.closed_on is first_loop
+
+    second, second_loop = asyncio.run(open_client())
+    assert second is not first and second.closed_on is second_loop
+
+
+def test_a_replaced_client_is_closed_on_its_loop_still_running(clients):
+    other_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=other_loop.run_forever)
+    thread.start()
+    try:
+        first, _ = asyncio.run_coroutine_threadsafe(open_client(), other_loop).result(5)
+        second, _ = asyncio.run(open_client())
+        # the closing is scheduled on the other loop
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), other_loop).result(5)
+        assert first.closed_on is other_loop
+        assert second is not first
+    finally:
+        other_loop.call_soon_threadsafe(other_loop.stop)
+        thread.join()
+        other_loop.close()
+
+
+def test_a_loop_without_an_opened_client_cannot_use_another_loops(clients):
+    asyncio.run(open_client())
+
+    async def run():
+        openai_async_access.get_oai_client()
+    with pytest.raises(Exception, match="open_client"):
+        asyncio.run(run())
+
+
+def test_close_closes_the_client_and_the_next_request_opens_another(clients):
+    async def run():
+        first, _ = await open_client()
+        await openai_async_access.close()
+        assert first.closed_on is asyncio.get_running_loop()
+        second, _ = await open_client()
+        return first, second
+    first, second = asyncio.run(run())
+
+    assert second is not first and len(clients) == 2
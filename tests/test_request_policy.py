@@ -0,0 +1,179 @@
+import asyncio
+
+import httpx
+import pytest
+
+import request_policy
+from request_policy import CircuitBreaker, CircuitOpen, RequestPolicy
+
+
+def status_error(status, headers=None):
+    request = httpx.Request("POST", "https://api.test/v1/threads")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return httpx.HTTPStatusError(f"{status}", request=request, response=response)
+
+
+def connection_error():
+    return httpx.ConnectError("connection refused", request=httpx.Request("GET", "https://api.test/v1/threads"))
+
+
+def make_policy(**kwargs):
+    defaults = dict(rpm=0, tpm=0, max_retries=2, backoff_base=0.001, backoff_max=0.001,
+                    breaker_threshold=3, breaker_cooldown=60)
+    return RequestPolicy(**{**defaults, **kwargs})
+
+
+def test_retry_after_headers():
+    assert request_policy.retry_after({"retry-after-ms": "250"}) == 0.25
+    assert request_policy.retry_after({"retry-after": "3"}) == 3
+    assert request_policy.retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) is None
+    assert request_policy.retry_after({}) is None
+
+
+@pytest.mark.parametrize("error, read, retried", [
+    # rate limited: the request was not processed, so reads and writes are retried
+    (status_error(429, {"retry-after": "7"}), False, True),
+    (status_error(429, {"retry-after": "7"}), True, True),
+    # server and connection errors: only reads, as a write may have been processed
+    (status_error(500), True, True),
+    (status_error(500), False, False),
+    (status_error(503), True, True),
+    (connection_error(), True, True),
+    (connection_error(), False, False),
+    # the request itself is wrong
+    (status_error(400), True, False),
+    (status_error(404), True, False),
+])
+def test_retry_classification(error, read, retried):
+    policy = make_policy()
+    delay = policy.on_error(policy.breaker("op"), error, 0, read)
+    assert (delay is not None) == retried
+    assert policy.retried == (1 if retried else 0)
+    assert policy.failed == (0 if retried else 1)
+
+
+def test_429_waits_for_the_retry_after():
+    policy = make_policy(backoff_base=100, backoff_max=100)
+    assert policy.on_error(policy.breaker("op"), status_error(429, {"retry-after-ms": "1500"}), 0, False) == 1.5
+    assert policy.throttled == 1
+
+
+def test_no_retry_beyond_max_retries():
+    policy = make_policy(max_retries=2)
+    assert policy.on_error(policy.breaker("op"), status_error(429), 2, True) is None
+    assert policy.on_error(policy.breaker("op"), status_error(500), 2, True) is None
+    assert policy.failed == 2
+
+
+def test_errors_not_from_the_api_are_neither_retried_nor_counted():
+    policy = make_policy()
+    breaker = policy.breaker("op")
+    assert policy.on_error(breaker, ValueError("bug"), 0, True) is None
+    assert policy.failed == 0
+    assert breaker.failures == 0
+
+
+@pytest.mark.parametrize("error, counted", [
+    (status_error(500), True),
+    (connection_error(), True),
+    (status_error(429), False),
+    (status_error(400), False),
+])
+def test_breaker_counts_only_transient_failures(error, counted):
+    policy = make_policy()
+    breaker = policy.breaker("op")
+    breaker.failures = 1
+    policy.on_error(breaker, error, 0, True)
+    # any answer from the API shows it is up, and resets the count
+    assert breaker.failures == (2 if counted else 0)
+
+
+def test_breaker_opens_after_the_threshold_then_lets_a_trial_through():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state() == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    assert breaker.rejected == 1
+
+    breaker.opened_at -= 60
+    breaker.check()
+    # the others wait for the trial's outcome
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.record_success()
+    assert breaker.state() == "closed"
+    breaker.check()
+    assert breaker.opens == 1
+
+
+def test_breakers_are_per_operation():
+    policy = make_policy(breaker_threshold=1)
+    policy.on_error(policy.breaker("get_run"), status_error(500), 0, True)
+    assert policy.breaker("get_run").state() == "open"
+    assert policy.breaker("create_message").state() == "closed"
+
+
+def test_call_async_retries_until_success():
+    policy = make_policy()
+    errors = [status_error(429, {"retry-after-ms": "1"}), status_error(502)]
+
+    async def attempt():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert asyncio.run(policy.call_async("get_run", attempt, read=True)) == "ok"
+    assert policy.retried == 2
+    assert policy.breaker("get_run").state() == "closed"
+
+
+def test_call_does_not_retry_a_failed_write():
+    policy = make_policy()
+    attempts = []
+
+    def attempt():
+        attempts.append(1)
+        raise status_error(500)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        policy.call("create_message", attempt)
+    assert len(attempts) == 1
+
+
+def test_call_fails_fast_once_the_circuit_is_open():
+    policy = make_policy(max_retries=0, breaker_threshold=2)
+    attempts = []
+
+    def attempt():
+        attempts.append(1)
+        raise connection_error()
+
+    for i in range(2):
+        with pytest.raises(httpx.ConnectError):
+            policy.call("get_run", attempt, read=True)
+    with pytest.raises(CircuitOpen):
+        policy.call("get_run", attempt, read=True)
+    assert len(attempts) == 2
+    assert policy.stats()["open_circuits"] == ["get_run"]
+
+
+def test_throttle_listener_sees_the_429s_that_are_retried():
+    policy = make_policy()
+    seen = []
+    errors = [status_error(429, {"retry-after-ms": "1"})]
+
+    async def attempt():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    async def run():
+        request_policy.throttle_listener.set(seen.append)
+        return await policy.call_async("create_run", attempt)
+
+    assert asyncio.run(run()) == "ok"
+    assert seen == [0.001]
+    assert request_policy.throttle_listener.get() is None
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from run_engine import RunEngine, RunTimeout
+
+
+class RecordingEngine(RunEngine):
+    def __init__(self, **kwargs):
+        super().__init__(**{"timeout": 5, "min_interval": 0.001, "max_interval": 0.004, "factor": 2, "jitter": 0,
+                            **kwargs})
+        self.intervals = []
+
+    def with_jitter(self, interval):
+        self.intervals.append(interval)
+        return interval
+
+
+def runs(*statuses):
+    return [SimpleNamespace(status=status) for status in statuses]
+
+
+def fetcher(statuses):
+    remaining = runs(*statuses)
+
+    async def fetch():
+        return remaining.pop(0)
+    return fetch
+
+
+def watch(engine, fetch, events=None):
+    async def collect():
+        return [run.status async for run in engine.watch(fetch, events)]
+    return asyncio.run(collect())
+
+
+async def stream(*statuses, stall=None):
+    for run in runs(*statuses):
+        yield run
+    if stall:
+        await asyncio.sleep(stall)
+
+
+def test_polls_until_a_terminal_status():
+    engine = RecordingEngine()
+    statuses = ["queued", "in_progress", "in_progress", "requires_action", "in_progress", "completed"]
+    assert watch(engine, fetcher(statuses)) == statuses
+
+
+def test_backs_off_while_the_status_stays_the_same():
+    engine = RecordingEngine()
+    watch(engine, fetcher(["queued", "in_progress", "in_progress", "in_progress", "in_progress", "completed"]))
+    # a new status starts over from min_interval; the interval is capped at max_interval
+    assert engine.intervals == [0.001, 0.001, 0.002, 0.004, 0.004]
+
+
+def test_no_wait_before_acting_on_requires_action():
+    engine = RecordingEngine()
+    watch(engine, fetcher(["requires_action", "completed"]))
+    assert engine.intervals == []
+
+
+def test_times_out_while_polling():
+    engine = RecordingEngine(timeout=0.05, max_interval=0.01)
+
+    async def fetch():
+        return SimpleNamespace(status="in_progress")
+    with pytest.raises(RunTimeout):
+        watch(engine, fetch)
+
+
+def test_events_are_used_instead_of_polls():
+    engine = RecordingEngine()
+    polls = []
+
+    async def fetch():
+        polls.append(1)
+    assert watch(engine, fetch, stream("queued", "in_progress", "completed")) == ["queued", "in_progress", "completed"]
+    assert polls == []
+
+
+def test_polls_once_the_stream_ends_without_a_terminal_status():
+    engine = RecordingEngine()
+    # e.g. the stream of a run that paused for tool outputs, and was not followed by another
+    statuses = watch(engine, fetcher(["in_progress", "completed"]), stream("queued", "requires_action"))
+    assert statuses == ["queued", "requires_action", "in_progress", "completed"]
+
+
+def test_times_out_while_the_stream_sends_nothing():
+    engine = RecordingEngine(timeout=0.1)
+    start = time.monotonic()
+    with pytest.raises(RunTimeout):
+        watch(engine, fetcher([]), stream("queued", stall=10))
+    assert time.monotonic() - start < 2
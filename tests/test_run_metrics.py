@@ -0,0 +1,142 @@
+import datetime
+import json
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import database
+import run_metrics
+from models import XConversation, XRun, XRunDetail, XRunSummary, XConversationSummary
+
+t0 = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+
+def at(seconds):
+    return t0 + datetime.timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path}/test.db")
+    database.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def conversation(thread_id="thread_1", seconds=0):
+    return XConversation(thread_id=thread_id, default_assistant_id="asst_1", created_at=at(seconds))
+
+
+def run(run_id="run_1", thread_id="thread_1", seconds=0):
+    return XRun(run_id=run_id, thread_id=thread_id, assistant_id="asst_1", created_at=at(seconds))
+
+
+def detail(type, output=None, seconds=0, run_id="run_1", seen_count=None, last_seen=None):
+    return XRunDetail(run_id=run_id, type=type, output=output, created_at=at(seconds), seen_count=seen_count,
+                      last_seen_at=at(last_seen) if last_seen is not None else None)
+
+
+# a turn with one tool call, 0.5 s long, and the next turn starting 0.5 s after it
+def turn():
+    return [conversation(), run(),
+            detail("submit_user_msg"),
+            detail("state_change", "started", 0.0),
+            detail("check_run_status", "in_progress", 0.1, seen_count=3, last_seen=0.2),
+            detail("state_change", "running", 0.1),
+            detail("execute_tool", "42", 0.25),
+            detail("state_change", "action_required", 0.2),
+            detail("check_run_status", "completed", 0.5),
+            detail("state_change", "completed", 0.5),
+            detail("state_change", "ready", 1.0)]
+
+
+def write(engine, records, batch_size=None):
+    batch_size = batch_size or len(records)
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        with Session(engine) as session:
+            session.add_all(batch)
+            run_metrics.apply(session, batch)
+            session.commit()
+
+
+def summaries(engine):
+    with Session(engine) as session:
+        runs = {summary.run_id: summary_dict(summary) for summary in session.scalars(select(XRunSummary))}
+        conversations = {summary.thread_id: summary_dict(summary)
+                         for summary in session.scalars(select(XConversationSummary))}
+    return runs, conversations
+
+
+def summary_dict(summary):
+    values = {column.name: getattr(summary, column.name) for column in summary.__table__.columns if column.name != "id"}
+    if "state_times" in values:
+        values["state_times"] = {state: round(seconds, 6) for state, seconds in json.loads(values["state_times"]).items()}
+        values["duration"] = round(values["duration"], 6)
+    return values
+
+
+def test_counts_of_a_run_and_its_conversation(engine):
+    write(engine, turn())
+    runs, conversations = summaries(engine)
+    summary = runs["run_1"]
+    # the compacted row stands for 3 polls
+    assert (summary["num_events"], summary["num_polls"], summary["num_tool_calls"]) == (11, 4, 1)
+    assert summary["thread_id"] == "thread_1"
+    assert conversations["thread_1"]["num_runs"] == 1
+    assert conversations["thread_1"]["num_events"] == 11
+
+
+def test_the_next_turn_starting_is_not_part_of_the_run(engine):
+    write(engine, turn())
+    summary = summaries(engine)[0]["run_1"]
+    assert summary["duration"] == 0.5
+    assert summary["ended_at"] == at(0.5)
+    assert summary["state"] == "completed"
+    assert summary["state_times"] == {"started": 0.1, "running": 0.1, "action_required": 0.3}
+
+
+def test_time_per_state_adds_up_repeated_states(engine):
+    write(engine, [conversation(), run(),
+                   detail("state_change", "running", 0), detail("state_change", "action_required", 1),
+                   detail("state_change", "running", 1.5), detail("state_change", "completed", 3.5)])
+    assert summaries(engine)[0]["run_1"]["state_times"] == {"running": 3.0, "action_required": 0.5}
+
+
+def test_a_failed_run_takes_no_more_state_time(engine):
+    write(engine, [conversation(), run(), detail("state_change", "running", 0), detail("state_change", "failed", 1),
+                   detail("state_change", "ready", 20), detail("state_change", "started", 21)])
+    summary = summaries(engine)[0]["run_1"]
+    assert summary["state"] == "failed"
+    assert summary["state_times"] == {"running": 1.0}
+    assert summary["duration"] == 21.0
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 5])
+def test_batches_add_up_to_the_same_summaries(engine, tmp_path, batch_size):
+    write(engine, turn())
+    other = database.create_db_engine(f"sqlite:///{tmp_path}/batched.db")
+    database.metadata.create_all(bind=other)
+    write(other, turn(), batch_size)
+    assert summaries(other) == summaries(engine)
+    other.dispose()
+
+
+def test_events_written_before_their_run_count_for_its_conversation(engine):
+    write(engine, [conversation(), detail("check_run_status", "queued", 0.1), detail("execute_tool", "42", 0.2)])
+    assert summaries(engine)[1]["thread_1"]["num_events"] == 0
+    write(engine, [run(seconds=0.0)])
+    runs, conversations = summaries(engine)
+    assert conversations["thread_1"]["num_events"] == 2
+    assert conversations["thread_1"]["num_tool_calls"] == 1
+    assert runs["run_1"]["started_at"] == at(0)
+
+
+def test_rebuild_gives_the_incremental_summaries(engine):
+    write(engine, turn() + [run("run_2", seconds=2), detail("state_change", "started", 2, run_id="run_2"),
+                            detail("state_change", "completed", 2.75, run_id="run_2")], batch_size=3)
+    incremental = summaries(engine)
+    run_metrics.rebuild(engine)
+    assert summaries(engine) == incremental
+    assert incremental[1]["thread_1"]["num_runs"] == 2
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+import database
+import run_store
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path}/test.db")
+    database.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+def test_states_are_written_behind_and_read_back(engine):
+    store = run_store.SqliteRunStore(engine, write_behind=True)
+    store.save("thread_1", assistant_id="asst_1", run_id="run_1", state="running")
+    store.save("thread_1", assistant_id="asst_1", run_id="run_1", state="completed", asst_message="done")
+    assert store.flush(5)
+
+    state = run_store.SqliteRunStore(engine, write_behind=False).get("thread_1")
+    assert state["assistant_id"] == "asst_1" and state["run_id"] == "run_1"
+    assert state["state"] == "completed" and state["asst_message"] == "done"
+
+
+def test_get_and_active_include_the_states_not_written_yet(engine):
+    writing, release = threading.Event(), threading.Event()
+    store = run_store.SqliteRunStore(engine, write_behind=True)
+    store.save("thread_1", assistant_id="asst_1", run_id="run_1", state="running")
+    store.save("thread_2", assistant_id="asst_1", run_id="run_2", state="running")
+    assert store.flush(5)
+
+    write = store._write
+
+    def stuck_write(states):
+        writing.set()
+        release.wait(5)
+        write(states)
+    store._write = stuck_write
+    # e.g. the database is locked: thread_1's run ends and thread_3's starts, neither written yet
+    store.save("thread_1", assistant_id="asst_1", run_id="run_1", state="completed")
+    store.save("thread_3", assistant_id="asst_1", run_id="run_3", state="started")
+    assert writing.wait(5)
+    store.save("thread_3", assistant_id="asst_1", run_id="run_3", state="running")
+
+    active = store.active(timeout=0.1)
+    assert sorted(state["thread_id"] for state in active) == ["thread_2", "thread_3"]
+    assert store.get("thread_3")["state"] == "running" and store.get("thread_3")["assistant_id"] == "asst_1"
+    release.set()
+    assert store.flush(5)
+    assert sorted(state["thread_id"] for state in store.active()) == ["thread_2", "thread_3"]
+
+
+@pytest.mark.parametrize("store", ["sqlite", "memory"])
+def test_active_is_filtered_by_shard(engine, store):
+    store = run_store.SqliteRunStore(engine, write_behind=False) if store == "sqlite" else run_store.MemoryRunStore()
+    thread_ids = [f"thread_{i}" for i in range(20)]
+    for thread_id in thread_ids:
+        store.save(thread_id, assistant_id="asst_1", state="running")
+    store.save("thread_0", assistant_id="asst_1", state="completed")
+
+    shards = [sorted(state["thread_id"] for state in store.active(shard, 3)) for shard in range(3)]
+    assert sorted(sum(shards, [])) == sorted(thread_ids[1:])
+    for shard, shard_thread_ids in enumerate(shards):
+        assert all(run_store.shard_of(thread_id, 3) == shard for thread_id in shard_thread_ids)
@@ -0,0 +1,91 @@
+import asyncio
+import queue
+from types import SimpleNamespace
+
+import pytest
+
+import conversation
+import run_store
+import run_workers
+
+
+class FakeHost():
+    def __init__(self, states, thread_id="thread_1"):
+        self.states = states
+        self.thread_id = thread_id
+        self.conversations = {}
+        self.resumed = []
+        self.evicted = []
+
+    async def start_conversation(self, asst_id):
+        self.states.save(self.thread_id, assistant_id=asst_id, state="new")
+        self.conversations[self.thread_id] = asst_id
+        return self.thread_id
+
+    def resume_conversation(self, asst_id, thread_id):
+        state = self.states.get(thread_id)
+        if state is None:
+            raise KeyError(thread_id)
+        self.resumed.append((asst_id, thread_id))
+        self.conversations[thread_id] = state["assistant_id"]
+
+    def evict(self, thread_id):
+        self.evicted.append(thread_id)
+        del self.conversations[thread_id]
+
+    async def send(self, thread_id, message):
+        return f"{self.conversations[thread_id]} replies to {message}"
+
+
+@pytest.fixture
+def states(monkeypatch):
+    states = run_store.MemoryRunStore()
+    monkeypatch.setattr(conversation, "run_states", states)
+    return states
+
+
+def handle(host, shard, request):
+    results = queue.Queue()
+    asyncio.run(run_workers.handle(host, shard, 2, request, results))
+    return results.get_nowait()
+
+
+def test_a_conversation_of_another_shard_is_handed_over_through_the_run_store(states):
+    shard = run_store.shard_of("thread_1", 2)
+    starting, taking_over = FakeHost(states), FakeHost(states)
+
+    assert handle(starting, 1 - shard, (0, "start", ("asst_1",))) == (0, "thread_1", None)
+    assert starting.evicted == ["thread_1"]
+    # the worker of the shard takes the assistant from the run record
+    assert handle(taking_over, shard, (1, "send", ("thread_1", "hello"))) == (1, "asst_1 replies to hello", None)
+    assert taking_over.resumed == [(None, "thread_1")]
+
+
+def test_a_handover_whose_state_is_not_written_fails(states, monkeypatch):
+    monkeypatch.setattr(states, "flush", lambda timeout=None: False)
+    shard = run_store.shard_of("thread_1", 2)
+
+    request_id, result, error = handle(FakeHost(states), 1 - shard, (0, "start", ("asst_1",)))
+    assert result is None and "not written" in error
+
+
+def test_sending_to_an_unknown_conversation_fails(states):
+    request_id, result, error = handle(FakeHost(states), 0, (0, "send", ("thread_9", "hello")))
+    assert result is None and error.startswith("KeyError")
+
+
+def test_the_router_keeps_no_assistants_and_needs_the_sqlite_store(monkeypatch):
+    monkeypatch.setenv("RUN_STORE", "memory")
+    with pytest.raises(Exception, match="RUN_STORE=sqlite"):
+        run_workers.ShardedConversations(2)
+
+    monkeypatch.setenv("RUN_STORE", "sqlite")
+    sharded = run_workers.ShardedConversations(2)
+    sent = []
+
+    async def request(shard, op, args):
+        sent.append((shard, op, args))
+    sharded.request = request
+    asyncio.run(sharded.send("thread_1", "hello"))
+    assert sent == [(run_store.shard_of("thread_1", 2), "send", ("thread_1", "hello"))]
+    assert not hasattr(sharded, "assistants")
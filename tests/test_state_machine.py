@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from transitions import MachineError
+
+from state_machine import StateTable
+
+states = {
+    'idle': [],
+    'busy': ['on_busy'],
+    'done': ['on_done'],
+}
+
+transitions = [
+    ('start', 'idle', 'busy', ['after_start']),
+    # the first transition added for a source and trigger wins
+    ('start', 'idle', 'done', []),
+    ('tick', 'busy', 'busy', ['after_tick']),
+    ('finish', 'busy', 'done', []),
+    ('reset', '*', 'idle', []),
+]
+
+table = StateTable(states, transitions, on_enter_all=['entered'])
+
+
+@table.bind
+class Model():
+    def __init__(self):
+        self.state = 'idle'
+        self.transition_tasks = []
+        self.calls = []
+
+    def entered(self, *args):
+        self.calls.append(('entered', self.state) + args)
+
+    async def on_busy(self, *args):
+        self.calls.append(('on_busy',) + args)
+
+    def on_done(self, *args):
+        self.calls.append(('on_done',) + args)
+
+    async def after_start(self, *args):
+        self.calls.append(('after_start',) + args)
+
+    def after_tick(self, *args):
+        self.calls.append(('after_tick',) + args)
+
+
+def test_on_enter_then_after_callbacks_with_the_trigger_arguments():
+    model = Model()
+    assert asyncio.run(model.start('hello')) is True
+    assert model.state == 'busy'
+    assert model.calls == [('on_busy', 'hello'), ('entered', 'busy', 'hello'), ('after_start', 'hello')]
+
+
+def test_reflexive_transition_runs_the_callbacks_again():
+    model = Model()
+
+    async def run():
+        await model.start()
+        model.calls.clear()
+        await model.tick(1)
+        await model.tick(2)
+    asyncio.run(run())
+
+    assert model.state == 'busy'
+    assert model.calls == [('on_busy', 1), ('entered', 'busy', 1), ('after_tick', 1),
+                           ('on_busy', 2), ('entered', 'busy', 2), ('after_tick', 2)]
+
+
+@pytest.mark.parametrize("triggers", [[], ['start'], ['start', 'finish']])
+def test_wildcard_source_applies_to_every_state(triggers):
+    model = Model()
+
+    async def run():
+        for trigger in triggers:
+            await getattr(model, trigger)()
+        await model.reset()
+    asyncio.run(run())
+
+    assert model.state == 'idle'
+
+
+def test_invalid_trigger_raises_machine_error_and_keeps_the_state():
+    model = Model()
+    with pytest.raises(MachineError):
+        asyncio.run(model.finish())
+    assert model.state == 'idle'
+    assert model.calls == []
+    assert model.transition_tasks == []
+
+
+def test_triggers_are_bound_once_per_trigger():
+    assert table.triggers == {'start', 'tick', 'finish', 'reset'}
+    assert table.table[('idle', 'start')][0] == 'busy'
+    assert all(hasattr(Model, trigger) for trigger in table.triggers)
+
+
+def test_a_transition_cancels_the_ones_in_progress_in_other_tasks():
+    model = Model()
+    release = asyncio.Event()
+
+    async def slow_after_start(*args):
+        await release.wait()
+        model.calls.append(('slow_after_start',))
+    model.after_start = slow_after_start
+
+    async def run():
+        first = asyncio.create_task(model.start())
+        await asyncio.sleep(0)
+        assert model.state == 'busy'
+        await model.finish()
+        return await first
+    assert asyncio.run(run()) is False
+
+    assert model.state == 'done'
+    assert ('slow_after_start',) not in model.calls
+    assert model.transition_tasks == []
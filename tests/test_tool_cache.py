@@ -0,0 +1,142 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from function_tools.tool_cache import ToolCache
+
+
+def test_hit_after_miss():
+    cache = ToolCache(ttls={"price": 60})
+    loads = []
+    assert cache.get_or_load("price", "MSFT", lambda: loads.append(1) or 10) == 10
+    assert cache.get_or_load("price", "MSFT", lambda: loads.append(1) or 20) == 10
+    assert len(loads) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_no_caching_without_a_ttl():
+    cache = ToolCache(ttls={"price": 60})
+    loads = []
+    for i in range(3):
+        cache.get_or_load("buy_or_sell", "MSFT", lambda: loads.append(1))
+    assert len(loads) == 3
+    assert cache.stats()["size"] == 0
+
+
+def test_expired_entries_are_loaded_again():
+    cache = ToolCache(ttls={"price": 60})
+    cache.get_or_load("price", "MSFT", lambda: 10)
+    cache.entries[("price", "MSFT")] = (0, 10)
+    assert cache.get_or_load("price", "MSFT", lambda: 11) == 11
+
+
+def test_least_recently_used_is_evicted():
+    cache = ToolCache(maxsize=2, ttls={"price": 60})
+    cache.get_or_load("price", "A", lambda: 1)
+    cache.get_or_load("price", "B", lambda: 2)
+    cache.get_or_load("price", "A", lambda: 1)
+    cache.get_or_load("price", "C", lambda: 3)
+    assert set(key for tool, key in cache.entries) == {"A", "C"}
+    assert cache.stats()["evictions"] == 1
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def slow_loader(value=10, error=None):
+    started = threading.Event()
+    finish = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        if error:
+            raise error
+        return value
+    return load, started, finish, calls
+
+
+def test_concurrent_misses_load_once():
+    cache = ToolCache(ttls={"price": 60})
+    load, started, finish, calls = slow_loader()
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(cache.get_or_load, "price", "MSFT", load)
+        started.wait(5)
+        followers = [pool.submit(cache.get_or_load, "price", "MSFT", load) for i in range(3)]
+        wait_until(lambda: cache.stats()["coalesced"] >= 3)
+        finish.set()
+        assert [future.result(5) for future in [leader] + followers] == [10] * 4
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 3
+
+
+def test_a_failed_load_fails_its_waiters_and_is_not_cached():
+    cache = ToolCache(ttls={"price": 60})
+    load, started, finish, calls = slow_loader(error=RuntimeError("down"))
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(cache.get_or_load, "price", "MSFT", load)
+        started.wait(5)
+        follower = pool.submit(cache.get_or_load, "price", "MSFT", load)
+        wait_until(lambda: cache.stats()["coalesced"] >= 1)
+        finish.set()
+        for future in [leader, follower]:
+            with pytest.raises(RuntimeError):
+                future.result(5)
+    assert cache.get_or_load("price", "MSFT", lambda: 12) == 12
+
+
+def test_batch_loads_only_the_missing_keys_in_one_call():
+    cache = ToolCache(ttls={"price": 60})
+    cache.get_or_load("price", "MSFT", lambda: 1)
+    batches = []
+
+    def load_many(keys):
+        batches.append(keys)
+        return {key: len(key) for key in keys}
+
+    values = cache.get_many_or_load("price", ["MSFT", "AAPL", "GOOG", "AAPL"], load_many)
+    assert values == {"MSFT": 1, "AAPL": 4, "GOOG": 4}
+    assert batches == [["AAPL", "GOOG"]]
+    # now cached for the single lookups
+    assert cache.get_or_load("price", "GOOG", lambda: 0) == 4
+
+
+def test_batch_leaves_out_keys_it_could_not_load():
+    cache = ToolCache(ttls={"price": 60})
+    values = cache.get_many_or_load("price", ["MSFT", "NOPE"], lambda keys: {"MSFT": 1})
+    assert values == {"MSFT": 1}
+    assert ("price", "NOPE") not in cache.entries
+    assert cache.inflight == {}
+
+
+def test_batch_without_a_ttl_passes_every_key_through():
+    cache = ToolCache()
+    batches = []
+    cache.get_many_or_load("price", ["MSFT", "AAPL"], lambda keys: batches.append(keys) or {})
+    cache.get_many_or_load("price", ["MSFT", "AAPL"], lambda keys: batches.append(keys) or {})
+    assert batches == [["MSFT", "AAPL"], ["MSFT", "AAPL"]]
+
+
+def test_batch_waits_for_a_key_already_being_loaded():
+    cache = ToolCache(ttls={"price": 60})
+    load, started, finish, calls = slow_loader(value=7)
+    batches = []
+    with ThreadPoolExecutor(2) as pool:
+        single = pool.submit(cache.get_or_load, "price", "MSFT", load)
+        started.wait(5)
+        batch = pool.submit(cache.get_many_or_load, "price", ["MSFT", "AAPL"],
+                            lambda keys: batches.append(keys) or {key: 1 for key in keys})
+        wait_until(lambda: cache.stats()["coalesced"] >= 1)
+        finish.set()
+        assert batch.result(5) == {"MSFT": 7, "AAPL": 1}
+        assert single.result(5) == 7
+    assert batches == [["AAPL"]]
+    assert len(calls) == 1
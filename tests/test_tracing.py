@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture(autouse=True)
+def tracing_enabled(monkeypatch):
+    monkeypatch.setattr(tracing, "enabled", True)
+    tracing.reset()
+    yield
+    tracing.reset()
+
+
+@tracing.traced("api.create_run")
+async def create_run(thread_id, assistant_id):
+    return thread_id
+
+
+@tracing.traced("api.submit_tool_outputs")
+def submit_tool_outputs(thread_id, run_id, tool_outputs=None, **options):
+    return run_id
+
+
+def test_ids_passed_by_position_are_recorded():
+    asyncio.run(create_run("thread_1", "asst_1"))
+    submit_tool_outputs("thread_1", "run_1", [])
+
+    assert [span.attributes for span in tracing.recent_spans] == [{"thread_id": "thread_1"},
+                                                                  {"thread_id": "thread_1", "run_id": "run_1"}]
+
+
+def test_ids_passed_by_keyword_are_recorded():
+    asyncio.run(create_run(assistant_id="asst_1", thread_id="thread_1"))
+    submit_tool_outputs("thread_1", run_id="run_1", timeout=5)
+
+    assert [span.attributes for span in tracing.recent_spans] == [{"thread_id": "thread_1"},
+                                                                  {"thread_id": "thread_1", "run_id": "run_1"}]
+
+
+def test_a_call_with_wrong_arguments_fails_with_its_own_error():
+    with pytest.raises(TypeError, match="submit_tool_outputs"):
+        submit_tool_outputs("thread_1")
+    assert tracing.histograms["api.submit_tool_outputs"].count == 1
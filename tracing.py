@@ -0,0 +1,181 @@
+import functools
+import importlib.util
+import inspect
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Monotonic-clock spans for the steps of a conversation turn, aggregated into histograms per span name
+# and kept (with their thread_id / run_id) in a bounded buffer of recent spans.
+# When tracing is disabled, span() returns a shared no-op context manager.
+enabled = os.environ.get("TRACING", "false").lower() == "true"
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf")]
+
+histograms = {}
+recent_spans = deque(maxlen=int(os.environ.get("TRACING_BUFFER", 10000)))
+
+# spans are also recorded as OpenTelemetry histograms when the SDK is installed and configured
+otel_meter = None
+if enabled and importlib.util.find_spec("opentelemetry") is not None:
+    from opentelemetry import metrics
+    otel_meter = metrics.get_meter("openai-assistants-api-integration")
+
+
+class Histogram():
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.otel = otel_meter.create_histogram(name, unit="s") if otel_meter else None
+
+    def observe(self, value, attributes):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        if self.otel:
+            self.otel.record(value, attributes)
+
+    # upper bound of the bucket holding the p-th percentile
+    def percentile(self, p):
+        if self.count == 0:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class Span():
+    __slots__ = ["name", "attributes", "start", "duration"]
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        record(self)
+        return False
+
+
+class NoopSpan():
+    def __enter__(self):
+        return self
+
+    def set(self, key, value):
+        pass
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name, **attributes):
+    if not enabled:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+# a duration measured elsewhere, e.g. a whole turn
+def observe(name, duration, **attributes):
+    if enabled:
+        span = Span(name, attributes)
+        span.duration = duration
+        record(span)
+
+
+# spans every call of the decorated function, with its thread_id / run_id arguments
+def traced(name):
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not enabled:
+                    return await func(*args, **kwargs)
+                with Span(name, ids(signature, args, kwargs)):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Span(name, ids(signature, args, kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# thread_id / run_id, whether passed by position or by keyword
+def ids(signature, args, kwargs):
+    try:
+        arguments = {**kwargs, **signature.bind(*args, **kwargs).arguments}
+    except TypeError:
+        arguments = kwargs  # the call itself fails, with its own error
+    return {key: arguments[key] for key in ("thread_id", "run_id") if key in arguments}
+
+
+def record(span):
+    histogram = histograms.get(span.name)
+    if histogram is None:
+        histogram = histograms[span.name] = Histogram(span.name)
+    histogram.observe(span.duration, span.attributes)
+    recent_spans.append(span)
+
+
+def reset():
+    histograms.clear()
+    recent_spans.clear()
+
+
+def summary():
+    return {name: {"count": h.count, "total": h.sum, "p50": h.percentile(50), "p99": h.percentile(99)}
+            for name, h in histograms.items()}
+
+
+# spans of one thread or run, oldest first, e.g. to see where the time of a single turn went
+def spans_for(thread_id=None, run_id=None):
+    return [s for s in recent_spans
+            if (thread_id is None or s.attributes.get("thread_id") == thread_id)
+            and (run_id is None or s.attributes.get("run_id") == run_id)]
+
+
+# histograms in the Prometheus text exposition format
+def export_prometheus():
+    lines = ["# TYPE conversation_span_seconds histogram"]
+    for name, h in histograms.items():
+        cumulative = 0
+        for bound, count in zip(BUCKETS, h.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else str(bound)
+            lines.append(f'conversation_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'conversation_span_seconds_sum{{span="{name}"}} {h.sum}')
+        lines.append(f'conversation_span_seconds_count{{span="{name}"}} {h.count}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+import openai_async_access
+
+load_dotenv()
+
+
+# THREAD_POOL_SIZE, when set
+def configured_size(default):
+    value = os.environ.get("THREAD_POOL_SIZE")
+    return int(value) if value else default
+
+
+# Threads created ahead of time, so that starting a conversation takes one instead of waiting for the
+# create. Threads are not tied to an assistant, so the pool serves every assistant. Taking a thread
+# refills the pool in the background; threads older than max_age are discarded rather than handed out
+# (they are left to the API's own thread expiry). With size 0, threads are created when needed: the
+# default, as a script starting one conversation would only leave pooled threads behind; long-lived apps
+# turn the pool on with enable().
+class WarmThreadPool():
+    def __init__(self, size=None, max_age=None):
+        self.size = configured_size(0) if size is None else size
+        self.max_age = max_age or float(os.environ.get("THREAD_POOL_MAX_AGE", 3600))
+        self.threads = deque()
+        self.filler = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.errors = 0
+
+    # pools `size` threads, unless THREAD_POOL_SIZE says otherwise
+    def enable(self, size=4):
+        self.size = configured_size(size)
+
+    # a pooled thread id, or None when the pool is empty (the caller then creates its thread)
+    def take(self):
+        now = time.monotonic()
+        thread_id = None
+        while self.threads:
+            created_at, pooled_id = self.threads.popleft()
+            if now - created_at <= self.max_age:
+                thread_id = pooled_id
+                break
+            self.expired += 1
+        if thread_id:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.refill()
+        return thread_id
+
+    # refills the pool in the background, on the running loop
+    def refill(self):
+        if self.size > 0 and (self.filler is None or self.filler.done()):
+            self.filler = asyncio.create_task(self.fill())
+
+    async def fill(self):
+        while (missing := self.size - len(self.threads)) > 0:
+            results = await asyncio.gather(*[openai_async_access.create_thread() for _ in range(missing)],
+                                           return_exceptions=True)
+            created = [thread for thread in results if not isinstance(thread, BaseException)]
+            self.errors += len(results) - len(created)
+            self.threads.extend((time.monotonic(), thread.id) for thread in created)
+            if not created:
+                return
+
+    # waits until the pool is full, e.g. at startup
+    async def warm_up(self):
+        self.refill()
+        if self.filler is not None:
+            await self.filler
+
+    async def close(self):
+        if self.filler is not None and not self.filler.done():
+            self.filler.cancel()
+            try:
+                await self.filler
+            except asyncio.CancelledError:
+                pass
+        self.filler = None
+
+    def stats(self):
+        return {"size": self.size, "available": len(self.threads), "hits": self.hits, "misses": self.misses,
+                "expired": self.expired, "errors": self.errors}